@@ -1,13 +1,25 @@
+import os
+import sys
 import csv
+import json
+import tempfile
 import argparse
 from collections import defaultdict, Counter
-from datetime import datetime
+from datetime import date, datetime, timedelta
 import re
+import regex
+import math
+from array import array
+import numpy as np
 import pandas as pd
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize
 import unicodedata
+from progreso import (
+    PASO_PROGRESO, añadir_argumento_progreso, configurar_progreso,
+    nuevo_progreso, informar_progreso, terminar_progreso,
+)
 
 try:
     nltk.data.find('corpora/stopwords')
@@ -46,12 +58,24 @@ PALABRAS_A_EXCLUIR = {
 }
 STOPWORDS_ES.update(PALABRAS_A_EXCLUIR)
 
-EMOJI_PATTERN = re.compile("[\U00010000-\U0010ffff]", flags=re.UNICODE)
+# Un emoji es un grupo de grafemas completo según UTS #51, no un carácter: teclas (1️⃣), banderas
+# (🇪🇸, 🏴 con etiquetas) y secuencias unidas con ZWJ (👨‍👩‍👧), cada elemento con su tono de piel
+# (👍🏽) o selector de presentación. ©, ® y ™ solo cuentan con el selector U+FE0F: sin él son texto.
+ELEMENTO_EMOJI = r"(?:[\p{Extended_Pictographic}&&\p{Emoji}--[©®™]]|[©®™](?=\uFE0F))\uFE0F?\p{Emoji_Modifier}?(?!\uFE0E)"
+EMOJI_PATTERN = regex.compile(
+    r"[#*0-9]\uFE0F?\u20E3"
+    r"|\p{Regional_Indicator}{2}"
+    r"|\U0001F3F4[\U000E0020-\U000E007E]+\U000E007F"
+    rf"|{ELEMENTO_EMOJI}(?:\u200D{ELEMENTO_EMOJI})*",
+    flags=regex.V1,
+)
+DIAS_SEMANA_NOMBRES = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
 URL_PATTERN = re.compile(r'https?://\S+|www\.\S+') # Expresión regular para detectar URLs
 PREGUNTA_PATTERN = re.compile(r'.*\?(\s*)$') # Expresión regular para detectar mensajes que terminan en '?'
 
-def cargar_mensajes_csv(path):
-    mensajes = []
+def leer_mensajes_csv(path):
+    """Lee el CSV preprocesado como un iterador de tuplas (fecha, nombre, mensaje), sin cargarlo entero."""
     with open(path, "r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
@@ -59,10 +83,21 @@ def cargar_mensajes_csv(path):
                 fecha = datetime.fromisoformat(row["fecha"])
                 nombre = row["nombre"]
                 mensaje = row["mensaje"]
-                mensajes.append((fecha, nombre, mensaje))
             except Exception as e:
                 continue
-    return mensajes
+            yield (fecha, nombre, mensaje)
+
+def contar_mensajes_autores_csv(path):
+    """Recorre el CSV preprocesado contando solo los mensajes de cada autor (memoria O(usuarios))."""
+    with open(path, "r", encoding="utf-8") as f:
+        return Counter(row["nombre"] for row in csv.DictReader(f) if row["nombre"] is not None)
+
+def leer_usuarios_csv(path):
+    """Recorre el CSV preprocesado recogiendo solo el conjunto de autores (memoria O(usuarios))."""
+    return set(contar_mensajes_autores_csv(path))
+
+def cargar_mensajes_csv(path):
+    return list(leer_mensajes_csv(path))
 
 def contar_emojis(texto):
     return len(EMOJI_PATTERN.findall(texto))
@@ -75,19 +110,543 @@ def es_pregunta(texto):
     """Comprueba si un mensaje termina en un signo de interrogación."""
     return bool(PREGUNTA_PATTERN.match(texto.strip()))
 
+MULTIMEDIA_OMITIDO = "<Multimedia omitido>"
+# Bytes iniciales UTF-8 que pueden empezar un emoji (U+2000-3FFF, el selector U+FE0F y los planos astrales);
+# los textos sin ninguno, como la mayoría de los mensajes con tildes, no necesitan pasar por EMOJI_PATTERN
+BYTES_SIN_EMOJI = bytes(b for b in range(256) if b not in (0xE2, 0xE3, 0xEF) and b < 0xF0)
+
+def extraer_emojis(texto):
+    """Devuelve los emojis de un texto no ASCII, cada grupo de grafemas (p. ej. 👨‍👩‍👧) como un único elemento."""
+    if not texto.encode("utf-8", "surrogatepass").translate(None, BYTES_SIN_EMOJI):
+        return ()
+    return EMOJI_PATTERN.findall(texto)
+
+# Elementos de un emoji que se muestran como texto salvo que les siga U+FE0F (❤, ☀, 1⃣...), para normalizar las variantes
+SIN_PRESENTACION_EMOJI = regex.compile(r"([^\p{Emoji_Presentation}\p{Emoji_Modifier}\u200D\u20E3\U000E0020-\U000E007F])(?!\p{Emoji_Modifier})", flags=regex.V1)
+EMOJIS_NORMALIZADOS = {}
+
+def normalizar_emoji(emoji):
+    """Forma totalmente cualificada de un emoji (❤ y ❤️ cuentan como el mismo), con caché por secuencia."""
+    normalizado = EMOJIS_NORMALIZADOS.get(emoji)
+    if normalizado is None:
+        normalizado = SIN_PRESENTACION_EMOJI.sub("\\1\uFE0F", emoji.replace("\uFE0F", ""))
+        EMOJIS_NORMALIZADOS[emoji] = normalizado
+    return normalizado
+
+def extraer_rasgos_mensaje(texto):
+    """
+    Calcula en una sola pasada los rasgos de un mensaje, con los mismos resultados que
+    len(split()), len(), contar_emojis, contar_enlaces, es_pregunta y la comparación con
+    "<Multimedia omitido>", pero sin las listas de coincidencias de findall.
+
+    Returns:
+        tuple: (num_palabras, longitud, emojis, num_enlaces, es_pregunta, es_multimedia), donde
+        emojis son las secuencias encontradas (su número es el de contar_emojis)
+    """
+    longitud = len(texto)
+    limpio = texto.strip()
+    if not limpio:
+        return 0, longitud, (), 0, False, False
+
+    if limpio.isascii():
+        emojis = ()
+        # Con un único espacio entre palabras basta con contar los espacios
+        if limpio.isprintable() and "  " not in limpio:
+            num_palabras = limpio.count(" ") + 1
+        else:
+            num_palabras = len(limpio.split())
+    else:
+        emojis = extraer_emojis(limpio)
+        num_palabras = len(limpio.split()) # Puede haber espacios Unicode (p. ej. el espacio fino de WhatsApp)
+
+    num_enlaces = 0
+    if "http" in limpio or "www." in limpio:
+        num_enlaces = sum(1 for _ in URL_PATTERN.finditer(limpio))
+
+    # Equivale a PREGUNTA_PATTERN: '.' no cruza saltos de línea, así que la '?' final debe estar en la primera línea
+    pregunta = limpio[-1] == "?" and "\n" not in limpio
+    return num_palabras, longitud, emojis, num_enlaces, pregunta, limpio == MULTIMEDIA_OMITIDO
+
+# --- Top-k acotado (Space-Saving) ---
+
+# Emojis distintos que se siguen por usuario y en todo el chat: la memoria no crece con el número de mensajes
+CAPACIDAD_EMOJIS_USUARIO = 64
+CAPACIDAD_EMOJIS_GLOBAL = 256
+NUM_TOP_EMOJIS_GLOBALES = 20
+
+def nuevo_top_k(capacidad):
+    """
+    Resumen Space-Saving de los elementos más frecuentes de un flujo con a lo sumo `capacidad`
+    contadores. Mientras haya sitio los conteos son exactos; después, un elemento nuevo reemplaza
+    al de menor conteo y hereda ese conteo, así que cualquier elemento con más de total/capacidad
+    apariciones está garantizado y su conteo se sobreestima como mucho en el mínimo reemplazado.
+    """
+    return {"capacidad": capacidad, "conteos": {}}
+
+def añadir_top_k(top, elemento, cantidad=1):
+    conteos = top["conteos"]
+    if elemento in conteos:
+        conteos[elemento] += cantidad
+    elif len(conteos) < top["capacidad"]:
+        conteos[elemento] = cantidad
+    else:
+        minimo = min(conteos, key=conteos.get)
+        conteos[elemento] = conteos.pop(minimo) + cantidad
+
+def mas_frecuentes_top_k(top, num_top=10):
+    """Los `num_top` elementos con mayor conteo, como Counter.most_common."""
+    return Counter(top["conteos"]).most_common(num_top)
+
 # --- Funciones para análisis avanzado ---
 
+def tokenizar_texto(msg):
+    """Tokeniza un mensaje y devuelve todas sus palabras en minúsculas, sin signos ni números."""
+    return [word for word in word_tokenize(msg.lower()) if word.isalpha()]
+
+def tokenizar_palabras(msg):
+    """Tokeniza un mensaje y devuelve sus palabras en minúsculas, sin stopwords ni signos."""
+    return [word for word in tokenizar_texto(msg) if word not in STOPWORDS_ES]
+
 def obtener_palabras_frecuentes(mensajes_usuario, num_top=10):
     """Obtiene las palabras más frecuentes de un usuario, excluyendo stopwords y palabras específicas."""
     all_words = []
     for msg in mensajes_usuario:
-        words = word_tokenize(msg.lower())
-        filtered_words = [word for word in words if word.isalpha() and word not in STOPWORDS_ES]
-        all_words.extend(filtered_words)
+        all_words.extend(tokenizar_palabras(msg))
     
     return Counter(all_words).most_common(num_top)
 
+# Tokens acumulados en búfer antes de compactarlos en la matriz dispersa incremental
+TOKENS_POR_COMPACTACION = 1_000_000
+# Bytes por celda de la matriz en el peor momento de una compactación (claves, conteos y primera
+# aparición, más los temporales de np.unique y np.bincount), para traducir --max_memoria a celdas
+BYTES_POR_CELDA = 64
+# Tramos en disco que se fusionan de una vez; al llegar a este número se combinan en uno solo,
+# para no mantener abiertos más archivos de los que permite el sistema
+MAX_TRAMOS_FUSION = 32
+# Palabras más frecuentes de cada usuario que se guardan en los agregados fusionables (y las que
+# conserva una matriz volcada a disco, por conteo y por TF-IDF)
+MAX_PALABRAS_AGREGADOS = 1000
+
+def nueva_matriz_incremental(max_memoria=None):
+    """
+    Estado de una matriz dispersa usuario×vocabulario que se construye token a token.
+    Cada celda se codifica como clave entera (usuario << 32 | término); los tokens se
+    acumulan en un búfer que se compacta periódicamente con np.unique, de modo que la
+    memoria depende de las celdas distintas y no del número de tokens.
+
+    Con `max_memoria` (bytes), cuando las celdas compactadas llegan a la mitad del presupuesto
+    se vuelcan a disco como un tramo ordenado por clave (ver volcar_matriz), y finalizar_matriz
+    los combina con una fusión externa de k vías. El vocabulario sigue en memoria.
+    """
+    max_celdas = max(2, max_memoria // BYTES_POR_CELDA) if max_memoria else None
+    return {
+        "vocabulario": {},
+        "buffer_claves": array('q'),
+        "buffer_posiciones": array('q'),
+        "num_tokens": 0,
+        "claves": np.zeros(0, dtype=np.int64),
+        "conteos": np.zeros(0, dtype=np.int64),
+        "primera_aparicion": np.zeros(0, dtype=np.int64),
+        "max_celdas": max_celdas,
+        # El búfer también cuenta para el presupuesto: celdas + tokens no superan 3/4 de max_celdas
+        "tokens_por_compactacion": min(TOKENS_POR_COMPACTACION, max_celdas // 4 or 1) if max_celdas else TOKENS_POR_COMPACTACION,
+        "directorio_volcados": None,
+        "volcados": [],
+        "num_tramos": 0,
+    }
+
+def añadir_tokens(matriz, uid, palabras):
+    """Añade las palabras de un mensaje del usuario `uid` a la matriz incremental."""
+    vocabulario = matriz["vocabulario"]
+    base = uid << 32
+    for palabra in palabras:
+        matriz["buffer_claves"].append(base | vocabulario.setdefault(palabra, len(vocabulario)))
+        matriz["buffer_posiciones"].append(matriz["num_tokens"])
+        matriz["num_tokens"] += 1
+    if len(matriz["buffer_claves"]) >= matriz["tokens_por_compactacion"]:
+        compactar_matriz(matriz)
+
+def sumar_celdas(claves, conteos, posiciones):
+    """Agrupa las celdas repetidas sumando sus conteos y conservando su primera aparición; el resultado queda ordenado por clave."""
+    claves_unicas, inversa = np.unique(claves, return_inverse=True)
+    primera_aparicion = np.full(len(claves_unicas), np.iinfo(np.int64).max)
+    np.minimum.at(primera_aparicion, inversa, posiciones)
+    return claves_unicas, np.bincount(inversa, weights=conteos, minlength=len(claves_unicas)).astype(np.int64), primera_aparicion
+
+def compactar_matriz(matriz):
+    """Funde el búfer de tokens con las celdas ya compactadas (suma conteos, conserva la primera aparición)."""
+    if not matriz["buffer_claves"]:
+        return
+    claves = np.concatenate([matriz["claves"], np.frombuffer(matriz["buffer_claves"], dtype=np.int64)])
+    conteos = np.concatenate([matriz["conteos"], np.ones(len(matriz["buffer_claves"]), dtype=np.int64)])
+    posiciones = np.concatenate([matriz["primera_aparicion"], np.frombuffer(matriz["buffer_posiciones"], dtype=np.int64)])
+
+    matriz["claves"], matriz["conteos"], matriz["primera_aparicion"] = sumar_celdas(claves, conteos, posiciones)
+    matriz["buffer_claves"] = array('q')
+    matriz["buffer_posiciones"] = array('q')
+    if matriz["max_celdas"] and len(matriz["claves"]) >= matriz["max_celdas"] // 2:
+        volcar_matriz(matriz)
+
+def escribir_tramo(matriz, bloques):
+    """Escribe en un archivo temporal las celdas de `bloques` ((claves, conteos, primera_aparicion) en orden de clave)."""
+    if matriz["directorio_volcados"] is None:
+        matriz["directorio_volcados"] = tempfile.mkdtemp(prefix="analisis_palabras_")
+    ruta = os.path.join(matriz["directorio_volcados"], f"tramo{matriz['num_tramos']}.bin")
+    matriz["num_tramos"] += 1
+    with open(ruta, "wb") as f:
+        for claves, conteos, primera_aparicion in bloques:
+            np.column_stack((claves, conteos, primera_aparicion)).tofile(f)
+    return ruta
 
+def volcar_matriz(matriz):
+    """
+    Vuelca a disco las celdas compactadas (ya ordenadas por clave) y las libera de la memoria.
+    Al acumular MAX_TRAMOS_FUSION tramos se fusionan en uno solo.
+    """
+    if not len(matriz["claves"]):
+        return
+    matriz["volcados"].append(escribir_tramo(matriz, [(matriz["claves"], matriz["conteos"], matriz["primera_aparicion"])]))
+    matriz["claves"] = np.zeros(0, dtype=np.int64)
+    matriz["conteos"] = np.zeros(0, dtype=np.int64)
+    matriz["primera_aparicion"] = np.zeros(0, dtype=np.int64)
+
+    if len(matriz["volcados"]) >= MAX_TRAMOS_FUSION:
+        fusionado = escribir_tramo(matriz, fusionar_volcados(matriz["volcados"], matriz["max_celdas"] // 2))
+        borrar_volcados(matriz, conservar_directorio=True)
+        matriz["volcados"] = [fusionado]
+
+def borrar_volcados(matriz, conservar_directorio=False):
+    for ruta in matriz["volcados"]:
+        os.remove(ruta)
+    matriz["volcados"] = []
+    if not conservar_directorio and matriz["directorio_volcados"] is not None:
+        os.rmdir(matriz["directorio_volcados"])
+        matriz["directorio_volcados"] = None
+
+def fusionar_volcados(rutas, celdas_por_bloque):
+    """
+    Fusión externa de k vías de los tramos volcados. Genera bloques (claves, conteos,
+    primera_aparicion) en orden de clave, cada celda sumada entre todos los tramos y entera en
+    un único bloque. De cada tramo (leído con mmap) se toman a lo sumo celdas_por_bloque // k
+    celdas por bloque, así que la memoria no depende del tamaño de los tramos.
+    """
+    tramos = [np.memmap(ruta, dtype=np.int64, mode="r").reshape(-1, 3) for ruta in rutas]
+    posiciones = [0] * len(tramos)
+    paso = max(1, celdas_por_bloque // len(tramos))
+    while True:
+        activos = [i for i, tramo in enumerate(tramos) if posiciones[i] < len(tramo)]
+        if not activos:
+            return
+        # Se corta en la menor de las últimas claves de la ventana de cada tramo: ninguna celda
+        # con clave <= corte queda fuera de la ventana de su tramo, así que sale completa en este bloque
+        corte = min(tramos[i][min(posiciones[i] + paso, len(tramos[i])) - 1, 0] for i in activos)
+        partes = []
+        for i in activos:
+            ventana = tramos[i][posiciones[i]:posiciones[i] + paso]
+            fin = int(np.searchsorted(ventana[:, 0], corte, side="right"))
+            partes.append(np.array(ventana[:fin]))
+            posiciones[i] += fin
+        bloque = np.concatenate(partes)
+        yield sumar_celdas(bloque[:, 0], bloque[:, 1], bloque[:, 2])
+
+def posicion_en_fila(filas, puntuaciones, primera_aparicion):
+    """Posición de cada celda dentro de su fila al ordenarla por puntuación descendente (y primera aparición)."""
+    orden = np.lexsort((primera_aparicion, -puntuaciones, filas))
+    filas_ordenadas = filas[orden]
+    posiciones = np.empty(len(orden), dtype=np.int64)
+    posiciones[orden] = np.arange(len(orden)) - np.searchsorted(filas_ordenadas, filas_ordenadas, side="left")
+    return posiciones
+
+def finalizar_matriz_volcada(matriz, usuarios, num_top=MAX_PALABRAS_AGREGADOS):
+    """
+    Finaliza una matriz con tramos en disco sin cargarla entera. Una primera fusión calcula la
+    frecuencia documental de cada término y el total de palabras de cada usuario; una segunda
+    conserva de cada usuario sus `num_top` términos más frecuentes y sus `num_top` de mayor
+    TF-IDF. Con esos totales guardados en la matriz, calcular_tfidf y top_terminos_por_usuario
+    dan los mismos resultados que con la matriz completa para tops de hasta `num_top` términos.
+    """
+    volcar_matriz(matriz)
+    num_terminos = len(matriz["vocabulario"])
+    celdas_por_bloque = matriz["max_celdas"] // 2
+    try:
+        frecuencia_documental = np.zeros(num_terminos, dtype=np.int64)
+        total_por_usuario = np.zeros(len(usuarios))
+        for claves, conteos, _ in fusionar_volcados(matriz["volcados"], celdas_por_bloque):
+            frecuencia_documental += np.bincount(claves & 0xFFFFFFFF, minlength=num_terminos)
+            total_por_usuario += np.bincount(claves >> 32, weights=conteos, minlength=len(usuarios))
+        idf = np.log(len(usuarios) / np.maximum(frecuencia_documental, 1))
+
+        # Cada celda es completa en su bloque, así que basta con ir fusionando las conservadas con cada bloque
+        claves = conteos = primera_aparicion = np.zeros(0, dtype=np.int64)
+        for bloque in fusionar_volcados(matriz["volcados"], celdas_por_bloque):
+            claves, conteos, primera_aparicion = (np.concatenate([a, b]) for a, b in zip((claves, conteos, primera_aparicion), bloque))
+            filas = claves >> 32
+            tfidf = conteos / total_por_usuario[filas] * idf[claves & 0xFFFFFFFF]
+            seleccion = ((posicion_en_fila(filas, conteos, primera_aparicion) < num_top)
+                         | (posicion_en_fila(filas, tfidf, primera_aparicion) < num_top))
+            claves, conteos, primera_aparicion = claves[seleccion], conteos[seleccion], primera_aparicion[seleccion]
+    finally:
+        borrar_volcados(matriz)
+
+    return {
+        "usuarios": list(usuarios),
+        "terminos": list(matriz["vocabulario"]),
+        "filas": claves >> 32,
+        "columnas": claves & 0xFFFFFFFF,
+        "conteos": conteos,
+        "primera_aparicion": primera_aparicion,
+        "frecuencia_documental": frecuencia_documental,
+        "total_por_usuario": total_por_usuario,
+    }
+
+def finalizar_matriz(matriz, usuarios):
+    """Devuelve la matriz incremental en el formato COO usado por calcular_tfidf y top_terminos_por_usuario."""
+    compactar_matriz(matriz)
+    if matriz["volcados"]:
+        return finalizar_matriz_volcada(matriz, list(usuarios))
+    return {
+        "usuarios": list(usuarios),
+        "terminos": list(matriz["vocabulario"]),
+        "filas": matriz["claves"] >> 32,
+        "columnas": matriz["claves"] & 0xFFFFFFFF,
+        "conteos": matriz["conteos"],
+        "primera_aparicion": matriz["primera_aparicion"], # Para desempatar igual que Counter.most_common
+    }
+
+def construir_matriz_usuario_termino(mensajes_por_usuario):
+    """
+    Construye en una sola pasada sobre los tokens una matriz dispersa usuario×vocabulario
+    en formato COO (filas, columnas, conteos) con identificadores enteros de término.
+    """
+    matriz = nueva_matriz_incremental()
+    for uid, nombre in enumerate(mensajes_por_usuario):
+        for msg in mensajes_por_usuario[nombre]:
+            añadir_tokens(matriz, uid, tokenizar_palabras(msg))
+    return finalizar_matriz(matriz, mensajes_por_usuario)
+
+def matriz_desde_conteos(conteos_por_usuario):
+    """
+    Construye la misma matriz usuario×término a partir de conteos ya agregados
+    ({usuario: {palabra: conteo}}), p. ej. al fusionar varios chats.
+    """
+    usuarios = list(conteos_por_usuario)
+    vocabulario = {}
+    filas = array('i')
+    columnas = array('i')
+    conteos = array('q')
+    for uid, nombre in enumerate(usuarios):
+        for palabra, conteo in conteos_por_usuario[nombre].items():
+            filas.append(uid)
+            columnas.append(vocabulario.setdefault(palabra, len(vocabulario)))
+            conteos.append(conteo)
+
+    return {
+        "usuarios": usuarios,
+        "terminos": list(vocabulario),
+        "filas": np.frombuffer(filas, dtype=np.int32).astype(np.int64),
+        "columnas": np.frombuffer(columnas, dtype=np.int32).astype(np.int64),
+        "conteos": np.frombuffer(conteos, dtype=np.int64),
+        "primera_aparicion": np.arange(len(filas)),
+    }
+
+def calcular_tfidf(matriz):
+    """Calcula el TF-IDF de cada celda no nula de la matriz usuario×término con operaciones vectorizadas."""
+    num_usuarios = len(matriz["usuarios"])
+    if num_usuarios == 0:
+        return np.zeros(0)
+    # Una matriz volcada a disco solo conserva parte de las celdas, pero trae los totales de la matriz completa
+    frecuencia_documental = matriz.get("frecuencia_documental")
+    if frecuencia_documental is None:
+        frecuencia_documental = np.bincount(matriz["columnas"], minlength=len(matriz["terminos"]))
+    idf = np.log(num_usuarios / np.maximum(frecuencia_documental, 1))
+    total_por_usuario = matriz.get("total_por_usuario")
+    if total_por_usuario is None:
+        total_por_usuario = np.bincount(matriz["filas"], weights=matriz["conteos"], minlength=num_usuarios)
+    tf = matriz["conteos"] / total_por_usuario[matriz["filas"]]
+    return tf * idf[matriz["columnas"]]
+
+def top_terminos_por_usuario(matriz, puntuaciones, num_top=10):
+    """
+    Devuelve, para cada usuario, sus `num_top` términos con mayor puntuación como lista de
+    tuplas (palabra, conteo). Los términos con puntuación nula se descartan.
+    """
+    filas = matriz["filas"]
+    orden = np.lexsort((matriz["primera_aparicion"], -puntuaciones, filas))
+    filas_ordenadas = filas[orden]
+    posicion_en_fila = np.arange(len(orden)) - np.searchsorted(filas_ordenadas, filas_ordenadas, side="left")
+    seleccion = orden[posicion_en_fila < num_top]
+
+    resultado = {nombre: [] for nombre in matriz["usuarios"]}
+    for i in seleccion:
+        if puntuaciones[i] > 0:
+            nombre = matriz["usuarios"][filas[i]]
+            resultado[nombre].append((matriz["terminos"][matriz["columnas"][i]], int(matriz["conteos"][i])))
+    return resultado
+
+# --- Frases más usadas (Count-Min sketch) ---
+
+# Filas del sketch: la probabilidad de que un conteo supere la cota de error es e^-filas (~2 % con 4)
+FILAS_SKETCH_FRASES = 4
+MEMORIA_FRASES_MB = 4
+# N-gramas acumulados antes de sumarlos al sketch con operaciones vectorizadas
+FRASES_POR_LOTE = 200_000
+# Candidatas a frase más usada que se siguen por usuario y en todo el chat
+CANDIDATAS_FRASES_USUARIO = 32
+CANDIDATAS_FRASES_GLOBAL = 64
+NUM_TOP_FRASES_GLOBALES = 20
+MASCARA_64 = (1 << 64) - 1
+
+def nuevo_sketch_frases(memoria=MEMORIA_FRASES_MB * 2**20):
+    """
+    Estado del conteo aproximado de bigramas y trigramas: un Count-Min sketch de
+    FILAS_SKETCH_FRASES × ancho contadores que ocupa `memoria` bytes, sea cual sea el número de
+    frases distintas, más un pequeño conjunto de candidatas (las de mayor conteo estimado) por
+    usuario y global. El mismo sketch guarda las claves (usuario, frase) y (todos, frase).
+    """
+    ancho = max(1, memoria // (8 * FILAS_SKETCH_FRASES))
+    return {
+        "sketch": np.zeros((FILAS_SKETCH_FRASES, ancho), dtype=np.int64),
+        "num_frases": 0, # Total sumado al sketch, para la cota de error
+        # Tokens de los mensajes del lote, cada mensaje seguido de un 0: id + 1 del término, en negativo si es stopword
+        "buffer_terminos": array('q'),
+        "buffer_usuarios": array('q'),
+        "buffer_longitudes": array('q'),
+        "candidatas": defaultdict(dict), # {usuario (0 = todos): {(a, b, c): conteo estimado}}
+    }
+
+def añadir_frases(frases, vocabulario, uid, tokens):
+    """
+    Añade al lote los tokens de un mensaje (de tokenizar_texto, con stopwords) para contar sus
+    bigramas y trigramas. Una frase no puede empezar ni acabar en stopword, pero sí contenerla en
+    medio ("fin de curso"). Los términos se identifican con los ids del vocabulario de la matriz de palabras.
+    """
+    if len(tokens) < 2:
+        return
+    frases["buffer_terminos"].extend([-vocabulario.setdefault(token, len(vocabulario)) - 1 if token in STOPWORDS_ES
+                                      else vocabulario.setdefault(token, len(vocabulario)) + 1 for token in tokens])
+    frases["buffer_terminos"].append(0)
+    frases["buffer_usuarios"].append(uid + 1)
+    frases["buffer_longitudes"].append(len(tokens) + 1)
+    if len(frases["buffer_terminos"]) >= FRASES_POR_LOTE:
+        volcar_lote_frases(frases)
+
+def mezclar_hash(x):
+    """Mezclador splitmix64 vectorizado sobre enteros sin signo de 64 bits."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def columnas_sketch(usuarios, primeros, segundos, terceros, ancho):
+    """Columna de cada clave en cada fila del sketch (doble hashing sobre un hash de 64 bits), y el propio hash."""
+    h = mezclar_hash(usuarios.astype(np.uint64))
+    for ids in (primeros, segundos, terceros):
+        h = mezclar_hash(h ^ ids.astype(np.uint64))
+    h1, h2 = h & np.uint64(0xFFFFFFFF), (h >> np.uint64(32)) | np.uint64(1)
+    return [((h1 + np.uint64(fila) * h2) % np.uint64(ancho)).astype(np.int64) for fila in range(FILAS_SKETCH_FRASES)], h
+
+def estimar_frases(frases, columnas):
+    """Conteo estimado (mínimo entre filas, nunca por debajo del real) de las claves de `columnas`."""
+    sketch = frases["sketch"]
+    return np.min([sketch[fila][columnas[fila]] for fila in range(FILAS_SKETCH_FRASES)], axis=0)
+
+def ngramas_lote(frases):
+    """Bigramas y trigramas válidos del lote como arrays (usuario, a, b, c), con c = 0 en los bigramas."""
+    terminos = np.frombuffer(frases["buffer_terminos"], dtype=np.int64)
+    usuarios = np.repeat(np.frombuffer(frases["buffer_usuarios"], dtype=np.int64),
+                         np.frombuffer(frases["buffer_longitudes"], dtype=np.int64))
+    # Los separadores (0) cortan las frases entre mensajes; las stopwords (negativas) solo pueden ir en medio
+    a, b, c = terminos[:-2], terminos[1:-1], terminos[2:]
+    bigramas = np.flatnonzero((terminos[:-1] > 0) & (terminos[1:] > 0))
+    trigramas = np.flatnonzero((a > 0) & (b != 0) & (c > 0))
+    return (np.concatenate([usuarios[bigramas], usuarios[trigramas]]),
+            np.concatenate([terminos[bigramas], a[trigramas]]),
+            np.concatenate([terminos[bigramas + 1], np.abs(b[trigramas])]),
+            np.concatenate([np.zeros(len(bigramas), dtype=np.int64), c[trigramas]]))
+
+def volcar_lote_frases(frases):
+    """Suma al sketch los n-gramas del lote (por usuario y globales) y actualiza las candidatas."""
+    if not frases["buffer_terminos"]:
+        return
+    usuarios, primeros, segundos, terceros = ngramas_lote(frases)
+    frases["buffer_terminos"] = array('q')
+    frases["buffer_usuarios"] = array('q')
+    frases["buffer_longitudes"] = array('q')
+    if not len(usuarios):
+        return
+    # Cada n-grama cuenta para su autor y para el total del chat (usuario 0)
+    usuarios = np.concatenate([usuarios, np.zeros(len(usuarios), dtype=np.int64)])
+    primeros, segundos, terceros = (np.tile(ids, 2) for ids in (primeros, segundos, terceros))
+    sketch = frases["sketch"]
+    columnas, claves = columnas_sketch(usuarios, primeros, segundos, terceros, sketch.shape[1])
+    for fila in range(FILAS_SKETCH_FRASES):
+        sketch[fila] += np.bincount(columnas[fila], minlength=sketch.shape[1])
+    frases["num_frases"] += len(usuarios)
+
+    # Solo pueden entrar en las candidatas de un usuario las claves del lote que superan su
+    # mínima candidata actual (con las candidatas llenas), y de ellas las de mayor estimación
+    candidatas = frases["candidatas"]
+    # Las candidatas pueden ser de usuarios de lotes anteriores con un id mayor que los de este lote
+    umbrales = np.zeros(max(int(usuarios.max()), max(candidatas, default=0)) + 1, dtype=np.int64)
+    for usuario, actuales in candidatas.items():
+        if len(actuales) >= (CANDIDATAS_FRASES_GLOBAL if usuario == 0 else CANDIDATAS_FRASES_USUARIO):
+            umbrales[usuario] = min(actuales.values())
+    _, unicas = np.unique(claves, return_index=True)
+    estimaciones = estimar_frases(frases, [c[unicas] for c in columnas])
+    superan = estimaciones > umbrales[usuarios[unicas]]
+    unicas, estimaciones = unicas[superan], estimaciones[superan]
+    entran = posicion_en_fila(usuarios[unicas], estimaciones, unicas) < CANDIDATAS_FRASES_GLOBAL
+    for i, estimacion in zip(unicas[entran], estimaciones[entran]):
+        candidatas[int(usuarios[i])][(int(primeros[i]), int(segundos[i]), int(terceros[i]))] = int(estimacion)
+    for usuario, actuales in candidatas.items():
+        capacidad = CANDIDATAS_FRASES_GLOBAL if usuario == 0 else CANDIDATAS_FRASES_USUARIO
+        if len(actuales) > capacidad:
+            candidatas[usuario] = dict(sorted(actuales.items(), key=lambda x: -x[1])[:capacidad])
+
+def resultados_frases(frases, terminos, usuarios):
+    """
+    Frases más usadas de cada usuario y globales, con su conteo estimado final y la cota de
+    error: cada conteo puede sobrestimar el real como mucho en e/ancho × frases sumadas (con
+    probabilidad 1 - e^-filas), y nunca lo subestima.
+
+    Returns:
+        tuple: ({usuario: [(frase, conteo)]} con todas sus candidatas, [(frase, conteo)] globales, cota de error)
+    """
+    volcar_lote_frases(frases)
+    sketch = frases["sketch"]
+    resultado = {}
+    for usuario, actuales in frases["candidatas"].items():
+        if not actuales:
+            continue
+        claves = np.array(list(actuales), dtype=np.int64).reshape(-1, 3)
+        columnas, _ = columnas_sketch(np.full(len(claves), usuario), claves[:, 0], claves[:, 1], claves[:, 2], sketch.shape[1])
+        estimaciones = estimar_frases(frases, columnas)
+        orden = sorted(range(len(claves)), key=lambda i: -estimaciones[i])
+        resultado[usuario] = [(" ".join(terminos[t - 1] for t in claves[i] if t), int(estimaciones[i])) for i in orden]
+    por_usuario = {nombre: resultado.get(uid + 1, []) for uid, nombre in enumerate(usuarios)}
+    error = math.ceil(math.e / sketch.shape[1] * frases["num_frases"])
+    return por_usuario, resultado.get(0, [])[:NUM_TOP_FRASES_GLOBALES], error
+
+
+
+def normalizar_texto(texto):
+    """Pasa a minúsculas y quita tildes, para comparar nombres y mensajes."""
+    return ''.join(c for c in unicodedata.normalize('NFD', texto.lower()) if unicodedata.category(c) != 'Mn')
+
+def preparar_patrones_menciones(todos_los_usuarios_set):
+    """Precompila, una sola vez, la expresión regular de cada nombre de usuario normalizado."""
+    return [
+        (re.compile(r'\b' + re.escape(normalizar_texto(u)) + r'\b'), u)
+        for u in todos_los_usuarios_set if len(u) > 2
+    ]
+
+def detectar_menciones(msg, patrones_menciones):
+    """Devuelve los usuarios mencionados en un mensaje (como mucho una vez cada uno)."""
+    return buscar_menciones(normalizar_texto(msg), patrones_menciones)
+
+def buscar_menciones(msg_normalizado, patrones_menciones):
+    """Como detectar_menciones, para un mensaje ya pasado por normalizar_texto."""
+    return [nombre_original for patron, nombre_original in patrones_menciones if patron.search(msg_normalizado)]
 
 def analizar_menciones(mensajes_usuario, todos_los_usuarios_set):
     """
@@ -95,90 +654,346 @@ def analizar_menciones(mensajes_usuario, todos_los_usuarios_set):
     ignorando mayúsculas y tildes.
     """
     menciones_contador = Counter()
+    patrones_menciones = preparar_patrones_menciones(todos_los_usuarios_set)
+    for msg in mensajes_usuario:
+        menciones_contador.update(detectar_menciones(msg, patrones_menciones))
+    return menciones_contador
 
-    # Quitar tildes y pasar a minúsculas para todos los nombres de usuario
-    usuarios_normalizados = {
-        ''.join(c for c in unicodedata.normalize('NFD', u.lower()) if unicodedata.category(c) != 'Mn'): u
-        for u in todos_los_usuarios_set if len(u) > 2
+
+
+# --- Sesiones de conversación ---
+
+# Minutos sin mensajes a partir de los cuales empieza una conversación nueva
+UMBRAL_SESION_MINUTOS = 60
+# Límites (en minutos) de los intervalos del histograma de duración de las conversaciones
+LIMITES_DURACION_SESION = [1, 5, 15, 30, 60, 120, 240]
+
+def etiquetas_duracion_sesion():
+    """Etiquetas de los intervalos de LIMITES_DURACION_SESION: "<1 min", "1-5 min", ..., "240+ min"."""
+    etiquetas = [f"<{LIMITES_DURACION_SESION[0]} min"]
+    etiquetas += [f"{a}-{b} min" for a, b in zip(LIMITES_DURACION_SESION, LIMITES_DURACION_SESION[1:])]
+    etiquetas.append(f"{LIMITES_DURACION_SESION[-1]}+ min")
+    return etiquetas
+
+def nuevas_sesiones(umbral_minutos=UMBRAL_SESION_MINUTOS):
+    """Estado de la segmentación en conversaciones: solo la conversación en curso y los histogramas."""
+    return {
+        "umbral_minutos": umbral_minutos,
+        "umbral": timedelta(minutes=umbral_minutos),
+        "actual": None,
+        "num_sesiones": 0,
+        "duracion": [0] * (len(LIMITES_DURACION_SESION) + 1),
+        "participantes": Counter(),
+        "mensajes": Counter(),
     }
 
-    for msg in mensajes_usuario:
-        # Normalizar el mensaje (sin tildes y en minúsculas)
-        msg_normalizado = ''.join(
-            c for c in unicodedata.normalize('NFD', msg.lower()) if unicodedata.category(c) != 'Mn'
-        )
+def cerrar_sesion(sesiones, stats_usuarios):
+    """Cierra la conversación en curso y la suma a los histogramas y a los conteos por usuario."""
+    actual = sesiones["actual"]
+    if actual is None:
+        return
+    minutos = (actual["ultimo"] - actual["inicio"]).total_seconds() / 60
+    intervalo = sum(minutos >= limite for limite in LIMITES_DURACION_SESION)
+    sesiones["num_sesiones"] += 1
+    sesiones["duracion"][intervalo] += 1
+    sesiones["participantes"][len(actual["participantes"])] += 1
+    sesiones["mensajes"][actual["num_mensajes"]] += 1
+    stats_usuarios[actual["ultimo_autor"]]["sesiones_cerradas"] += 1
+    for nombre in actual["participantes"]:
+        stats_usuarios[nombre]["sesiones_participadas"] += 1
+    sesiones["actual"] = None
 
-        for nombre_normalizado, nombre_original in usuarios_normalizados.items():
-            if re.search(r'\b' + re.escape(nombre_normalizado) + r'\b', msg_normalizado):
-                menciones_contador[nombre_original] += 1
+def actualizar_sesiones(sesiones, stats_usuarios, fecha, nombre):
+    """
+    Asigna un mensaje a una conversación. Los mensajes llegan en orden cronológico, así que
+    basta comparar con el último: si el hueco supera el umbral, la conversación anterior se cierra.
+    """
+    actual = sesiones["actual"]
+    if actual is not None and fecha - actual["ultimo"] > sesiones["umbral"]:
+        cerrar_sesion(sesiones, stats_usuarios)
+        actual = None
+    if actual is None:
+        actual = sesiones["actual"] = {"inicio": fecha, "ultimo": fecha, "ultimo_autor": nombre,
+                                       "participantes": set(), "num_mensajes": 0}
+        stats_usuarios[nombre]["sesiones_iniciadas"] += 1
+    actual["ultimo"] = max(actual["ultimo"], fecha)
+    actual["ultimo_autor"] = nombre
+    actual["participantes"].add(nombre)
+    actual["num_mensajes"] += 1
 
-    return menciones_contador
+def iterar_dia_y_hora(mensajes_por_dia_y_hora):
+    """Recorre en orden los conteos por hora absoluta y usuario como (fecha ISO, hora, usuario, total)."""
+    fechas = {}
+    for (hora_absoluta, usuario), total in sorted(mensajes_por_dia_y_hora.items()):
+        dia, hora = divmod(hora_absoluta, 24)
+        if dia not in fechas:
+            fechas[dia] = date.fromordinal(dia).isoformat()
+        yield fechas[dia], hora, usuario, total
 
+def filas_dia_y_hora(mensajes_por_dia_y_hora):
+    """Cubo de mensajes por día, hora y usuario en filas (fecha, hora, usuario, num_mensajes) para CSV y gráficas."""
+    return [{"fecha": fecha, "hora": hora, "usuario": usuario, "num_mensajes": total}
+            for fecha, hora, usuario, total in iterar_dia_y_hora(mensajes_por_dia_y_hora)]
 
+def filas_sesiones(sesiones):
+    """Histogramas de las conversaciones en formato largo (metrica, valor, num_sesiones) para CSV y gráficas."""
+    filas = [{"metrica": "duracion", "valor": etiqueta, "num_sesiones": total}
+             for etiqueta, total in zip(etiquetas_duracion_sesion(), sesiones["duracion"])]
+    for metrica in ("participantes", "mensajes"):
+        filas += [{"metrica": metrica, "valor": valor, "num_sesiones": total}
+                  for valor, total in sorted(sesiones[metrica].items(), key=lambda x: int(x[0]))]
+    return filas
 
-# --- Función principal de análisis (modificada) ---
+# --- Días activos por usuario (un bit por día) ---
 
-def analizar_todo(mensajes):
-    stats_usuarios = {}
-    horas_por_usuario = defaultdict(list)
-    dias_semana_por_usuario = defaultdict(list) # Nuevo: para contar mensajes por día de la semana
-    
-    todos_los_usuarios_set = set(nombre for _, nombre, _ in mensajes)
-    mensajes_por_usuario = defaultdict(list)
+def nuevos_dias_activos():
+    """
+    Estado de los días con mensajes de cada usuario: un bytearray por usuario con un bit por
+    día contado desde `origen` (ordinal de la fecha, múltiplo de 8 para poder ampliar hacia
+    atrás byte a byte si aparece un mensaje anterior al primero).
+    """
+    return {"origen": None, "bits": {}}
 
-    menciones_por_autor = defaultdict(Counter)
-    menciones_globales = Counter()
+def marcar_dia_activo(dias, nombre, fecha):
+    """Marca el día de `fecha` (date o datetime) como activo para `nombre`."""
+    ordinal = fecha.toordinal()
+    if dias["origen"] is None:
+        dias["origen"] = ordinal & ~7
+    elif ordinal < dias["origen"]:
+        relleno = bytes((dias["origen"] - (ordinal & ~7)) >> 3)
+        for bits in dias["bits"].values():
+            bits[0:0] = relleno
+        dias["origen"] = ordinal & ~7
+    dia = ordinal - dias["origen"]
+    bits = dias["bits"].get(nombre)
+    if bits is None:
+        bits = dias["bits"][nombre] = bytearray()
+    if dia >> 3 >= len(bits):
+        bits.extend(bytes((dia >> 3) + 1 - len(bits)))
+    bits[dia >> 3] |= 1 << (dia & 7)
 
-    for fecha, nombre, mensaje in mensajes:
-        mensajes_por_usuario[nombre].append(mensaje)
-
-        if nombre not in stats_usuarios:
-            stats_usuarios[nombre] = {
-                "num_mensajes": 0, "num_palabras": 0, "total_longitud": 0,
-                "num_emojis": 0, "num_multimedia": 0,
-                "num_enlaces": 0, # <-- NUEVA MÉTRICA
-                "num_preguntas": 0, # <-- NUEVA MÉTRICA
-                "palabras_mas_usadas": [] 
-            }
-        
-        stats_usuarios[nombre]["num_mensajes"] += 1
-        stats_usuarios[nombre]["num_palabras"] += len(mensaje.split())
-        stats_usuarios[nombre]["total_longitud"] += len(mensaje)
-        stats_usuarios[nombre]["num_emojis"] += contar_emojis(mensaje)
-        stats_usuarios[nombre]["num_enlaces"] += contar_enlaces(mensaje)
-        if es_pregunta(mensaje): # <-- Contar preguntas aquí
-            stats_usuarios[nombre]["num_preguntas"] += 1
-        
-        if mensaje.strip() == "<Multimedia omitido>":
-            stats_usuarios[nombre]["num_multimedia"] += 1
-        
-        horas_por_usuario[nombre].append(fecha.hour)
-        dias_semana_por_usuario[nombre].append(fecha.weekday()) # Almacenar día de la semana (0=Lunes)
+def matriz_dias_activos(dias, usuarios):
+    """Bitmaps de `usuarios` como matriz uint64 usuarios × palabras: el bit k de la palabra w es el día 64w + k."""
+    num_bytes = -(-max((len(bits) for bits in dias["bits"].values()), default=0) // 8) * 8
+    matriz = np.zeros((len(usuarios), num_bytes), dtype=np.uint8)
+    for i, nombre in enumerate(usuarios):
+        bits = dias["bits"].get(nombre, b"")
+        matriz[i, :len(bits)] = np.frombuffer(bytes(bits), dtype=np.uint8)
+    return matriz.view("<u8")
+
+TABLA_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+def contar_bits(bloques):
+    """Número de bits a 1 de cada entero uint64 (np.bitwise_count desde NumPy 2.0, tabla por bytes antes)."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bloques)
+    return TABLA_BITS[np.ascontiguousarray(bloques).view(np.uint8)].reshape(*bloques.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+def desplazar_dias(matriz, n):
+    """Desplaza `n` días hacia delante los bitmaps de cada fila (el bit p pasa a p + n), con acarreo entre palabras."""
+    palabras, bits = divmod(n, 64)
+    desplazada = np.zeros_like(matriz)
+    if palabras >= matriz.shape[1]:
+        return desplazada
+    desplazada[:, palabras:] = matriz[:, :matriz.shape[1] - palabras]
+    if bits:
+        acarreo = np.zeros_like(desplazada)
+        acarreo[:, 1:] = desplazada[:, :-1] >> np.uint64(64 - bits)
+        desplazada = (desplazada << np.uint64(bits)) | acarreo
+    return desplazada
+
+def rachas_maximas(matriz):
+    """
+    Racha más larga de días seguidos de cada fila. R_k (bit p a 1 si los k días que acaban en p
+    son activos) se duplica con R_2k = R_k & desplazar(R_k, k) hasta anularse; después, cada fila
+    suma de mayor a menor las potencias de 2 que mantienen R_longitud+k = R_longitud & desplazar(R_k, longitud) no nula.
+    """
+    potencias = [matriz]
+    while True:
+        k = 1 << (len(potencias) - 1)
+        siguiente = potencias[-1] & desplazar_dias(potencias[-1], k)
+        if not siguiente.any():
+            break
+        potencias.append(siguiente)
+
+    rachas = np.zeros(len(matriz), dtype=np.int64)
+    for i in np.flatnonzero(matriz.any(axis=1)):
+        # Se parte de la mayor potencia con alguna racha en esta fila (la global puede no tenerla)
+        nivel = max(j for j, potencia in enumerate(potencias) if potencia[i].any())
+        actual = potencias[nivel][i:i + 1]
+        longitud = 1 << nivel
+        for j in range(nivel - 1, -1, -1):
+            candidata = actual & desplazar_dias(potencias[j][i:i + 1], longitud)
+            if candidata.any():
+                actual, longitud = candidata, longitud + (1 << j)
+        rachas[i] = longitud
+    return rachas
 
-        menciones_en_este_mensaje = analizar_menciones([mensaje], todos_los_usuarios_set)
-        for mencionado, conteo in menciones_en_este_mensaje.items():
-            if mencionado != nombre:
-                menciones_por_autor[nombre][mencionado] += conteo
-                menciones_globales[mencionado] += conteo
+def copresencia_dias(matriz, filas_por_bloque=64):
+    """Matriz usuarios × usuarios con los días en que ambos estuvieron activos: popcount(B_i & B_j) por bloques de filas."""
+    copresencia = np.zeros((len(matriz), len(matriz)), dtype=np.int64)
+    for inicio in range(0, len(matriz), filas_por_bloque):
+        bloque = matriz[inicio:inicio + filas_por_bloque]
+        copresencia[inicio:inicio + len(bloque)] = contar_bits(bloque[:, None, :] & matriz[None, :, :]).sum(axis=2, dtype=np.int64)
+    return copresencia
 
+def resultados_dias_activos(dias, usuarios):
+    """
+    Días activos y racha más larga de cada usuario, y pares de usuarios con días en común
+    (días juntos e índice de Jaccard: días juntos / días en que estuvo activo alguno de los dos).
+
+    Returns:
+        tuple: ({usuario: (dias_activos, racha_max)}, [filas usuario_a, usuario_b, dias_juntos, jaccard])
+    """
+    usuarios = list(usuarios)
+    matriz = matriz_dias_activos(dias, usuarios)
+    activos = contar_bits(matriz).sum(axis=1, dtype=np.int64)
+    rachas = rachas_maximas(matriz)
+    juntos = copresencia_dias(matriz)
+    union = activos[:, None] + activos[None, :] - juntos
+    jaccard = np.divide(juntos, union, out=np.zeros(juntos.shape), where=union > 0)
+
+    por_usuario = {nombre: (int(activos[i]), int(rachas[i])) for i, nombre in enumerate(usuarios)}
+    filas, columnas = np.nonzero(np.triu(juntos, k=1))
+    copresencia = [{"usuario_a": usuarios[i], "usuario_b": usuarios[j], "dias_juntos": int(juntos[i, j]),
+                    "jaccard": round(float(jaccard[i, j]), 4)} for i, j in zip(filas, columnas)]
+    return por_usuario, copresencia
+
+# --- Análisis en streaming (una sola pasada, memoria acotada) ---
+
+def nuevo_estado_analisis(usuarios=None, diario_por_hora=False, umbral_sesion_minutos=UMBRAL_SESION_MINUTOS, max_memoria=None,
+                          memoria_frases=MEMORIA_FRASES_MB * 2**20):
+    """
+    Crea el estado agregado del análisis en streaming. El estado solo guarda conteos
+    (por usuario, mes, hora, día...), nunca los mensajes, así que su tamaño no depende
+    del número de mensajes.
+
+    Args:
+        usuarios (set): Conjunto de autores, si se conoce de antemano. Las menciones se buscan
+            entre estos nombres; si es None, solo entre los autores vistos hasta ese mensaje.
+        diario_por_hora (bool): Resolución horaria (en vez de diaria) para la serie temporal detallada.
+        umbral_sesion_minutos (int): Hueco sin mensajes que separa dos conversaciones.
+        max_memoria (int): Presupuesto en bytes de los conteos de palabras, que se vuelcan a disco al superarlo.
+        memoria_frases (int): Bytes del sketch de frases más usadas (a más memoria, menos error).
+    """
+    return {
+        "usuarios_fijos": usuarios is not None,
+        "usuarios_menciones": set(usuarios or ()),
+        "patrones_menciones": preparar_patrones_menciones(usuarios or ()),
+        "diario_por_hora": diario_por_hora,
+        "num_mensajes": 0,
+        "stats_usuarios": {},
+        "ids_usuario": {},
+        "horas_por_usuario": defaultdict(Counter),
+        "menciones_por_autor": defaultdict(Counter),
+        "menciones_globales": Counter(),
+        "emojis_por_usuario": defaultdict(lambda: nuevo_top_k(CAPACIDAD_EMOJIS_USUARIO)),
+        "emojis_globales": nuevo_top_k(CAPACIDAD_EMOJIS_GLOBAL),
+        "mensajes_por_mes": defaultdict(int),
+        "mensajes_por_hora": defaultdict(int),
+        "mensajes_por_dia_semana": defaultdict(int),
+        # Siempre por hora: la serie diaria se obtiene sumando y las horas alimentan el filtrado del dashboard.
+        # Clave (hora absoluta = ordinal del día × 24 + hora, usuario), sin formatear fechas por mensaje
+        "mensajes_por_dia_y_hora": defaultdict(int),
+        "matriz_palabras": nueva_matriz_incremental(max_memoria),
+        "frases": nuevo_sketch_frases(memoria_frases),
+        "sesiones": nuevas_sesiones(umbral_sesion_minutos),
+        "dias_activos": nuevos_dias_activos(),
+    }
+
+def rasgos_mensaje(mensaje):
+    """Rasgos de un mensaje que no dependen del estado (métricas, tokens y texto normalizado), para calcularlos una sola vez."""
+    return extraer_rasgos_mensaje(mensaje), tokenizar_texto(mensaje), normalizar_texto(mensaje)
+
+def actualizar_estado_analisis(estado, fecha, nombre, mensaje, rasgos=None):
+    """
+    Incorpora un mensaje al estado del análisis en streaming. `rasgos` es el resultado de
+    rasgos_mensaje si ya se ha calculado (al alimentar varios estados con el mismo mensaje).
+    """
+    rasgos, tokens, normalizado = rasgos if rasgos is not None else rasgos_mensaje(mensaje)
+    estado["num_mensajes"] += 1
+    stats_usuarios = estado["stats_usuarios"]
+
+    if nombre not in stats_usuarios:
+        stats_usuarios[nombre] = {
+            "num_mensajes": 0, "num_palabras": 0, "total_longitud": 0,
+            "num_emojis": 0, "num_multimedia": 0,
+            "num_enlaces": 0, # <-- NUEVA MÉTRICA
+            "num_preguntas": 0, # <-- NUEVA MÉTRICA
+            "sesiones_iniciadas": 0, "sesiones_cerradas": 0, "sesiones_participadas": 0,
+        }
+        estado["ids_usuario"][nombre] = len(estado["ids_usuario"])
+        if not estado["usuarios_fijos"] and nombre not in estado["usuarios_menciones"]:
+            estado["usuarios_menciones"].add(nombre)
+            estado["patrones_menciones"] = preparar_patrones_menciones(estado["usuarios_menciones"])
+
+    datos = stats_usuarios[nombre]
+    num_palabras, longitud, emojis, num_enlaces, pregunta, multimedia = rasgos
+    datos["num_mensajes"] += 1
+    datos["num_palabras"] += num_palabras
+    datos["total_longitud"] += longitud
+    if emojis:
+        datos["num_emojis"] += len(emojis)
+        emojis_usuario = estado["emojis_por_usuario"][nombre]
+        for emoji in emojis:
+            emoji = normalizar_emoji(emoji)
+            añadir_top_k(emojis_usuario, emoji)
+            añadir_top_k(estado["emojis_globales"], emoji)
+    datos["num_enlaces"] += num_enlaces
+    datos["num_preguntas"] += pregunta
+    datos["num_multimedia"] += multimedia
+
+    actualizar_sesiones(estado["sesiones"], stats_usuarios, fecha, nombre)
+
+    # Una sola tokenización: las palabras sin stopwords para la matriz y todas para las frases
+    uid = estado["ids_usuario"][nombre]
+    añadir_tokens(estado["matriz_palabras"], uid, [token for token in tokens if token not in STOPWORDS_ES])
+    añadir_frases(estado["frases"], estado["matriz_palabras"]["vocabulario"], uid, tokens)
+
+    estado["horas_por_usuario"][nombre][fecha.hour] += 1
+    marcar_dia_activo(estado["dias_activos"], nombre, fecha)
+    estado["mensajes_por_mes"][(fecha.year, fecha.month, nombre)] += 1
+    estado["mensajes_por_hora"][(fecha.hour, nombre)] += 1
+    estado["mensajes_por_dia_semana"][(fecha.weekday(), nombre)] += 1 # 0=Lunes
+    estado["mensajes_por_dia_y_hora"][(fecha.toordinal() * 24 + fecha.hour, nombre)] += 1
+
+    for mencionado in buscar_menciones(normalizado, estado["patrones_menciones"]):
+        if mencionado != nombre:
+            estado["menciones_por_autor"][nombre][mencionado] += 1
+            estado["menciones_globales"][mencionado] += 1
+
+def resultados_estado_analisis(estado):
+    """
+    Genera todas las salidas del análisis a partir del estado agregado.
+
+    Returns:
+        tuple: (stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario)
+    """
+    stats_usuarios = estado["stats_usuarios"]
+    menciones_por_autor = estado["menciones_por_autor"]
+    menciones_globales = estado["menciones_globales"]
+
+    if estado["sesiones"] is not None:
+        cerrar_sesion(estado["sesiones"], stats_usuarios) # La última conversación sigue abierta al acabar el flujo
+    matriz_palabras = finalizar_matriz(estado["matriz_palabras"], stats_usuarios)
+    palabras_mas_usadas = top_terminos_por_usuario(matriz_palabras, matriz_palabras["conteos"])
+    palabras_caracteristicas = top_terminos_por_usuario(matriz_palabras, calcular_tfidf(matriz_palabras))
+    frases_por_usuario, frases_globales, error_frases = resultados_frases(estado["frases"], matriz_palabras["terminos"], stats_usuarios)
+    dias_activos, copresencia = resultados_dias_activos(estado["dias_activos"], stats_usuarios) if estado["dias_activos"] is not None else ({}, None)
 
-    # Procesar después de iterar todos los mensajes
     resultados_usuario = []
     for nombre, datos in stats_usuarios.items():
-        datos['palabras_mas_usadas'] = obtener_palabras_frecuentes(mensajes_por_usuario[nombre])
-        
         top_menciones_hechas = menciones_por_autor[nombre].most_common(3)
-        datos['menciones_hechas'] = ", ".join([f"{u} ({c})" for u, c in top_menciones_hechas])
 
         media_long = 0
         if datos["num_mensajes"] > 0:
             media_long = datos["total_longitud"] / datos["num_mensajes"]
         
         hora_fav = None
-        if horas_por_usuario[nombre]:
-            hora_fav = Counter(horas_por_usuario[nombre]).most_common(1)[0][0]
+        if estado["horas_por_usuario"][nombre]:
+            hora_fav = estado["horas_por_usuario"][nombre].most_common(1)[0][0]
 
-        resultados_usuario.append({
+        fila = {
             "nombre": nombre,
             "num_mensajes": datos["num_mensajes"],
             "num_palabras": datos["num_palabras"],
@@ -188,9 +1003,17 @@ def analizar_todo(mensajes):
             "num_multimedia": datos["num_multimedia"],
             "num_enlaces": datos["num_enlaces"],
             "num_preguntas": datos["num_preguntas"], # <-- Incluir en los resultados
-            "palabras_mas_usadas": str(datos["palabras_mas_usadas"]), 
-            "menciones_hechas": str(datos["menciones_hechas"])
-        })
+            "palabras_mas_usadas": str(palabras_mas_usadas[nombre]), 
+            "palabras_caracteristicas": str(palabras_caracteristicas[nombre]),
+            "frases_mas_usadas": str(frases_por_usuario[nombre][:10]),
+            "emojis_mas_usados": str(mas_frecuentes_top_k(estado["emojis_por_usuario"][nombre])) if nombre in estado["emojis_por_usuario"] else "[]",
+            "menciones_hechas": ", ".join([f"{u} ({c})" for u, c in top_menciones_hechas])
+        }
+        if estado["sesiones"] is not None: # Las conversaciones no se pueden estimar a partir de una muestra
+            fila.update({campo: datos[campo] for campo in ("sesiones_iniciadas", "sesiones_cerradas", "sesiones_participadas")})
+        if nombre in dias_activos:
+            fila["dias_activos"], fila["racha_max_dias"] = dias_activos[nombre]
+        resultados_usuario.append(fila)
     
     persona_mas_mencionada = None
     if menciones_globales:
@@ -207,71 +1030,249 @@ def analizar_todo(mensajes):
             })
     df_menciones_por_autor = pd.DataFrame(menciones_por_autor_lista)
 
-    return resultados_usuario, {
+    analisis_global = {
+        "num_mensajes": estado["num_mensajes"],
         "persona_mas_mencionada": persona_mas_mencionada,
         "todas_las_menciones_globales": menciones_globales.most_common(5),
-        "df_menciones_por_autor": df_menciones_por_autor # <-- Nuevo: DataFrame para heatmap
+        "df_menciones_por_autor": df_menciones_por_autor, # <-- Nuevo: DataFrame para heatmap
+        "emojis_globales": mas_frecuentes_top_k(estado["emojis_globales"], NUM_TOP_EMOJIS_GLOBALES),
+        "frases_globales": frases_globales,
+        "copresencia": copresencia, # Pares de usuarios con días activos en común (None en modo muestra)
+        "error_frases": error_frases,
+        # Estado bruto necesario para exportar agregados fusionables (--out_agregados)
+        "stats_brutos": stats_usuarios,
+        "menciones_por_autor": menciones_por_autor,
+        "emojis_por_usuario": estado["emojis_por_usuario"],
+        "frases_por_usuario": frases_por_usuario,
+        "matriz_palabras": matriz_palabras,
+        "sesiones": estado["sesiones"],
+        # Cubo usuario × día × hora para filtrar el dashboard por fechas y usuarios en el navegador (ver filas_dia_y_hora)
+        "mensajes_por_dia_y_hora": estado["mensajes_por_dia_y_hora"],
     }
 
+    usuarios_unicos = sorted(stats_usuarios)
+    stats_mes = [{"año": año, "mes": mes, "usuario": usuario, "num_mensajes": total}
+                 for (año, mes, usuario), total in sorted(estado["mensajes_por_mes"].items())]
+    stats_horas = [{"hora": hora, "usuario": usuario, "num_mensajes": estado["mensajes_por_hora"].get((hora, usuario), 0)}
+                   for hora in range(24) for usuario in usuarios_unicos]
+    stats_dia_semana = [{"dia_semana_num": dia_num, "dia_semana": DIAS_SEMANA_NOMBRES[dia_num], "usuario": usuario,
+                         "num_mensajes": estado["mensajes_por_dia_semana"].get((dia_num, usuario), 0)}
+                        for dia_num in range(7) for usuario in usuarios_unicos]
+    if estado["diario_por_hora"]:
+        stats_diario = [{"fecha": f"{fecha} {hora:02d}:00", "usuario": usuario, "num_mensajes": total}
+                        for fecha, hora, usuario, total in iterar_dia_y_hora(estado["mensajes_por_dia_y_hora"])]
+    else:
+        mensajes_diario = defaultdict(int)
+        for (hora_absoluta, usuario), total in estado["mensajes_por_dia_y_hora"].items():
+            mensajes_diario[(hora_absoluta // 24, usuario)] += total
+        stats_diario = [{"fecha": date.fromordinal(dia).isoformat(), "usuario": usuario, "num_mensajes": total}
+                        for (dia, usuario), total in sorted(mensajes_diario.items())]
 
-# --- El resto de funciones existentes ---
+    return resultados_usuario, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario
 
-def contar_mensajes_por_mes_y_usuario(mensajes):
-    contador = defaultdict(int)
-    for fecha, nombre, _ in mensajes:
-        clave = (fecha.year, fecha.month, nombre)
-        contador[clave] += 1
-    resultado = [{"año": año, "mes": mes, "usuario": usuario, "num_mensajes": total}
-                 for (año, mes, usuario), total in sorted(contador.items())]
-    return resultado
+# Claves de los periodos de los informes por periodo (--por_periodo), que ordenan cronológicamente como texto
+PERIODOS = {
+    "año": lambda fecha: f"{fecha.year:04d}",
+    "trimestre": lambda fecha: f"{fecha.year:04d}-T{(fecha.month - 1) // 3 + 1}",
+}
 
-def contar_mensajes_por_hora_y_usuario(mensajes):
-    contador = defaultdict(int)
-    for fecha, nombre, _ in mensajes:
-        clave = (fecha.hour, nombre)
-        contador[clave] += 1
-    
-    resultado = []
-    usuarios_unicos = sorted(list(set(nombre for _, nombre, _ in mensajes)))
-
-    for hora in range(24):
-        for usuario in usuarios_unicos:
-            num_mensajes = contador[(hora, usuario)]
-            resultado.append({
-                "hora": hora,
-                "usuario": usuario,
-                "num_mensajes": num_mensajes
-            })
-    resultado.sort(key=lambda x: (x['hora'], x['usuario']))
-    
-    return resultado
+def analizar_flujo(mensajes, usuarios=None, diario_por_hora=False, umbral_sesion_minutos=UMBRAL_SESION_MINUTOS,
+                   total_mensajes=None, max_memoria=None, memoria_frases=MEMORIA_FRASES_MB * 2**20, periodo=None,
+                   al_cerrar_periodo=None):
+    """
+    Analiza un iterador de mensajes (fecha, nombre, mensaje) en una sola pasada y con
+    memoria acotada. Puede alimentarse directamente con leer_mensajes_csv o con el
+    generador del preprocesador (ver mensajes_desde_chat).
 
-# --- NUEVA FUNCIÓN: Contar mensajes por día de la semana y usuario ---
-def contar_mensajes_por_dia_semana_y_usuario(mensajes):
-    contador = defaultdict(int)
-    for fecha, nombre, _ in mensajes:
-        # fecha.weekday() devuelve 0 para lunes, 1 para martes, ..., 6 para domingo
-        clave = (fecha.weekday(), nombre)
-        contador[clave] += 1
-    
-    resultado = []
-    usuarios_unicos = sorted(list(set(nombre for _, nombre, _ in mensajes)))
-    dias_semana_nombres = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-
-    for dia_num in range(7): # Días de 0 a 6
-        for usuario in usuarios_unicos:
-            num_mensajes = contador[(dia_num, usuario)]
-            resultado.append({
-                "dia_semana_num": dia_num,
-                "dia_semana": dias_semana_nombres[dia_num],
-                "usuario": usuario,
-                "num_mensajes": num_mensajes
-            })
-    # Ordenar por día de la semana numérico y luego por usuario
-    resultado.sort(key=lambda x: (x['dia_semana_num'], x['usuario']))
-    
-    return resultado
+    Args:
+        total_mensajes (int): Número de mensajes esperado, si se conoce, para el porcentaje y la ETA del progreso.
+        max_memoria (int): Presupuesto en bytes de los conteos de palabras (ver nueva_matriz_incremental),
+            que se aplica por separado al estado completo y al del periodo en curso.
+        memoria_frases (int): Bytes del sketch de frases más usadas (ver nuevo_sketch_frases).
+        periodo (str): Clave de PERIODOS. En la misma pasada, cada mensaje alimenta también el estado
+            de su periodo. Como el chat llega en orden cronológico, un periodo termina en cuanto
+            aparece el siguiente: sus resultados se pasan a al_cerrar_periodo(clave, resultados) y
+            su estado se libera, de modo que solo hay un periodo en memoria a la vez.
+
+    Returns:
+        tuple: (stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario)
+    """
+    estado = nuevo_estado_analisis(usuarios, diario_por_hora, umbral_sesion_minutos, max_memoria, memoria_frases)
+    clave_periodo = PERIODOS[periodo] if periodo else None
+    periodo_actual, estado_periodo = None, None
+    cerrados = set()
+    fuera_de_orden = 0
+    progreso = nuevo_progreso("análisis", total_mensajes)
+    for fecha, nombre, mensaje in mensajes:
+        if clave_periodo is None:
+            actualizar_estado_analisis(estado, fecha, nombre, mensaje)
+        else:
+            # Los rasgos del mensaje se calculan una vez para los dos estados que lo reciben
+            rasgos = rasgos_mensaje(mensaje)
+            actualizar_estado_analisis(estado, fecha, nombre, mensaje, rasgos)
+            clave = clave_periodo(fecha)
+            if clave != periodo_actual:
+                if estado_periodo is not None:
+                    al_cerrar_periodo(periodo_actual, resultados_estado_analisis(estado_periodo))
+                    cerrados.add(periodo_actual)
+                    estado_periodo = None
+                periodo_actual = clave
+                if clave not in cerrados:
+                    estado_periodo = nuevo_estado_analisis(usuarios, diario_por_hora, umbral_sesion_minutos, max_memoria, memoria_frases)
+            if estado_periodo is not None:
+                actualizar_estado_analisis(estado_periodo, fecha, nombre, mensaje, rasgos)
+            else:
+                fuera_de_orden += 1 # Su periodo ya se cerró: solo cuenta en el análisis completo
+        if not estado["num_mensajes"] % PASO_PROGRESO:
+            informar_progreso(progreso, estado["num_mensajes"])
+    terminar_progreso(progreso, estado["num_mensajes"])
+    if estado_periodo is not None:
+        al_cerrar_periodo(periodo_actual, resultados_estado_analisis(estado_periodo))
+    if fuera_de_orden:
+        print(f"⚠️ {fuera_de_orden} mensajes fuera de orden cronológico de un periodo ya cerrado: solo cuentan en el análisis completo.")
+    return resultados_estado_analisis(estado)
+
+def mensajes_desde_chat(input_path, nickname_mapping):
+    """Genera los mensajes de un chat exportado ya preprocesados, sin pasar por el CSV intermedio."""
+    from prepocessing import iterar_mensajes_chat
+    for fecha_iso, autor, texto in iterar_mensajes_chat(input_path, nickname_mapping):
+        yield (datetime.fromisoformat(fecha_iso), autor, texto)
+
+# --- Vista previa aproximada a partir de una muestra ---
+
+def muestrear_mensajes(mensajes, tamaño, por_mes=False, semilla=None):
+    """
+    Toma una muestra aleatoria de un iterador de mensajes (fecha, nombre, mensaje) en una sola
+    lectura, estratificada por mes si se pide, y recoge de paso el conjunto de autores.
+
+    Returns:
+        tuple: (muestra, Counter de mensajes por estrato ((año, mes) con por_mes, o None), conjunto de autores)
+    """
+    from prepocessing import muestrear_reservorio
+    usuarios = set()
+
+    def registrar_autores():
+        for mensaje in mensajes:
+            usuarios.add(mensaje[1])
+            yield mensaje
 
+    estrato_mes = (lambda mensaje: (mensaje[0].year, mensaje[0].month)) if por_mes else None
+    muestra, conteos = muestrear_reservorio(registrar_autores(), tamaño, estrato_mes, semilla)
+    return muestra, conteos, usuarios
+
+def muestra_desde_chat(input_path, nickname_mapping, tamaño, por_mes=False, semilla=None):
+    """Como muestrear_mensajes, pero leyendo directamente el chat exportado (ver prepocessing.muestrear_chat)."""
+    from prepocessing import muestrear_chat
+    muestra, conteos, usuarios = muestrear_chat(input_path, nickname_mapping, tamaño, por_mes, semilla)
+    return [(datetime.fromisoformat(fecha_iso), autor, texto) for fecha_iso, autor, texto in muestra], conteos, usuarios
+
+def escalar_estado_analisis(estado, factor, factores_mes=None):
+    """
+    Multiplica por `factor` todos los conteos del estado (redondeados a enteros), para estimar
+    los totales del chat completo a partir de una muestra. Con una muestra estratificada por mes,
+    `factores_mes` ({(año, mes): factor}) se aplica a las series mensual y diaria, cuyos totales
+    por mes pasan a ser exactos. Las conversaciones dependen de los huecos entre mensajes
+    consecutivos y no se pueden estimar, así que se descartan, igual que los días activos.
+    """
+    factores_mes = factores_mes or {}
+    escalar = lambda valor, f=factor: int(round(valor * f))
+    for datos in estado["stats_usuarios"].values():
+        for campo, valor in datos.items():
+            datos[campo] = escalar(valor)
+    emojis = [top["conteos"] for top in estado["emojis_por_usuario"].values()] + [estado["emojis_globales"]["conteos"]]
+    for conteos in list(estado["horas_por_usuario"].values()) + list(estado["menciones_por_autor"].values()) + [estado["menciones_globales"]] + emojis:
+        for clave in conteos:
+            conteos[clave] = escalar(conteos[clave])
+    for nombre in ("mensajes_por_hora", "mensajes_por_dia_semana"):
+        for clave in estado[nombre]:
+            estado[nombre][clave] = escalar(estado[nombre][clave])
+    for (año, mes, usuario), valor in estado["mensajes_por_mes"].items():
+        estado["mensajes_por_mes"][(año, mes, usuario)] = escalar(valor, factores_mes.get((año, mes), factor))
+    meses = {}
+    for (hora_absoluta, usuario), valor in estado["mensajes_por_dia_y_hora"].items():
+        dia = hora_absoluta // 24
+        if dia not in meses:
+            fecha = date.fromordinal(dia)
+            meses[dia] = (fecha.year, fecha.month)
+        estado["mensajes_por_dia_y_hora"][(hora_absoluta, usuario)] = escalar(valor, factores_mes.get(meses[dia], factor))
+
+    matriz = estado["matriz_palabras"]
+    compactar_matriz(matriz)
+    matriz["conteos"] = np.rint(matriz["conteos"] * factor).astype(np.int64)
+    frases = estado["frases"]
+    volcar_lote_frases(frases)
+    frases["sketch"] = np.rint(frases["sketch"] * factor).astype(np.int64)
+    frases["num_frases"] = escalar(frases["num_frases"])
+    estado["sesiones"] = None
+    estado["dias_activos"] = None # Una muestra no ve todos los días con mensajes
+
+def intervalo_confianza_cuota(k, n, total, z=1.96):
+    """
+    Intervalo de confianza (Wilson, 95 % por defecto) de la proporción k/n de una muestra sin
+    reemplazo de n elementos de `total`; la corrección de población finita lo estrecha hasta
+    anularlo cuando la muestra es el chat completo.
+    """
+    if n == 0:
+        return 0.0, 0.0
+    p = k / n
+    correccion = (total - n) / (total - 1) if total > 1 else 0
+    if correccion <= 0:
+        return p, p
+    n_efectivo = n / correccion
+    denominador = 1 + z**2 / n_efectivo
+    centro = (p + z**2 / (2 * n_efectivo)) / denominador
+    margen = z * math.sqrt(p * (1 - p) / n_efectivo + z**2 / (4 * n_efectivo**2)) / denominador
+    return max(0.0, centro - margen), min(1.0, centro + margen)
+
+def analizar_muestra(muestra, conteos_estratos, usuarios=None, diario_por_hora=False, memoria_frases=MEMORIA_FRASES_MB * 2**20):
+    """
+    Analiza una muestra y escala los conteos al tamaño del chat completo. Cada usuario recibe
+    además su cuota de mensajes con el intervalo de confianza, y analisis_global["muestra"]
+    indica el tamaño de la muestra y el total para marcar el dashboard como aproximado.
+
+    Args:
+        conteos_estratos (Counter): Mensajes leídos por estrato, como los devuelve muestrear_mensajes.
+
+    Returns:
+        tuple: (stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario)
+    """
+    estado = nuevo_estado_analisis(usuarios, diario_por_hora, memoria_frases=memoria_frases)
+    for fecha, nombre, mensaje in muestra:
+        actualizar_estado_analisis(estado, fecha, nombre, mensaje)
+    mensajes_muestra = {nombre: datos["num_mensajes"] for nombre, datos in estado["stats_usuarios"].items()}
+
+    num_total = sum(conteos_estratos.values())
+    factores_mes = None
+    if None not in conteos_estratos: # Muestra estratificada por mes
+        muestra_por_mes = Counter((fecha.year, fecha.month) for fecha, _, _ in muestra)
+        factores_mes = {mes: conteos_estratos[mes] / n for mes, n in muestra_por_mes.items()}
+    escalar_estado_analisis(estado, num_total / len(muestra) if muestra else 1, factores_mes)
+    estado["num_mensajes"] = num_total
+    resultados = resultados_estado_analisis(estado)
+
+    stats_usuarios, analisis_global = resultados[0], resultados[1]
+    for fila in stats_usuarios:
+        k = mensajes_muestra[fila["nombre"]]
+        inferior, superior = intervalo_confianza_cuota(k, len(muestra), num_total)
+        fila.update({
+            "mensajes_muestra": k,
+            "porcentaje_mensajes": round(100 * k / len(muestra), 2),
+            "porcentaje_ic_inf": round(100 * inferior, 2),
+            "porcentaje_ic_sup": round(100 * superior, 2),
+        })
+    analisis_global["muestra"] = {"tamaño": len(muestra), "total": num_total}
+    return resultados
+
+# --- Función principal de análisis (modificada) ---
+
+def analizar_todo(mensajes):
+    """Analiza una lista de mensajes ya cargada (envoltorio de analizar_flujo)."""
+    todos_los_usuarios_set = set(nombre for _, nombre, _ in mensajes)
+    stats_usuarios, analisis_global, *_ = analizar_flujo(mensajes, todos_los_usuarios_set, total_mensajes=len(mensajes))
+    return stats_usuarios, analisis_global
+
+
+# --- El resto de funciones existentes ---
 
 def guardar_csv(diccionarios, output_path, columnas):
     with open(output_path, "w", encoding="utf-8", newline='') as f:
@@ -279,9 +1280,66 @@ def guardar_csv(diccionarios, output_path, columnas):
         writer.writeheader()
         writer.writerows(diccionarios)
 
-def main():
-    parser = argparse.ArgumentParser(description="Analizador de estadísticas de chats de WhatsApp (entrada CSV).")
-    parser.add_argument("input_file", help="Archivo CSV preprocesado")
+# --- Agregados fusionables entre chats ---
+
+CAMPOS_ADITIVOS_USUARIO = [
+    "num_mensajes", "num_palabras", "total_longitud", "num_emojis",
+    "num_multimedia", "num_enlaces", "num_preguntas",
+    "sesiones_iniciadas", "sesiones_cerradas", "sesiones_participadas"
+]
+
+def construir_agregados(analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario=(), max_palabras=MAX_PALABRAS_AGREGADOS):
+    """
+    Resume el análisis de un chat en un diccionario de conteos aditivos por usuario
+    (totales, cubo temporal hora/día/mes, boceto de palabras y matriz de menciones).
+    Varios de estos agregados se pueden sumar sin volver a leer ningún mensaje
+    (ver fusionar_chats.py). Las palabras se truncan a las `max_palabras` más
+    frecuentes de cada usuario, por lo que el top de palabras fusionado es aproximado
+    (igual que los de emojis y frases, que ya se cuentan de forma acotada).
+    """
+    usuarios = {}
+    for nombre, datos in analisis_global["stats_brutos"].items():
+        usuarios[nombre] = {campo: datos[campo] for campo in CAMPOS_ADITIVOS_USUARIO}
+        usuarios[nombre].update({"horas": [0] * 24, "dias_semana": [0] * 7, "meses": {}, "dias": Counter(), "palabras": {}, "emojis": {}, "frases": {}})
+
+    for fila in stats_horas:
+        if fila["usuario"] in usuarios:
+            usuarios[fila["usuario"]]["horas"][fila["hora"]] = fila["num_mensajes"]
+    for fila in stats_dia_semana:
+        if fila["usuario"] in usuarios:
+            usuarios[fila["usuario"]]["dias_semana"][fila["dia_semana_num"]] = fila["num_mensajes"]
+    for fila in stats_mes:
+        usuarios[fila["usuario"]]["meses"][f"{fila['año']:04d}-{fila['mes']:02d}"] = fila["num_mensajes"]
+    for fila in stats_diario:
+        # Los agregados guardan siempre resolución diaria, aunque el análisis sea por horas
+        usuarios[fila["usuario"]]["dias"][fila["fecha"][:10]] += fila["num_mensajes"]
+
+    matriz = analisis_global["matriz_palabras"]
+    for nombre, palabras in top_terminos_por_usuario(matriz, matriz["conteos"], num_top=max_palabras).items():
+        usuarios[nombre]["palabras"] = dict(palabras)
+    for nombre, top in analisis_global["emojis_por_usuario"].items():
+        usuarios[nombre]["emojis"] = dict(top["conteos"])
+    for nombre, frases in analisis_global["frases_por_usuario"].items():
+        usuarios[nombre]["frases"] = dict(frases)
+
+    return {
+        "version": 1,
+        "usuarios": usuarios,
+        "menciones": {autor: dict(menciones) for autor, menciones in analisis_global["menciones_por_autor"].items()},
+        "sesiones": {
+            "num_sesiones": analisis_global["sesiones"]["num_sesiones"],
+            "duracion": analisis_global["sesiones"]["duracion"],
+            "participantes": dict(analisis_global["sesiones"]["participantes"]),
+            "mensajes": dict(analisis_global["sesiones"]["mensajes"]),
+        },
+    }
+
+def guardar_agregados(agregados, output_path):
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(agregados, f, ensure_ascii=False)
+
+def añadir_argumentos_salida(parser):
+    """Añade al parser los argumentos de los CSV de salida que consume graficas.py."""
     parser.add_argument("--out_usuarios", default="stats_usuarios.csv", help="Archivo de salida de stats por usuario")
     parser.add_argument("--out_mensual", default="mensajes_por_mes.csv", help="Archivo de salida de stats por mes y usuario")
     parser.add_argument("--out_horas", default="mensajes_por_hora.csv", help="Archivo de salida de stats por hora y usuario")
@@ -290,33 +1348,67 @@ def main():
     parser.add_argument("--out_dia_semana", default="mensajes_por_dia_semana.csv", help="Archivo de salida de stats por día de la semana y usuario.")
     parser.add_argument("--out_menciones_por_autor", default="menciones_por_autor.csv", help="Archivo de salida de menciones detalladas por autor para heatmap.")
     # --------------------------
-    args = parser.parse_args()
-
-    mensajes = cargar_mensajes_csv(args.input_file)
-
-    print(f"📥 {len(mensajes)} mensajes cargados")
-
-    stats_usuarios, analisis_global = analizar_todo(mensajes)
+    parser.add_argument("--out_diario", default=None, help="Archivo de salida opcional de mensajes por día (o por hora) y usuario para la línea temporal detallada.")
+    parser.add_argument("--out_sesiones", default=None, help="Archivo de salida opcional con los histogramas de conversaciones (duración, participantes y mensajes).")
+    parser.add_argument("--out_dia_hora", default=None, help="Archivo de salida opcional de mensajes por día, hora y usuario, para filtrar el dashboard por fechas y usuarios.")
+    parser.add_argument("--out_copresencia", default=None, help="Archivo de salida opcional con los días en que coinciden activos cada par de usuarios (y su índice de Jaccard).")
+    parser.add_argument("--out_frases", default=None, help="Archivo de salida opcional con las frases (bigramas y trigramas) más usadas en todo el chat.")
+    parser.add_argument("--out_emojis", default=None, help="Archivo de salida opcional con los emojis más usados en todo el chat.")
+    parser.add_argument("--out_agregados", default=None, help="Archivo JSON opcional con los agregados fusionables del chat (ver fusionar_chats.py).")
 
+def guardar_resultados(args, stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario=None):
+    """Guarda todos los CSV de salida en las rutas indicadas por los argumentos --out_*."""
     # Guardar estadísticas de usuarios (con las nuevas columnas)
     columnas_usuarios = [
         "nombre", "num_mensajes", "num_palabras", "media_longitud_mensaje",
         "hora_favorita", "num_emojis", "num_multimedia", "num_enlaces", "num_preguntas", # <-- ¡Añadidas!
-        "palabras_mas_usadas", "menciones_hechas"
+        "sesiones_iniciadas", "sesiones_cerradas", "sesiones_participadas", "dias_activos", "racha_max_dias",
+        "mensajes_muestra", "porcentaje_mensajes", "porcentaje_ic_inf", "porcentaje_ic_sup", # Solo en modo muestra
+        "palabras_mas_usadas", "palabras_caracteristicas", "frases_mas_usadas", "emojis_mas_usados", "menciones_hechas"
     ]
+    if stats_usuarios:
+        columnas_usuarios = [columna for columna in columnas_usuarios if columna in stats_usuarios[0]]
     guardar_csv(stats_usuarios, args.out_usuarios, columnas_usuarios)
     print(f"📊 Estadísticas de usuarios (incl. palabras más usadas, menciones) guardadas en {args.out_usuarios}")
 
-    stats_mes = contar_mensajes_por_mes_y_usuario(mensajes)
     guardar_csv(stats_mes, args.out_mensual, ["año", "mes", "usuario", "num_mensajes"])
     print(f"📆 Estadísticas por mes y usuario guardadas en {args.out_mensual}")
 
-    stats_horas = contar_mensajes_por_hora_y_usuario(mensajes)
     guardar_csv(stats_horas, args.out_horas, ["hora", "usuario", "num_mensajes"])
     print(f"⏰ Estadísticas por hora y usuario guardadas en {args.out_horas}")
 
+    if args.out_diario and stats_diario is not None:
+        guardar_csv(stats_diario, args.out_diario, ["fecha", "usuario", "num_mensajes"])
+        print(f"📅 Estadísticas diarias por usuario guardadas en {args.out_diario}")
+
+    if args.out_dia_hora and "mensajes_por_dia_y_hora" not in analisis_global:
+        print("⚠️ La actividad por día y hora no está disponible (p. ej. al fusionar agregados): no se guarda --out_dia_hora.")
+    elif args.out_dia_hora:
+        guardar_csv(filas_dia_y_hora(analisis_global["mensajes_por_dia_y_hora"]), args.out_dia_hora, ["fecha", "hora", "usuario", "num_mensajes"])
+        print(f"🧊 Actividad por día, hora y usuario guardada en {args.out_dia_hora}")
+
+    if args.out_copresencia and analisis_global["copresencia"] is None:
+        print("⚠️ Los días activos no se pueden obtener de una muestra: no se guarda --out_copresencia.")
+    elif args.out_copresencia:
+        guardar_csv(analisis_global["copresencia"], args.out_copresencia, ["usuario_a", "usuario_b", "dias_juntos", "jaccard"])
+        print(f"📅 Días activos en común por pareja de usuarios guardados en {args.out_copresencia}")
+
+    if args.out_frases:
+        guardar_csv([{"frase": f, "conteo": c, "error_max": analisis_global["error_frases"]} for f, c in analisis_global["frases_globales"]],
+                    args.out_frases, ["frase", "conteo", "error_max"])
+        print(f"💬 Frases más usadas guardadas en {args.out_frases}")
+
+    if args.out_emojis:
+        guardar_csv([{"emoji": e, "conteo": c} for e, c in analisis_global["emojis_globales"]], args.out_emojis, ["emoji", "conteo"])
+        print(f"😀 Emojis más usados guardados en {args.out_emojis}")
+
+    if args.out_sesiones and analisis_global["sesiones"] is None:
+        print("⚠️ Las conversaciones no se pueden estimar a partir de una muestra: no se guarda --out_sesiones.")
+    elif args.out_sesiones:
+        guardar_csv(filas_sesiones(analisis_global["sesiones"]), args.out_sesiones, ["metrica", "valor", "num_sesiones"])
+        print(f"💬 {analisis_global['sesiones']['num_sesiones']} conversaciones detectadas. Histogramas guardados en {args.out_sesiones}")
+
     # --- NUEVOS GUARDADOS ---
-    stats_dia_semana = contar_mensajes_por_dia_semana_y_usuario(mensajes)
     guardar_csv(stats_dia_semana, args.out_dia_semana, ["dia_semana_num", "dia_semana", "usuario", "num_mensajes"])
     print(f"🗓️ Estadísticas por día de la semana y usuario guardadas en {args.out_dia_semana}")
     
@@ -334,6 +1426,87 @@ def main():
     guardar_csv(menciones_globales_data, args.out_menciones_globales, ["usuario_mencionado", "conteo"])
     print(f"🗣️ Estadísticas de menciones globales guardadas en {args.out_menciones_globales}")
 
+def rutas_periodo(args, periodo):
+    """Copia de los argumentos con `_<periodo>` antes de la extensión de cada ruta --out_* (sin agregados)."""
+    rutas = vars(args).copy()
+    for campo, ruta in rutas.items():
+        if campo.startswith("out_") and ruta:
+            raiz, extension = os.path.splitext(ruta)
+            rutas[campo] = f"{raiz}_{periodo}{extension}"
+    rutas["out_agregados"] = None
+    return argparse.Namespace(**rutas)
+
+def guardar_periodo(args, periodo, resultados_periodo):
+    """Guarda las salidas de un periodo recién cerrado (ver analizar_flujo) con el periodo en el nombre."""
+    print(f"🗂️ Periodo {periodo}: {resultados_periodo[1]['num_mensajes']} mensajes")
+    guardar_resultados(rutas_periodo(args, periodo), *resultados_periodo)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analizador de estadísticas de chats de WhatsApp (entrada CSV).")
+    parser.add_argument("input_file", help="Archivo CSV preprocesado (o el chat exportado, con --desde_chat)")
+    añadir_argumentos_salida(parser)
+    parser.add_argument("--resolucion_diario", choices=["dia", "hora"], default="dia", help="Resolución de --out_diario: por día o por hora.")
+    parser.add_argument("--umbral_sesion", type=int, default=UMBRAL_SESION_MINUTOS, help="Minutos sin mensajes que separan dos conversaciones.")
+    parser.add_argument("--desde_chat", action="store_true", help="La entrada es el chat exportado (.txt, .zip, .txt.gz o .txt.zst) en lugar del CSV preprocesado.")
+    parser.add_argument("--nicks", default="nickname_mapping.csv", help="Archivo CSV con apodos y nombres reales (solo con --desde_chat)")
+    parser.add_argument("--muestra", type=int, default=None, help="Vista previa aproximada: analiza solo N mensajes elegidos al azar y escala los conteos.")
+    parser.add_argument("--muestra_por_mes", action="store_true", help="Estratifica la muestra por mes para conservar la forma de las gráficas temporales.")
+    parser.add_argument("--semilla", type=int, default=None, help="Semilla del muestreo, para repetir la misma muestra.")
+    parser.add_argument("--memoria_frases", type=int, default=MEMORIA_FRASES_MB, help="MB del Count-Min sketch de las frases más usadas: fija su memoria; con más, la cota de error de los conteos baja.")
+    parser.add_argument("--max_memoria", type=int, default=None, help="Presupuesto en MB de los conteos de palabras: al superarlo se vuelcan a disco y se fusionan al final, con los mismos resultados (sin efecto con --muestra).")
+    parser.add_argument("--por_periodo", choices=sorted(PERIODOS), default=None, help="En la misma pasada, guarda además todas las salidas de cada año o trimestre, con el periodo añadido al nombre (p. ej. stats_usuarios_2023.csv).")
+    añadir_argumento_progreso(parser)
+    args = parser.parse_args()
+    configurar_progreso(args.progreso)
+    if args.por_periodo and args.muestra:
+        parser.error("--por_periodo necesita el chat completo y no se puede combinar con --muestra.")
+    diario_por_hora = args.resolucion_diario == "hora"
+
+    if args.desde_chat:
+        from prepocessing import abrir_chat, cargar_nickname_mapping, iterar_mensajes_chat
+        nickname_mapping = cargar_nickname_mapping(args.nicks)
+        try:
+            abrir_chat(args.input_file).close() # Falla antes de leer nada si falta zstandard para un .zst
+        except ImportError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+
+    if args.muestra:
+        # Una sola lectura secuencial; el coste del análisis depende solo del tamaño de la muestra
+        if args.desde_chat:
+            muestra, conteos_estratos, usuarios = muestra_desde_chat(args.input_file, nickname_mapping, args.muestra, args.muestra_por_mes, args.semilla)
+        else:
+            muestra, conteos_estratos, usuarios = muestrear_mensajes(leer_mensajes_csv(args.input_file), args.muestra, args.muestra_por_mes, args.semilla)
+        resultados = analizar_muestra(muestra, conteos_estratos, usuarios, diario_por_hora, args.memoria_frases * 2**20)
+        print(f"🎲 Vista previa aproximada: muestra de {len(muestra)} de {sum(conteos_estratos.values())} mensajes")
+    else:
+        # Primera lectura ligera solo de los autores, para que las menciones sean exactas
+        # (y el progreso tenga total); después los mensajes se analizan en streaming sin cargarlos en memoria.
+        if args.desde_chat:
+            autores = Counter(autor for _, autor, _ in iterar_mensajes_chat(args.input_file, nickname_mapping, normalizar_fechas=False))
+            mensajes = mensajes_desde_chat(args.input_file, nickname_mapping)
+        else:
+            autores = contar_mensajes_autores_csv(args.input_file)
+            mensajes = leer_mensajes_csv(args.input_file)
+        resultados = analizar_flujo(mensajes, set(autores), diario_por_hora, umbral_sesion_minutos=args.umbral_sesion,
+                                    total_mensajes=sum(autores.values()),
+                                    max_memoria=args.max_memoria * 2**20 if args.max_memoria else None,
+                                    memoria_frases=args.memoria_frases * 2**20, periodo=args.por_periodo,
+                                    al_cerrar_periodo=lambda periodo, resultados_periodo: guardar_periodo(args, periodo, resultados_periodo))
+    stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario = resultados
+
+    if not args.muestra:
+        print(f"📥 {analisis_global['num_mensajes']} mensajes analizados")
+
+    guardar_resultados(args, stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario)
+
+    if args.out_agregados and args.muestra:
+        print("⚠️ Los agregados fusionables no se guardan en modo muestra (sus conteos son estimaciones).")
+    elif args.out_agregados:
+        agregados = construir_agregados(analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario)
+        guardar_agregados(agregados, args.out_agregados)
+        print(f"🧩 Agregados fusionables guardados en {args.out_agregados}")
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
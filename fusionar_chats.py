@@ -0,0 +1,190 @@
+import os
+import json
+import argparse
+from collections import defaultdict, Counter
+from datetime import date
+import pandas as pd
+
+from analisis import (
+    CAMPOS_ADITIVOS_USUARIO, DIAS_SEMANA_NOMBRES, LIMITES_DURACION_SESION, NUM_TOP_EMOJIS_GLOBALES, NUM_TOP_FRASES_GLOBALES, añadir_argumentos_salida, guardar_resultados, guardar_agregados,
+    matriz_desde_conteos, calcular_tfidf, top_terminos_por_usuario, nuevos_dias_activos, marcar_dia_activo, resultados_dias_activos
+)
+from prepocessing import cargar_nickname_mapping
+
+def listar_agregados(rutas):
+    """
+    Expande las rutas de entrada: los directorios aportan sus archivos *_agregados.json
+    (no otros JSON, como el <chat>_stats.json que deja el servidor en la misma carpeta).
+    """
+    for ruta in rutas:
+        if os.path.isdir(ruta):
+            for nombre in sorted(os.listdir(ruta)):
+                if nombre.endswith("_agregados.json"):
+                    yield os.path.join(ruta, nombre)
+        else:
+            yield ruta
+
+def cargar_agregados(ruta):
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+def fusionar_agregados(lista_agregados, nickname_mapping):
+    """
+    Suma los agregados de varios chats (generados con analisis.py --out_agregados).
+    Los autores y los mencionados se unifican con el mapeo de apodos, de modo que
+    la misma persona con distinto nombre de contacto en cada chat cuente una sola vez.
+    """
+    usuarios = {}
+    menciones = defaultdict(Counter)
+    sesiones = {"num_sesiones": 0, "duracion": [0] * (len(LIMITES_DURACION_SESION) + 1), "participantes": Counter(), "mensajes": Counter()}
+
+    for agregados in lista_agregados:
+        for nombre, datos in agregados["usuarios"].items():
+            nombre = nickname_mapping.get(nombre, nombre)
+            if nombre not in usuarios:
+                usuarios[nombre] = {campo: 0 for campo in CAMPOS_ADITIVOS_USUARIO}
+                usuarios[nombre].update({"horas": [0] * 24, "dias_semana": [0] * 7, "meses": Counter(), "dias": Counter(), "palabras": Counter(), "emojis": Counter(), "frases": Counter()})
+            destino = usuarios[nombre]
+            for campo in CAMPOS_ADITIVOS_USUARIO:
+                destino[campo] += datos.get(campo, 0) # Agregados anteriores no tienen conteos de conversaciones
+            destino["horas"] = [a + b for a, b in zip(destino["horas"], datos["horas"])]
+            destino["dias_semana"] = [a + b for a, b in zip(destino["dias_semana"], datos["dias_semana"])]
+            destino["meses"].update(datos["meses"])
+            destino["dias"].update(datos.get("dias", {})) # Agregados anteriores no tienen serie diaria
+            destino["palabras"].update(datos["palabras"])
+            destino["emojis"].update(datos.get("emojis", {})) # Agregados anteriores no tienen emojis
+            destino["frases"].update(datos.get("frases", {})) # ni frases
+
+        for autor, mencionados in agregados["menciones"].items():
+            autor = nickname_mapping.get(autor, autor)
+            for mencionado, conteo in mencionados.items():
+                mencionado = nickname_mapping.get(mencionado, mencionado)
+                if mencionado != autor: # Tras unificar nombres pueden aparecer automenciones
+                    menciones[autor][mencionado] += conteo
+
+        if "sesiones" in agregados:
+            sesiones["num_sesiones"] += agregados["sesiones"]["num_sesiones"]
+            sesiones["duracion"] = [a + b for a, b in zip(sesiones["duracion"], agregados["sesiones"]["duracion"])]
+            sesiones["participantes"].update(agregados["sesiones"]["participantes"])
+            sesiones["mensajes"].update(agregados["sesiones"]["mensajes"])
+
+    return {
+        "version": 1,
+        "usuarios": usuarios,
+        "menciones": {autor: dict(mencionados) for autor, mencionados in menciones.items()},
+        "sesiones": sesiones,
+    }
+
+def resultados_desde_agregados(agregados, num_top=10):
+    """
+    Reconstruye a partir de los agregados las mismas estructuras que produce analisis.py,
+    para guardarlas con guardar_resultados y generar el dashboard con graficas.py.
+    """
+    usuarios = agregados["usuarios"]
+    menciones_por_autor = {autor: Counter(m) for autor, m in agregados["menciones"].items()}
+
+    matriz_palabras = matriz_desde_conteos({nombre: datos["palabras"] for nombre, datos in usuarios.items()})
+    palabras_caracteristicas = top_terminos_por_usuario(matriz_palabras, calcular_tfidf(matriz_palabras), num_top)
+
+    # Los días activos se reconstruyen desde la serie diaria de cada usuario, ya unificada entre chats
+    dias = nuevos_dias_activos()
+    for nombre, datos in usuarios.items():
+        for dia in datos.get("dias", {}):
+            marcar_dia_activo(dias, nombre, date.fromisoformat(dia))
+    dias_activos, copresencia = resultados_dias_activos(dias, usuarios)
+
+    stats_usuarios = []
+    for nombre, datos in usuarios.items():
+        top_menciones_hechas = menciones_por_autor.get(nombre, Counter()).most_common(3)
+        media_long = datos["total_longitud"] / datos["num_mensajes"] if datos["num_mensajes"] > 0 else 0
+        hora_fav = max(range(24), key=lambda h: datos["horas"][h]) if any(datos["horas"]) else None
+
+        stats_usuarios.append({
+            "nombre": nombre,
+            "num_mensajes": datos["num_mensajes"],
+            "num_palabras": datos["num_palabras"],
+            "media_longitud_mensaje": round(media_long, 2),
+            "hora_favorita": hora_fav,
+            "num_emojis": datos["num_emojis"],
+            "num_multimedia": datos["num_multimedia"],
+            "num_enlaces": datos["num_enlaces"],
+            "num_preguntas": datos["num_preguntas"],
+            "sesiones_iniciadas": datos.get("sesiones_iniciadas", 0),
+            "sesiones_cerradas": datos.get("sesiones_cerradas", 0),
+            "sesiones_participadas": datos.get("sesiones_participadas", 0),
+            "dias_activos": dias_activos[nombre][0],
+            "racha_max_dias": dias_activos[nombre][1],
+            "palabras_mas_usadas": str(Counter(datos["palabras"]).most_common(num_top)),
+            "palabras_caracteristicas": str(palabras_caracteristicas[nombre]),
+            "frases_mas_usadas": str(Counter(datos.get("frases", {})).most_common(num_top)),
+            "emojis_mas_usados": str(Counter(datos.get("emojis", {})).most_common(num_top)),
+            "menciones_hechas": ", ".join([f"{u} ({c})" for u, c in top_menciones_hechas])
+        })
+
+    nombres_ordenados = sorted(usuarios)
+    stats_mes = sorted(
+        ({"año": int(clave[:4]), "mes": int(clave[5:7]), "usuario": nombre, "num_mensajes": total}
+         for nombre, datos in usuarios.items() for clave, total in datos["meses"].items()),
+        key=lambda x: (x["año"], x["mes"], x["usuario"])
+    )
+    stats_diario = sorted(
+        ({"fecha": dia, "usuario": nombre, "num_mensajes": total}
+         for nombre, datos in usuarios.items() for dia, total in datos.get("dias", {}).items()),
+        key=lambda x: (x["fecha"], x["usuario"])
+    )
+    stats_horas = [{"hora": hora, "usuario": nombre, "num_mensajes": usuarios[nombre]["horas"][hora]}
+                   for hora in range(24) for nombre in nombres_ordenados]
+    stats_dia_semana = [{"dia_semana_num": dia, "dia_semana": DIAS_SEMANA_NOMBRES[dia], "usuario": nombre,
+                         "num_mensajes": usuarios[nombre]["dias_semana"][dia]}
+                        for dia in range(7) for nombre in nombres_ordenados]
+
+    menciones_globales = Counter()
+    for mencionados in menciones_por_autor.values():
+        menciones_globales.update(mencionados)
+    emojis_globales = Counter()
+    frases_globales = Counter()
+    for datos in usuarios.values():
+        emojis_globales.update(datos.get("emojis", {}))
+        frases_globales.update(datos.get("frases", {}))
+
+    df_menciones_por_autor = pd.DataFrame([
+        {"autor_mencionador": autor, "usuario_mencionado": mencionado, "conteo": conteo}
+        for autor, mencionados in menciones_por_autor.items() for mencionado, conteo in mencionados.items()
+    ])
+
+    analisis_global = {
+        "persona_mas_mencionada": menciones_globales.most_common(1)[0] if menciones_globales else None,
+        "todas_las_menciones_globales": menciones_globales.most_common(5),
+        "df_menciones_por_autor": df_menciones_por_autor,
+        "emojis_globales": emojis_globales.most_common(NUM_TOP_EMOJIS_GLOBALES),
+        # Suma de las candidatas de cada usuario: sin sketch global no hay cota de error
+        "frases_globales": frases_globales.most_common(NUM_TOP_FRASES_GLOBALES),
+        "error_frases": None,
+        "copresencia": copresencia,
+        "sesiones": agregados.get("sesiones", {"num_sesiones": 0, "duracion": [0] * (len(LIMITES_DURACION_SESION) + 1),
+                                               "participantes": {}, "mensajes": {}}),
+    }
+    return stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario
+
+def main():
+    parser = argparse.ArgumentParser(description="Fusiona los agregados de varios chats de WhatsApp en unas únicas estadísticas combinadas.")
+    parser.add_argument("agregados", nargs="+", help="Archivos JSON generados con analisis.py --out_agregados (o directorios que los contengan)")
+    parser.add_argument("--nicks", default="nickname_mapping.csv", help="Archivo CSV con apodos y nombres reales para unificar autores")
+    añadir_argumentos_salida(parser)
+    args = parser.parse_args()
+
+    nickname_mapping = cargar_nickname_mapping(args.nicks)
+    rutas = list(listar_agregados(args.agregados))
+    # Se carga un agregado cada vez: la memoria depende del tamaño del resultado, no del número de chats
+    agregados = fusionar_agregados((cargar_agregados(ruta) for ruta in rutas), nickname_mapping)
+    print(f"🧩 {len(rutas)} chats fusionados ({len(agregados['usuarios'])} usuarios)")
+
+    resultados = resultados_desde_agregados(agregados)
+    guardar_resultados(args, *resultados)
+
+    if args.out_agregados:
+        guardar_agregados(agregados, args.out_agregados)
+        print(f"🧩 Agregados fusionados guardados en {args.out_agregados}")
+
+if __name__ == "__main__":
+    main()
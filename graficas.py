@@ -1,10 +1,79 @@
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.colors import sequential
 import argparse
+import os
 import ast # Para convertir la string de lista de palabras a lista
 import re # Importar la librería de expresiones regulares
 import calendar
+import json
+import base64
+from html import escape
+from progreso import añadir_argumento_progreso, configurar_progreso, nuevo_progreso, informar_progreso, terminar_progreso
+
+# A partir de este número de participantes se activa automáticamente el modo grupo grande
+UMBRAL_GRUPO_GRANDE = 50
+# Usuarios que conservan su propia línea en modo grupo grande; el resto se agrupa en "otros"
+TOP_USUARIOS_GRUPO_GRANDE = 25
+ETIQUETA_OTROS = "otros"
+# Puntos máximos por serie en la línea temporal detallada (tras el submuestreo LTTB)
+PUNTOS_MAX_TIMELINE = 1500
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+# Por encima de este número de puntos las líneas se dibujan con WebGL (como render_mode="auto" de px)
+UMBRAL_PUNTOS_WEBGL = 1000
+
+# Colores y estilo de la plantilla "plotly" por defecto, reducida a lo que usan las gráficas del dashboard.
+# Se construye una sola vez y cada figura embebe ~1 KB de plantilla en lugar de los ~7 KB de la completa.
+PALETA = ["#636efa", "#EF553B", "#00cc96", "#ab63fa", "#FFA15A", "#19d3f3", "#FF6692", "#B6E880", "#FF97FF", "#FECB52"]
+EJE_PLANTILLA = dict(gridcolor="white", linecolor="white", ticks="", title=dict(standoff=15),
+                     zerolinecolor="white", zerolinewidth=2, automargin=True)
+PLANTILLA_DASHBOARD = go.layout.Template(
+    layout=dict(
+        autotypenumbers="strict", colorway=PALETA, font=dict(color="#2a3f5f"),
+        hovermode="closest", hoverlabel=dict(align="left"),
+        paper_bgcolor="white", plot_bgcolor="#E5ECF6", title=dict(x=0.05),
+        xaxis=EJE_PLANTILLA, yaxis=EJE_PLANTILLA,
+        coloraxis=dict(colorbar=dict(outlinewidth=0, ticks="")),
+    ),
+    data=dict(
+        bar=[go.Bar(marker=dict(line=dict(color="#E5ECF6", width=0.5)), error_x=dict(color="#2a3f5f"))],
+        pie=[go.Pie(automargin=True)],
+    ),
+)
+PLANTILLA_DASHBOARD_JSON = PLANTILLA_DASHBOARD.to_plotly_json()
+# Escala Viridis como pares [posición, color], la forma en que la deja el validador de Plotly
+ESCALA_VIRIDIS = [[i / (len(sequential.Viridis) - 1), color] for i, color in enumerate(sequential.Viridis)]
+
+# Validar cada traza y figura con Plotly es lo más lento de un dashboard pequeño (~0,3 s para ~25
+# figuras). Sin validación (ver configurar_figuras) trazas y figuras son diccionarios que se
+# serializan directamente; el servidor la desactiva porque sus figuras son siempre las mismas.
+CONFIGURACION_FIGURAS = {"validar": True}
+
+def configurar_figuras(validar=True):
+    """Activa o desactiva la validación de Plotly de las trazas y figuras de todo el proceso."""
+    CONFIGURACION_FIGURAS["validar"] = validar
+
+def preparar_datos(df_usuarios, df_mensual, df_horas, df_menciones_globales, df_dia_semana, df_menciones_por_autor):
+    """
+    Aplica a los DataFrames de estadísticas las conversiones de tipos que necesitan las gráficas
+    (fechas, horas y días de la semana ordenados). Sirve tanto para datos leídos de CSV como
+    para resultados en memoria (p. ej. desde servidor_analisis.py).
+
+    Returns:
+        tuple: Una tupla con los DataFrames preparados.
+    """
+    # Convierte las columnas de año y mes a un formato de fecha para la gráfica de línea.
+    df_mensual["fecha"] = pd.to_datetime(dict(year=df_mensual["año"], month=df_mensual["mes"], day=1))
+    
+    # Asegura que las horas estén ordenadas correctamente como una categoría.
+    df_horas['hora'] = pd.Categorical(df_horas['hora'], categories=range(24), ordered=True)
+
+    # Define el orden de los días de la semana para asegurar que se grafiquen correctamente.
+    df_dia_semana['dia_semana'] = pd.Categorical(df_dia_semana['dia_semana'], categories=DIAS_SEMANA, ordered=True)
+
+    return df_usuarios, df_mensual, df_horas, df_menciones_globales, df_dia_semana, df_menciones_por_autor
 
 def cargar_datos(usuarios_csv, mensual_csv, horas_csv, menciones_globales_csv, dia_semana_csv, menciones_por_autor_csv):
     """
@@ -23,30 +92,172 @@ def cargar_datos(usuarios_csv, mensual_csv, horas_csv, menciones_globales_csv, d
     """
     df_usuarios = pd.read_csv(usuarios_csv)
     df_mensual = pd.read_csv(mensual_csv)
-    # Convierte las columnas de año y mes a un formato de fecha para la gráfica de línea.
-    df_mensual["fecha"] = pd.to_datetime(dict(year=df_mensual["año"], month=df_mensual["mes"], day=1))
-    
     df_horas = pd.read_csv(horas_csv)
-    # Asegura que las horas estén ordenadas correctamente como una categoría.
-    df_horas['hora'] = pd.Categorical(df_horas['hora'], categories=range(24), ordered=True)
-
-   
-
     df_dia_semana = pd.read_csv(dia_semana_csv)
-    # Define el orden de los días de la semana para asegurar que se grafiquen correctamente.
-    dias_orden = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-    df_dia_semana['dia_semana'] = pd.Categorical(df_dia_semana['dia_semana'], categories=dias_orden, ordered=True)
-
     df_menciones_globales = pd.read_csv(menciones_globales_csv) if menciones_globales_csv else pd.DataFrame()
     df_menciones_por_autor = pd.read_csv(menciones_por_autor_csv) if menciones_por_autor_csv else pd.DataFrame()
 
-    return df_usuarios, df_mensual, df_horas, df_menciones_globales, df_dia_semana, df_menciones_por_autor
+    return preparar_datos(df_usuarios, df_mensual, df_horas, df_menciones_globales, df_dia_semana, df_menciones_por_autor)
+
+def seleccionar_usuarios_top(df_usuarios, top_usuarios):
+    """Devuelve los nombres de los `top_usuarios` usuarios con más mensajes."""
+    return df_usuarios.nlargest(top_usuarios, "num_mensajes")["nombre"].tolist()
+
+def agrupar_otros(df, usuarios_top, columna_usuario="usuario", columna_valor="num_mensajes"):
+    """
+    Agrupa en una única categoría "otros" a los usuarios que no están en `usuarios_top`,
+    sumando `columna_valor`. Si `usuarios_top` es None devuelve el DataFrame sin cambios.
+    """
+    if usuarios_top is None:
+        return df
+    df = df.copy()
+    df[columna_usuario] = df[columna_usuario].where(df[columna_usuario].isin(usuarios_top), ETIQUETA_OTROS)
+    claves = [columna for columna in df.columns if columna != columna_valor]
+    return df.groupby(claves, as_index=False, observed=True, sort=False)[columna_valor].sum()
+
+def totales_por_usuario(df_usuario, usuarios_top):
+    """Totales de mensajes por usuario (columna `total_mensajes`), con la cola agrupada en "otros"."""
+    df_tot = agrupar_otros(df_usuario[['nombre', 'num_mensajes']], usuarios_top, columna_usuario='nombre')
+    return df_tot.rename(columns={'num_mensajes': 'total_mensajes'})
+
+def clase_trazo_lineas(webgl, num_puntos):
+    """Traza de líneas: WebGL (Scattergl) para grupos grandes o series con muchos puntos, SVG en otro caso."""
+    return go.Scattergl if webgl or num_puntos > UMBRAL_PUNTOS_WEBGL else go.Scatter
+
+def nueva_traza(clase, **propiedades):
+    """Traza de la clase de go indicada (go.Bar, go.Scatter...), o su diccionario si no se valida."""
+    if CONFIGURACION_FIGURAS["validar"]:
+        return clase(**propiedades)
+    return dict(propiedades, type=clase.__name__.lower())
+
+def nueva_figura(trazos, titulo, titulo_x=None, titulo_y=None, leyenda=None, **layout):
+    """
+    Crea la figura con sus trazas y la plantilla reducida del dashboard en una sola validación.
+
+    Args:
+        trazos (list): Trazas de go ya construidas.
+        titulo (str): Título de la gráfica.
+        titulo_x, titulo_y (str): Títulos de los ejes, si los hay.
+        leyenda (str): Título de la leyenda, si las trazas son grupos (p. ej. "usuario").
+        **layout: Resto de opciones del layout (ejes, barmode, ...); `xaxis`/`yaxis` se combinan con los títulos.
+
+    Returns:
+        go.Figure, o {"data", "layout"} sin validar si así se ha configurado (ver configurar_figuras).
+    """
+    validar = CONFIGURACION_FIGURAS["validar"]
+    layout = dict(layout, template=PLANTILLA_DASHBOARD if validar else PLANTILLA_DASHBOARD_JSON, title=dict(text=titulo))
+    for eje, texto in (("xaxis", titulo_x), ("yaxis", titulo_y)):
+        if texto is not None:
+            layout[eje] = dict(layout.get(eje, {}), title=dict(text=texto))
+    if leyenda is not None:
+        layout["legend"] = dict(title=dict(text=leyenda), tracegroupgap=0)
+    if not validar:
+        return {"data": list(trazos), "layout": layout}
+    return go.Figure(data=trazos, layout=layout)
+
+def fechas_compactas(fechas, frecuencia="D"):
+    """Fechas como texto "AAAA-MM-DD" (o "AAAA-MM-DD HH:00"): la mitad de caracteres que el ISO completo en el JSON."""
+    return pd.DatetimeIndex(fechas).strftime("%Y-%m-%d %H:00" if frecuencia == "h" else "%Y-%m-%d").to_numpy()
+
+def valores_eje(columna):
+    """Valores de una columna como array NumPy: fechas compactas, categorías por su valor y el resto tal cual."""
+    if pd.api.types.is_datetime64_any_dtype(columna):
+        return fechas_compactas(columna)
+    return np.asarray(columna)
+
+def grupos_por_usuario(usuarios):
+    """
+    Agrupa las filas por usuario en orden de primera aparición (el orden de colores de la leyenda).
+    Devuelve los nombres de los usuarios y, para cada uno, los índices de sus filas en el orden original.
+    """
+    codigos, nombres = pd.factorize(np.asarray(usuarios))
+    orden = np.argsort(codigos, kind="stable")
+    limites = np.searchsorted(codigos[orden], np.arange(len(nombres) + 1))
+    return nombres, [orden[limites[i]:limites[i + 1]] for i in range(len(nombres))]
+
+def trazos_lineas_por_usuario(df, x, y, etiqueta_x, etiqueta_y, webgl=False):
+    """
+    Una traza de líneas con marcadores por usuario, construida directamente desde arrays NumPy,
+    con el color de PALETA por orden de aparición y ayuda emergente "usuario=…<br>eje x=…<br>eje y=…".
+    """
+    clase = clase_trazo_lineas(webgl, len(df))
+    xs, ys = valores_eje(df[x]), df[y].to_numpy()
+    nombres, grupos = grupos_por_usuario(df["usuario"])
+    return [
+        nueva_traza(clase, x=xs[filas], y=ys[filas], mode="lines+markers", name=str(usuario), legendgroup=str(usuario),
+                    line=dict(color=PALETA[i % len(PALETA)]),
+                    hovertemplate=f"usuario={usuario}<br>{etiqueta_x}=%{{x}}<br>{etiqueta_y}=%{{y}}<extra></extra>")
+        for i, (usuario, filas) in enumerate(zip(nombres, grupos))
+    ]
+
+def figura_barras_horizontales(df, columna, titulo, eje_x, eje_y, **opciones_barra):
+    """Barras horizontales de `columna` por usuario, ordenadas de mayor a menor, en el primer color de la paleta."""
+    df_sorted = df.sort_values(columna, ascending=False)
+    barras = nueva_traza(go.Bar, x=df_sorted[columna].to_numpy(), y=df_sorted["nombre"].to_numpy(), orientation="h",
+                         marker=dict(color=PALETA[0]), showlegend=False,
+                         hovertemplate=f"{eje_x}=%{{x}}<br>{eje_y}=%{{y}}<extra></extra>", **opciones_barra)
+    return nueva_figura([barras], titulo, eje_x, eje_y, barmode="relative")
+
+def cociente_por_mensaje(df, columna):
+    """`columna` dividida entre los mensajes de cada usuario (0 si no tiene mensajes), en una división vectorizada."""
+    mensajes = df["num_mensajes"].to_numpy(dtype=float)
+    return np.divide(df[columna].to_numpy(dtype=float), mensajes, out=np.zeros(len(df)), where=mensajes > 0)
+
+def proporcion_sobre_total(df, df_usuario, usuarios_top, columna="num_mensajes"):
+    """Mensajes de cada fila entre el total de su usuario (con la cola sumada en "otros" en modo grupo grande)."""
+    totales = totales_por_usuario(df_usuario, usuarios_top).groupby("nombre")["total_mensajes"].sum()
+    return df[columna].to_numpy() / df["usuario"].map(totales).to_numpy(dtype=float)
+
+def preparar_actividad_diaria(df_diario):
+    """
+    Prepara el DataFrame de mensajes por día (o por hora) y usuario.
+    Devuelve el DataFrame con la fecha convertida y la frecuencia de la serie ("D" o "h").
+    """
+    frecuencia = "h" if df_diario["fecha"].astype(str).str.len().max() > 10 else "D"
+    df_diario["fecha"] = pd.to_datetime(df_diario["fecha"])
+    return df_diario, frecuencia
+
+def cargar_actividad_diaria(diario_csv):
+    """Carga el CSV de mensajes por día (o por hora) y usuario generado con analisis.py --out_diario."""
+    return preparar_actividad_diaria(pd.read_csv(diario_csv))
+
+def lttb_indices(y, n_puntos):
+    """
+    Largest-Triangle-Three-Buckets: elige `n_puntos` índices de una serie equiespaciada
+    que conservan su forma visual (picos incluidos). Devuelve los índices seleccionados.
+    """
+    n = len(y)
+    if n_puntos >= n or n_puntos < 3:
+        return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    # n_puntos - 2 cubos entre el primer y el último punto, que se conservan siempre
+    limites = np.linspace(1, n - 1, n_puntos - 1).astype(np.int64)
+    indices = np.empty(n_puntos, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    # Media de cada cubo en una sola pasada, en lugar de una llamada a mean() por cubo
+    bordes = np.append(limites, n)
+    medias = np.add.reduceat(y, bordes[:-1]) / np.diff(bordes)
+    posiciones = np.arange(n)
+
+    a = 0
+    for i in range(n_puntos - 2):
+        inicio, fin = limites[i], limites[i + 1]
+        siguiente_fin = bordes[i + 2]
+        media_x = (fin + siguiente_fin - 1) / 2 # Media de los índices del cubo siguiente
+        media_y = medias[i + 1]
+        x_cubo = posiciones[inicio:fin]
+        areas = np.abs((a - media_x) * (y[inicio:fin] - y[a]) - (a - x_cubo) * (media_y - y[a]))
+        a = inicio + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
 
 def grafica_pie_mensajes(df):
     """
     Genera un gráfico de pastel del porcentaje de mensajes por usuario.
     """
-    fig = px.pie(df, names="nombre", values="num_mensajes", title="📊 Porcentaje de mensajes por usuario")
+    pastel = nueva_traza(go.Pie, labels=df["nombre"].to_numpy(), values=df["num_mensajes"].to_numpy(), name="",
+                         hovertemplate="nombre=%{label}<br>num_mensajes=%{value}<extra></extra>")
+    fig = nueva_figura([pastel], "📊 Porcentaje de mensajes por usuario", legend=dict(tracegroupgap=0))
     return fig
 
 def grafica_linea_mensajes_por_mes_agregado(df):
@@ -57,17 +268,41 @@ def grafica_linea_mensajes_por_mes_agregado(df):
     df_agg = df.groupby('fecha', as_index=False).agg(num_mensajes=('num_mensajes', 'sum'))
     
     # Gráfico con una sola línea (sin distinción por usuario)
-    fig = px.line(
-        df_agg,
-        x="fecha",
-        y="num_mensajes",
-        markers=True,
-        title="📈 Total de mensajes por mes (todos los usuarios)",
-        labels={
-            "fecha": "Mes",
-            "num_mensajes": "Número de mensajes (total)"
-        }
+    linea = nueva_traza(
+        clase_trazo_lineas(False, len(df_agg)), x=fechas_compactas(df_agg["fecha"]), y=df_agg["num_mensajes"].to_numpy(),
+        mode="lines+markers", line=dict(color=PALETA[0]), showlegend=False,
+        hovertemplate="Mes=%{x}<br>Número de mensajes (total)=%{y}<extra></extra>"
     )
+    fig = nueva_figura([linea], "📈 Total de mensajes por mes (todos los usuarios)", "Mes", "Número de mensajes (total)")
+    return fig
+
+def grafica_timeline_actividad(df_diario, frecuencia="D", puntos_max=PUNTOS_MAX_TIMELINE, usuarios_top=None, webgl=False):
+    """
+    Genera una línea temporal detallada (por día u hora) del total de mensajes y de cada usuario.
+    Cada serie se rellena con ceros y se submuestrea con LTTB a `puntos_max` puntos, así que
+    el tamaño del HTML no crece con la duración del chat y los picos siguen siendo visibles.
+    Las líneas de usuario empiezan ocultas (se activan desde la leyenda).
+    """
+    if df_diario.empty:
+        return nueva_figura([], "📅 Actividad detallada (No hay datos)")
+
+    df = agrupar_otros(df_diario, usuarios_top)
+    fechas = pd.date_range(df["fecha"].min(), df["fecha"].max(), freq=frecuencia)
+    matriz = df.pivot_table(index="fecha", columns="usuario", values="num_mensajes", aggfunc="sum", fill_value=0)
+    matriz = matriz.reindex(fechas, fill_value=0)
+    textos_fechas = fechas_compactas(fechas, frecuencia)
+
+    Trazo = go.Scattergl if webgl else go.Scatter
+    series = [("Total", matriz.to_numpy().sum(axis=1), True)]
+    series += [(usuario, matriz[usuario].to_numpy(), "legendonly") for usuario in matriz.columns]
+    trazos = []
+    for nombre, valores, visible in series:
+        indices = lttb_indices(valores, puntos_max)
+        trazos.append(nueva_traza(Trazo, x=textos_fechas[indices], y=valores[indices], mode="lines", name=str(nombre), visible=visible))
+
+    unidad = "hora" if frecuencia == "h" else "día"
+    fig = nueva_figura(trazos, f"📅 Actividad detallada por {unidad}", "Fecha", f"Mensajes por {unidad}",
+                       xaxis=dict(rangeslider=dict(visible=True)))
     return fig
 
 def grafica_barras(df, columna, titulo, eje_x, eje_y):
@@ -81,16 +316,7 @@ def grafica_barras(df, columna, titulo, eje_x, eje_y):
         eje_x (str): Etiqueta del eje X.
         eje_y (str): Etiqueta del eje Y.
     """
-    # Ordenar el DataFrame de mayor a menor según la columna especificada
-    df_sorted = df.sort_values(columna, ascending=False)
-    fig = px.bar(
-        df_sorted,
-        x=columna, y="nombre",
-        orientation='h', # Barras horizontales
-        title=titulo,
-        labels={columna: eje_x, "nombre": eje_y}
-    )
-    return fig
+    return figura_barras_horizontales(df, columna, titulo, eje_x, eje_y)
 
 
 
@@ -102,40 +328,35 @@ def grafica_longitud_promedio(df):
     # Ordenar el DataFrame por la longitud promedio de mensaje de mayor a menor
     df_sorted = df.sort_values("media_longitud_mensaje", ascending=False)
     promedio_global = df_sorted["media_longitud_mensaje"].mean() # Calcular el promedio global después de ordenar
+    nombres = df_sorted["nombre"].to_numpy()
     
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        x=df_sorted["nombre"], # Usar el DataFrame ordenado
-        y=df_sorted["media_longitud_mensaje"], # Usar el DataFrame ordenado
+    barras = nueva_traza(
+        go.Bar,
+        x=nombres, # Usar el DataFrame ordenado
+        y=df_sorted["media_longitud_mensaje"].to_numpy(), # Usar el DataFrame ordenado
         name="Promedio por usuario",
-        marker_color="indianred"
-    ))
-    fig.add_trace(go.Scatter(
-        x=df_sorted["nombre"], # Usar el DataFrame ordenado para alinear la línea de promedio global
-        y=[promedio_global] * len(df_sorted),
+        marker=dict(color="indianred")
+    )
+    linea = nueva_traza(
+        go.Scatter,
+        x=nombres, # Usar el DataFrame ordenado para alinear la línea de promedio global
+        y=np.full(len(df_sorted), promedio_global),
         mode="lines",
         name=f"Promedio global ({promedio_global:.2f})",
         line=dict(color="gray", dash="dash")
-    ))
-    fig.update_layout(
-        title="📏 Longitud promedio de mensaje por usuario",
-        yaxis_title="Longitud promedio de mensaje"
     )
+    fig = nueva_figura([barras, linea], "📏 Longitud promedio de mensaje por usuario",
+                       titulo_y="Longitud promedio de mensaje")
     return fig
 
 def grafica_emojis_por_mensaje(df):
     """
     Genera un gráfico de barras del promedio de emojis por mensaje, ordenado.
     """
-    df["emojis_por_mensaje"] = df.apply(
-        lambda row: row["num_emojis"] / row["num_mensajes"] if row["num_mensajes"] > 0 else 0,
-        axis=1
-    )
+    df["emojis_por_mensaje"] = cociente_por_mensaje(df, "num_emojis")
     # Ordenar y graficar horizontalmente
-    df_sorted = df.sort_values("emojis_por_mensaje", ascending=False)
-    fig = px.bar(df_sorted, x="emojis_por_mensaje", y="nombre", orientation='h',
-                  title="🤪 Promedio de emojis por mensaje",
-                  labels={"nombre": "Usuario", "emojis_por_mensaje": "Emojis por mensaje"})
+    fig = figura_barras_horizontales(df, "emojis_por_mensaje", "🤪 Promedio de emojis por mensaje",
+                                     "Emojis por mensaje", "Usuario")
     return fig
 
 def grafica_top_hablante_mes(df):
@@ -143,8 +364,17 @@ def grafica_top_hablante_mes(df):
     Genera un gráfico de barras del usuario con más mensajes cada mes.
     """
     top_por_mes = df.loc[df.groupby("fecha")["num_mensajes"].idxmax()]
-    fig = px.bar(top_por_mes, x="fecha", y="num_mensajes", color="usuario",
-                  title="👑 Usuario con más mensajes cada mes")
+    fechas = fechas_compactas(top_por_mes["fecha"])
+    conteos = top_por_mes["num_mensajes"].to_numpy()
+    nombres, grupos = grupos_por_usuario(top_por_mes["usuario"])
+    barras = [
+        nueva_traza(go.Bar, x=fechas[filas], y=conteos[filas], name=str(usuario), legendgroup=str(usuario),
+                    marker=dict(color=PALETA[i % len(PALETA)]),
+                    hovertemplate=f"usuario={usuario}<br>fecha=%{{x}}<br>num_mensajes=%{{y}}<extra></extra>")
+        for i, (usuario, filas) in enumerate(zip(nombres, grupos))
+    ]
+    fig = nueva_figura(barras, "👑 Usuario con más mensajes cada mes", "fecha", "num_mensajes",
+                       leyenda="usuario", barmode="relative")
     return fig
 
 
@@ -152,168 +382,113 @@ def grafica_enlaces_por_mensaje(df):
     """
     Genera un gráfico de barras del promedio de enlaces por mensaje, ordenado.
     """
-    df["enlaces_por_mensaje"] = df.apply(
-        lambda row: row["num_enlaces"] / row["num_mensajes"] if row["num_mensajes"] > 0 else 0,
-        axis=1
-    )
+    df["enlaces_por_mensaje"] = cociente_por_mensaje(df, "num_enlaces")
     # Ordenar y graficar horizontalmente
-    df_sorted = df.sort_values("enlaces_por_mensaje", ascending=False)
-    fig = px.bar(df_sorted, x="enlaces_por_mensaje", y="nombre", orientation='h',
-                  title="🔗 Promedio de enlaces por mensaje",
-                  labels={"nombre": "Usuario", "enlaces_por_mensaje": "Enlaces por mensaje"})
+    fig = figura_barras_horizontales(df, "enlaces_por_mensaje", "🔗 Promedio de enlaces por mensaje",
+                                     "Enlaces por mensaje", "Usuario")
     return fig
 
 def grafica_multimedia_por_mensaje(df):
     """
     Genera un gráfico de barras del promedio de elementos multimedia por mensaje, ordenado.
     """
-    df["multimedia_por_mensaje"] = df.apply(
-        lambda row: row["num_multimedia"] / row["num_mensajes"] if row["num_mensajes"] > 0 else 0,
-        axis=1
-    )
+    df["multimedia_por_mensaje"] = cociente_por_mensaje(df, "num_multimedia")
     # Ordenar y graficar horizontalmente
-    df_sorted = df.sort_values("multimedia_por_mensaje", ascending=False)
-    fig = px.bar(df_sorted, x="multimedia_por_mensaje", y="nombre", orientation='h',
-                  title="🖼️ Promedio de elementos multimedia por mensaje",
-                  labels={"nombre": "Usuario", "multimedia_por_mensaje": "Multimedia por mensaje"})
+    fig = figura_barras_horizontales(df, "multimedia_por_mensaje", "🖼️ Promedio de elementos multimedia por mensaje",
+                                     "Multimedia por mensaje", "Usuario")
     return fig
 
 def grafica_preguntas_por_mensaje(df):
     """
     Genera un gráfico de barras del promedio de preguntas por mensaje, ordenado.
     """
-    df["preguntas_por_mensaje"] = df.apply(
-        lambda row: row["num_preguntas"] / row["num_mensajes"] if row["num_mensajes"] > 0 else 0,
-        axis=1
-    )
+    df["preguntas_por_mensaje"] = cociente_por_mensaje(df, "num_preguntas")
     # Ordenar y graficar horizontalmente
-    df_sorted = df.sort_values("preguntas_por_mensaje", ascending=False)
-    fig = px.bar(df_sorted, x="preguntas_por_mensaje", y="nombre", orientation='h',
-                 title="❓ Promedio de preguntas por mensaje",
-                 labels={"nombre": "Usuario", "preguntas_por_mensaje": "Preguntas por mensaje"})
+    fig = figura_barras_horizontales(df, "preguntas_por_mensaje", "❓ Promedio de preguntas por mensaje",
+                                     "Preguntas por mensaje", "Usuario")
     return fig
 
 
 
-def grafica_mensajes_por_dia_semana(df):
+def grafica_mensajes_por_dia_semana(df, usuarios_top=None, webgl=False):
     """
     Gráfico de líneas de la actividad por día de la semana y usuario.
     """
-    fig = px.line(df, x="dia_semana", y="num_mensajes", color="usuario", markers=True,
-                  title="🗓️ Mensajes por día de la semana por usuario",
-                  labels={"dia_semana": "Día de la semana", "num_mensajes": "Número de mensajes"})
+    df = agrupar_otros(df, usuarios_top)
+    trazos = trazos_lineas_por_usuario(df, "dia_semana", "num_mensajes", "Día de la semana", "Número de mensajes", webgl)
     # Asegurarse de que los días estén ordenados en el eje X
-    fig.update_xaxes(categoryorder='array', categoryarray=["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"])
+    fig = nueva_figura(trazos, "🗓️ Mensajes por día de la semana por usuario", "Día de la semana", "Número de mensajes",
+                       leyenda="usuario", xaxis=dict(categoryorder='array', categoryarray=DIAS_SEMANA))
     return fig
 
-def grafica_linea_mensajes_por_mes(df):
+def grafica_linea_mensajes_por_mes(df, usuarios_top=None, webgl=False):
     """
     Genera un gráfico de líneas de mensajes por mes por usuario.
     """
-    fig = px.line(df, x="fecha", y="num_mensajes", color="usuario", markers=True,
-                  title="📈 Mensajes por mes por usuario")
+    df = agrupar_otros(df, usuarios_top)
+    trazos = trazos_lineas_por_usuario(df, "fecha", "num_mensajes", "fecha", "num_mensajes", webgl)
+    fig = nueva_figura(trazos, "📈 Mensajes por mes por usuario", "fecha", "num_mensajes", leyenda="usuario")
     return fig
 
-def grafica_linea_mensajes_por_hora(df):
+def grafica_linea_mensajes_por_hora(df, usuarios_top=None, webgl=False):
     """
     Genera un gráfico de líneas de mensajes por hora del día por usuario.
     """
-    fig = px.line(df, x="hora", y="num_mensajes", color="usuario", markers=True,
-                  title="⏰ Mensajes por hora del día por usuario",
-                  labels={"hora": "Hora del día (0-23)", "num_mensajes": "Número de mensajes"})
+    df = agrupar_otros(df, usuarios_top)
+    trazos = trazos_lineas_por_usuario(df, "hora", "num_mensajes", "Hora del día (0-23)", "Número de mensajes", webgl)
     # Asegura que todas las horas de 0 a 23 estén en el eje X.
-    fig.update_xaxes(
-        tickmode='array',
-        tickvals=list(range(24)),
-        title_text="Hora del día (0-23)"
-    )
+    fig = nueva_figura(trazos, "⏰ Mensajes por hora del día por usuario", "Hora del día (0-23)", "Número de mensajes",
+                       leyenda="usuario", xaxis=dict(tickmode='array', tickvals=list(range(24))))
     return fig
 
 
-def grafica_linea_mensajes_por_hora_normalizado(df_hora, df_usuario):
+def grafica_linea_mensajes_por_hora_normalizado(df_hora, df_usuario, usuarios_top=None, webgl=False):
     """
     Genera un gráfico de líneas de mensajes por hora del día,
     normalizado por el total de mensajes de cada usuario.
     """
-    # 1. Renombrar la columna de totales
-    df_tot = df_usuario.rename(columns={'num_mensajes': 'total_mensajes'})
-
-    # 2. Merge
-    df = df_hora.merge(
-        df_tot[['nombre', 'total_mensajes']],
-        left_on='usuario',
-        right_on='nombre',
-        how='left'
-    )
-
-    # 3. Calcular ratio
-    df['ratio'] = df['num_mensajes'] / df['total_mensajes']
-
-    # 4. Gráfico
-    fig = px.line(
-        df,
-        x="hora",
-        y="ratio",
-        color="usuario",
-        markers=True,
-        title="⏰ Proporción de mensajes por hora sobre el total por usuario",
-        labels={
-            "hora": "Hora del día (0-23)",
-            "ratio": "Mensajes / Total mensajes"
-        }
+    # 1. Ratio sobre el total de cada usuario (con la cola agrupada en "otros" en modo grupo grande)
+    df = agrupar_otros(df_hora, usuarios_top)
+    df = df.assign(ratio=proporcion_sobre_total(df, df_usuario, usuarios_top))
+
+    # 2. Gráfico
+    trazos = trazos_lineas_por_usuario(df, "hora", "ratio", "Hora del día (0-23)", "Mensajes / Total mensajes", webgl)
+    fig = nueva_figura(
+        trazos,
+        "⏰ Proporción de mensajes por hora sobre el total por usuario",
+        "Hora del día (0-23)",
+        "Mensajes / Total mensajes",
+        leyenda="usuario",
+        xaxis=dict(tickmode='array', tickvals=list(range(24))),
+        yaxis=dict(tickformat=".0%") # muestra el ratio en %
     )
-    fig.update_xaxes(
-        tickmode='array',
-        tickvals=list(range(24)),
-        title_text="Hora del día (0-23)"
-    )
-    fig.update_yaxes(tickformat=".0%")  # opcional: muestra el ratio en %
     return fig
 
 
-def grafica_mensajes_por_dia_semana_normalizado(df_dia, df_usuario):
+def grafica_mensajes_por_dia_semana_normalizado(df_dia, df_usuario, usuarios_top=None, webgl=False):
     """
     Genera un gráfico de líneas de la actividad por día de la semana,
     normalizado por el total de mensajes de cada usuario.
     """
-    # 1. Renombrar la columna de totales
-    df_tot = df_usuario.rename(columns={'num_mensajes': 'total_mensajes'})
+    # 1. Ratio sobre el total de cada usuario (con la cola agrupada en "otros" en modo grupo grande)
+    df = agrupar_otros(df_dia, usuarios_top)
+    df = df.assign(ratio=proporcion_sobre_total(df, df_usuario, usuarios_top))
     
-    # 2. Merge con df_dia (tiene columnas dia_semana, usuario, num_mensajes)
-    df = df_dia.merge(
-        df_tot[['nombre', 'total_mensajes']],
-        left_on='usuario',
-        right_on='nombre',
-        how='left'
+    # 2. Gráfico, con los días de la semana ordenados y porcentajes en el eje Y
+    trazos = trazos_lineas_por_usuario(df, "dia_semana", "ratio", "Día de la semana", "Mensajes / Total mensajes", webgl)
+    fig = nueva_figura(
+        trazos,
+        "🗓️ Proporción de mensajes por día de la semana por usuario",
+        "Día de la semana",
+        "Mensajes / Total mensajes",
+        leyenda="usuario",
+        xaxis=dict(categoryorder='array', categoryarray=DIAS_SEMANA),
+        yaxis=dict(tickformat=".0%")
     )
-    
-    # 3. Calcular ratio
-    df['ratio'] = df['num_mensajes'] / df['total_mensajes']
-    
-    # 4. Gráfico
-    fig = px.line(
-        df,
-        x="dia_semana",
-        y="ratio",
-        color="usuario",
-        markers=True,
-        title="🗓️ Proporción de mensajes por día de la semana por usuario",
-        labels={
-            "dia_semana": "Día de la semana",
-            "ratio": "Mensajes / Total mensajes"
-        }
-    )
-    # Ordenar los días de la semana
-    fig.update_xaxes(
-        categoryorder='array',
-        categoryarray=["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-    )
-    # Mostrar porcentajes
-    fig.update_yaxes(tickformat=".0%")
     return fig
 
 
-def grafica_linea_mensajes_por_mes_normalizado(df_mes, df_usuario):
+def grafica_linea_mensajes_por_mes_normalizado(df_mes, df_usuario, usuarios_top=None, webgl=False):
     """
     Genera un gráfico de líneas de mensajes por mes,
     normalizado por el total de mensajes de cada usuario.
@@ -323,39 +498,18 @@ def grafica_linea_mensajes_por_mes_normalizado(df_mes, df_usuario):
       - usuario
       - num_mensajes
     """
-    # 1. Renombrar la columna de totales
-    df_tot = df_usuario.rename(columns={'num_mensajes': 'total_mensajes'})
-    
-    # 2. Merge con df_mes
-    df = df_mes.merge(
-        df_tot[['nombre', 'total_mensajes']],
-        left_on='usuario',
-        right_on='nombre',
-        how='left'
-    )
-    
-    # 3. Calcular ratio
-    df['ratio'] = df['num_mensajes'] / df['total_mensajes']
+    # 1. Ratio sobre el total de cada usuario (con la cola agrupada en "otros" en modo grupo grande)
+    df = agrupar_otros(df_mes, usuarios_top)
+    df = df.assign(ratio=proporcion_sobre_total(df, df_usuario, usuarios_top))
     
-    # 4. Gráfico
-    fig = px.line(
-        df,
-        x="fecha",
-        y="ratio",
-        color="usuario",
-        markers=True,
-        title="📈 Proporción de mensajes por mes por usuario",
-        labels={
-            "fecha": "Mes",
-            "ratio": "Mensajes / Total mensajes"
-        }
-    )
-    # Opcional: formatear el eje Y como porcentaje
-    fig.update_yaxes(tickformat=".0%")
+    # 2. Gráfico, con el eje Y como porcentaje
+    trazos = trazos_lineas_por_usuario(df, "fecha", "ratio", "Mes", "Mensajes / Total mensajes", webgl)
+    fig = nueva_figura(trazos, "📈 Proporción de mensajes por mes por usuario", "Mes", "Mensajes / Total mensajes",
+                       leyenda="usuario", yaxis=dict(tickformat=".0%"))
     return fig
 
 
-def grafica_linea_mensajes_por_mes_del_anyo_normalizado(df_mes, df_usuario):
+def grafica_linea_mensajes_por_mes_del_anyo_normalizado(df_mes, df_usuario, usuarios_top=None, webgl=False):
     """
     Genera un gráfico de líneas de mensajes por mes del año (enero–diciembre),
     normalizado por el total de mensajes de cada usuario.
@@ -370,7 +524,7 @@ def grafica_linea_mensajes_por_mes_del_anyo_normalizado(df_mes, df_usuario):
         * num_mensajes: total de mensajes del usuario.
     """
     # 1. Asegurar que 'fecha' es datetime y extraer mes numérico
-    df = df_mes.copy()
+    df = agrupar_otros(df_mes, usuarios_top).copy()
     df['fecha'] = pd.to_datetime(df['fecha'])
     df['mes'] = df['fecha'].dt.month
     
@@ -378,127 +532,291 @@ def grafica_linea_mensajes_por_mes_del_anyo_normalizado(df_mes, df_usuario):
     df_agg = (
         df
         .groupby(['usuario', 'mes'], as_index=False)
-        .agg(num_mensajes_mes=('num_mensajes', 'sum'))
+        .agg(num_mensajes=('num_mensajes', 'sum'))
     )
     
-    # 3. Renombrar totales y merge
-    df_tot = df_usuario.rename(columns={'num_mensajes': 'total_mensajes'})
-    df_merged = df_agg.merge(
-        df_tot[['nombre', 'total_mensajes']],
-        left_on='usuario',
-        right_on='nombre',
-        how='left'
-    )
-    
-    # 4. Calcular ratio
-    df_merged['ratio'] = df_merged['num_mensajes_mes'] / df_merged['total_mensajes']
+    # 3. Ratio sobre el total de cada usuario
+    df_agg['ratio'] = proporcion_sobre_total(df_agg, df_usuario, usuarios_top)
     
-    # 5. Traducir mes numérico a nombre (opcional)
-    df_merged['mes_nombre'] = df_merged['mes'].apply(lambda m: calendar.month_name[m].capitalize())
-    
-    # 6. Orden de meses
+    # 4. Traducir mes numérico a nombre indexando un array con los nombres (sin apply por fila)
     orden = [calendar.month_name[i].capitalize() for i in range(1, 13)]
+    df_agg['mes_nombre'] = np.array([""] + orden)[df_agg['mes'].to_numpy()]
     
-    # 7. Gráfico
-    fig = px.line(
-        df_merged,
-        x="mes_nombre",
-        y="ratio",
-        color="usuario",
-        markers=True,
-        title="📊 Proporción de mensajes por mes del año por usuario",
-        labels={
-            "mes_nombre": "Mes",
-            "ratio": "Mensajes / Total mensajes"
-        }
+    # 5. Gráfico, con los meses en orden
+    trazos = trazos_lineas_por_usuario(df_agg, "mes_nombre", "ratio", "Mes", "Mensajes / Total mensajes", webgl)
+    fig = nueva_figura(trazos, "📊 Proporción de mensajes por mes del año por usuario", "Mes", "Mensajes / Total mensajes",
+                       leyenda="usuario", xaxis=dict(categoryorder='array', categoryarray=orden),
+                       yaxis=dict(tickformat=".0%"))
+    return fig
+
+
+def grafica_sesiones_por_usuario(df, usuarios_top=None):
+    """
+    Genera un gráfico de barras agrupadas con las conversaciones que inicia y que cierra
+    cada usuario, ordenado por conversaciones iniciadas.
+    """
+    df_sorted = df.sort_values("sesiones_iniciadas", ascending=False)
+    if usuarios_top is not None:
+        df_sorted = df_sorted[df_sorted["nombre"].isin(usuarios_top)]
+    nombres = df_sorted["nombre"].to_numpy()
+    barras = [
+        nueva_traza(go.Bar, x=df_sorted[columna].to_numpy(), y=nombres, orientation='h', name=tipo, legendgroup=tipo,
+                    offsetgroup=tipo, alignmentgroup="True", marker=dict(color=PALETA[i]),
+                    hovertemplate=f"={tipo}<br>Conversaciones=%{{x}}<br>Usuario=%{{y}}<extra></extra>")
+        for i, (columna, tipo) in enumerate([("sesiones_iniciadas", "Inicia"), ("sesiones_cerradas", "Cierra")])
+    ]
+    fig = nueva_figura(barras, "🗨️ Conversaciones iniciadas y cerradas por usuario", "Conversaciones", "Usuario",
+                       leyenda="", barmode="group")
+    return fig
+
+def grafica_histograma_sesiones(df_sesiones, metrica, titulo, eje_x):
+    """
+    Genera un gráfico de barras con uno de los histogramas de conversaciones
+    (columna "metrica" del CSV de analisis.py --out_sesiones).
+    """
+    df = df_sesiones[df_sesiones["metrica"] == metrica]
+    total = df["num_sesiones"].sum()
+    barras = nueva_traza(go.Bar, x=df["valor"].to_numpy(), y=df["num_sesiones"].to_numpy(), marker=dict(color=PALETA[0]),
+                         showlegend=False, hovertemplate=f"{eje_x}=%{{x}}<br>Conversaciones=%{{y}}<extra></extra>")
+    # Intervalos de duración y número de participantes como categorías ordenadas
+    fig = nueva_figura([barras], f"{titulo} ({total} conversaciones)", eje_x, "Conversaciones",
+                       barmode="relative", xaxis=dict(type="category"))
+    return fig
+
+def grafica_cuota_mensajes_muestra(df):
+    """
+    Genera un gráfico de barras con el porcentaje de mensajes de cada usuario estimado a partir
+    de la muestra, con su intervalo de confianza del 95 % como barras de error.
+    """
+    df_sorted = df.sort_values("porcentaje_mensajes", ascending=False)
+    error_x = dict(
+        array=(df_sorted["porcentaje_ic_sup"] - df_sorted["porcentaje_mensajes"]).to_numpy(),
+        arrayminus=(df_sorted["porcentaje_mensajes"] - df_sorted["porcentaje_ic_inf"]).to_numpy(),
     )
-    fig.update_xaxes(categoryorder='array', categoryarray=orden)
-    fig.update_yaxes(tickformat=".0%")
+    fig = figura_barras_horizontales(df_sorted, "porcentaje_mensajes", "🎲 Porcentaje de mensajes por usuario (estimado, IC 95 %)",
+                                     "% de mensajes", "Usuario", error_x=error_x)
     return fig
 
+def generar_html_aviso_muestra(df_usuarios):
+    """
+    Aviso de que el dashboard es una vista previa calculada a partir de una muestra, y de las
+    gráficas que faltan porque no se pueden estimar con ella (ver analisis.escalar_estado_analisis).
+    """
+    tamaño = int(df_usuarios["mensajes_muestra"].sum())
+    total = int(df_usuarios["num_mensajes"].sum())
+    return f"""
+    <div class="aviso-muestra">
+        ⚠️ <b>Vista previa aproximada</b>: estadísticas estimadas a partir de una muestra aleatoria de {tamaño}
+        de unos {total} mensajes. Los conteos están escalados al chat completo; las cifras pequeñas son poco fiables.
+        Las conversaciones, los días activos, las rachas y los días en común dependen de mensajes consecutivos
+        o de ver todos los días del chat, así que no se muestran: analiza el chat completo para verlos.
+    </div>
+    """
 
-def grafica_heatmap_menciones(df_menciones_por_autor):
+def codificar_array(valores, dtype):
+    """Array numérico como base64 de sus bytes little-endian, para leerlo como typed array en el navegador."""
+    return base64.b64encode(np.ascontiguousarray(valores, dtype=dtype).tobytes()).decode("ascii")
+
+def preparar_cubo_actividad(df_dia_hora, df_usuarios, usuarios_top=None):
     """
-    Heatmap de la frecuencia de menciones entre usuarios.
-    Requiere un DataFrame con columnas 'autor_mencionador', 'usuario_mencionado', 'conteo'.
+    Codifica la actividad por día, hora y usuario (analisis.py --out_dia_hora) como cubo disperso
+    de arrays tipados en base64: una celda por (día, hora, usuario) con mensajes, ordenadas por día.
+    Con él el navegador recalcula las gráficas de conteos para un rango de fechas o un grupo de usuarios.
+
+    Returns:
+        dict: Datos JSON del cubo, o None si no hay actividad.
+    """
+    if df_dia_hora.empty:
+        return None
+    usuarios = df_usuarios.sort_values("num_mensajes", ascending=False)["nombre"].astype(str).tolist()
+    usuarios += sorted(set(df_dia_hora["usuario"].astype(str)) - set(usuarios))
+    ids_usuario = {usuario: i for i, usuario in enumerate(usuarios)}
+
+    fechas = pd.to_datetime(df_dia_hora["fecha"])
+    dia0 = fechas.min()
+    dias = (fechas - dia0).dt.days.to_numpy()
+    orden = np.argsort(dias, kind="stable")
+    ids = df_dia_hora["usuario"].astype(str).map(ids_usuario).to_numpy()
+    conteos = df_dia_hora["num_mensajes"].to_numpy()
+    # Los días caben en 16 bits salvo en chats de más de 179 años
+    bytes_dia = 2 if dias.max() < 2**16 else 4
+
+    return {
+        "usuarios": usuarios,
+        # En modo grupo grande las líneas por usuario agrupan la cola en "otros", como en Python
+        "etiquetas": [usuario if usuarios_top is None or usuario in usuarios_top else ETIQUETA_OTROS for usuario in usuarios],
+        "dia0": dia0.strftime("%Y-%m-%d"),
+        "num_dias": int(dias.max()) + 1,
+        "bytes_dia": bytes_dia,
+        "dia": codificar_array(dias[orden], f"<u{bytes_dia}"),
+        "hora": codificar_array(df_dia_hora["hora"].to_numpy()[orden], "u1"),
+        "usuario": codificar_array(ids[orden], "<u2"),
+        "conteo": codificar_array(conteos[orden], "<u4"),
+        "totales": codificar_array(np.bincount(ids, weights=conteos, minlength=len(usuarios)), "<u4"),
+    }
+
+def generar_html_panel_filtros(cubo):
+    """Controles para filtrar el dashboard por rango de fechas y usuarios (ver SCRIPT_FILTRO_CUBO)."""
+    primer_dia = cubo["dia0"]
+    ultimo_dia = (pd.Timestamp(primer_dia) + pd.Timedelta(days=cubo["num_dias"] - 1)).strftime("%Y-%m-%d")
+    casillas = "".join(
+        f'<label><input type="checkbox" class="filtro-usuario" value="{i}" checked> {escape(usuario)}</label>'
+        for i, usuario in enumerate(cubo["usuarios"])
+    )
+    return f"""
+    <div class="panel-filtros">
+        <h2>🔍 Filtrar el dashboard</h2>
+        <div class="filtro-fechas">
+            <label>Desde <input type="date" id="filtro-desde" min="{primer_dia}" max="{ultimo_dia}" value="{primer_dia}"></label>
+            <label>Hasta <input type="date" id="filtro-hasta" min="{primer_dia}" max="{ultimo_dia}" value="{ultimo_dia}"></label>
+        </div>
+        <div class="filtro-usuarios">{casillas}</div>
+        <button id="filtro-aplicar">Aplicar</button>
+        <button id="filtro-restablecer">Restablecer</button>
+        <p class="nota-filtros">Se recalculan en el navegador el reparto y el total de mensajes por usuario y los mensajes
+        por mes, día de la semana y hora. El resto de gráficas y secciones muestran siempre el chat completo.</p>
+    </div>
     """
-    if df_menciones_por_autor.empty:
-        fig = go.Figure().update_layout(title="👥 Frecuencia de Menciones entre Usuarios (No hay menciones registradas)")
-        return fig
 
-    # Pivotar el DataFrame para obtener la matriz de menciones
-    mention_matrix = df_menciones_por_autor.pivot_table(
-        index='autor_mencionador',
-        columns='usuario_mencionado',
-        values='conteo'
-    ).fillna(0) # Rellenar NaN con 0 donde no hay menciones
-
-    fig = px.imshow(
-        mention_matrix,
-        labels=dict(x="Usuario Mencionado", y="Autor Mencionador", color="Conteo"),
-        x=mention_matrix.columns.tolist(),
-        y=mention_matrix.index.tolist(),
-        title="👥 Frecuencia de Menciones entre Usuarios (Heatmap)",
-        color_continuous_scale="Viridis" # Escala de color
+def construir_matriz_menciones(df_menciones_por_autor, df_usuarios, usuarios_top=None):
+    """
+    Construye una sola vez la matriz densa (NumPy) de menciones autor × mencionado y su
+    versión normalizada por los mensajes de cada autor, calculada por división vectorizada.
+    En modo grupo grande los usuarios fuera de `usuarios_top` se agrupan en "otros".
+
+    Returns:
+        dict: {"autores", "mencionados", "conteos", "por_mensaje"} o None si no hay menciones.
+    """
+    if df_menciones_por_autor.empty:
+        return None
+
+    autores = df_menciones_por_autor['autor_mencionador']
+    mencionados = df_menciones_por_autor['usuario_mencionado']
+    if usuarios_top is not None:
+        autores = autores.where(autores.isin(usuarios_top), ETIQUETA_OTROS)
+        mencionados = mencionados.where(mencionados.isin(usuarios_top), ETIQUETA_OTROS)
+
+    # Índices enteros ordenados alfabéticamente, igual que el pivot_table original
+    nombres_autores, idx_autores = np.unique(autores.to_numpy(dtype=str), return_inverse=True)
+    nombres_mencionados, idx_mencionados = np.unique(mencionados.to_numpy(dtype=str), return_inverse=True)
+    conteos = np.zeros((len(nombres_autores), len(nombres_mencionados)))
+    np.add.at(conteos, (idx_autores, idx_mencionados), df_menciones_por_autor['conteo'].to_numpy(dtype=float))
+
+    # Total de mensajes de cada autor (fila), con la cola sumada en "otros"
+    df_tot = totales_por_usuario(df_usuarios, usuarios_top)
+    totales = df_tot.groupby('nombre')['total_mensajes'].sum().reindex(nombres_autores).fillna(0).to_numpy(dtype=float)
+    por_mensaje = np.divide(conteos, totales[:, None], out=np.zeros_like(conteos), where=totales[:, None] > 0)
+
+    return {
+        "autores": nombres_autores.tolist(),
+        "mencionados": nombres_mencionados.tolist(),
+        "conteos": conteos,
+        "por_mensaje": por_mensaje,
+    }
+
+def figura_heatmap_menciones(valores, matriz_menciones, titulo, etiqueta_color):
+    """
+    Heatmap autor × mencionado como px.imshow: celdas cuadradas, autores de arriba abajo,
+    mencionados arriba y escala Viridis en un eje de color compartido.
+    """
+    mapa = nueva_traza(
+        go.Heatmap,
+        z=valores, x=matriz_menciones["mencionados"], y=matriz_menciones["autores"], coloraxis="coloraxis",
+        hovertemplate=f"Usuario Mencionado: %{{x}}<br>Autor Mencionador: %{{y}}<br>{etiqueta_color}: %{{z}}<extra></extra>"
     )
-    # Ajustar el tamaño del texto en el heatmap para que sea legible
-    fig.update_xaxes(side="top") # Etiquetas de columnas arriba
-    fig.update_layout(
+    fig = nueva_figura(
+        [mapa], titulo, "Usuario Mencionado", "Autor Mencionador",
+        xaxis=dict(scaleanchor="y", constrain="domain", side="top"), # Etiquetas de columnas arriba
+        yaxis=dict(autorange="reversed", constrain="domain"),
+        coloraxis=dict(colorscale=ESCALA_VIRIDIS, colorbar=dict(title=dict(text=etiqueta_color))),
         autosize=True,
-        height=max(500, len(mention_matrix.index) * 50), # Ajustar altura dinámicamente
-        width=max(700, len(mention_matrix.columns) * 50), # Ajustar ancho dinámicamente
+        height=max(500, len(matriz_menciones["autores"]) * 50), # Ajustar altura dinámicamente
+        width=max(700, len(matriz_menciones["mencionados"]) * 50), # Ajustar ancho dinámicamente
     )
     return fig
 
+def grafica_heatmap_menciones(matriz_menciones):
+    """
+    Heatmap de la frecuencia de menciones entre usuarios.
+    Requiere la matriz generada por construir_matriz_menciones.
+    """
+    if matriz_menciones is None:
+        fig = nueva_figura([], "👥 Frecuencia de Menciones entre Usuarios (No hay menciones registradas)")
+        return fig
+
+    return figura_heatmap_menciones(matriz_menciones["conteos"], matriz_menciones,
+                                    "👥 Frecuencia de Menciones entre Usuarios (Heatmap)", "Conteo")
 
 
 
-def grafica_heatmap_menciones_rel(df_menciones_por_autor, df_usuarios):
+
+def grafica_heatmap_menciones_rel(matriz_menciones):
     """
     Heatmap de la frecuencia de menciones entre usuarios normalizada por mensajes del autor.
-    Requiere:
-    - df_menciones_por_autor: DataFrame con columnas 'autor_mencionador', 'usuario_mencionado', 'conteo'
-    - df_usuarios: DataFrame con columnas 'nombre' y 'num_mensajes'
+    Requiere la matriz generada por construir_matriz_menciones.
     """
-    if df_menciones_por_autor.empty:
-        fig = go.Figure().update_layout(title="👥 Frecuencia de Menciones entre Usuarios (No hay menciones registradas)")
+    if matriz_menciones is None:
+        fig = nueva_figura([], "👥 Frecuencia de Menciones entre Usuarios (No hay menciones registradas)")
         return fig
 
-    # Combinar con los datos de total de mensajes por autor
-    df_merged = df_menciones_por_autor.merge(
-        df_usuarios[['nombre', 'num_mensajes']],
-        left_on='autor_mencionador',
-        right_on='nombre',
-        how='left'
-    ).fillna(0)  # Rellenar NaN con 0 si no hay coincidencia
-
-    # Calcular menciones normalizadas por mensaje del autor
-    df_merged['menciones_por_mensaje'] = df_merged.apply(
-        lambda row: row['conteo'] / row['num_mensajes'] if row['num_mensajes'] > 0 else 0,
-        axis=1
-    )
+    return figura_heatmap_menciones(matriz_menciones["por_mensaje"], matriz_menciones,
+                                    "👥 Frecuencia de Menciones por Mensaje del Autor (Heatmap)", "Menciones por mensaje")
 
-    # Pivotar para obtener la matriz de menciones normalizadas
-    mention_matrix = df_merged.pivot_table(
-        index='autor_mencionador',
-        columns='usuario_mencionado',
-        values='menciones_por_mensaje'
-    ).fillna(0)  # Rellenar NaN con 0 donde no hay menciones
-
-    fig = px.imshow(
-        mention_matrix,
-        labels=dict(x="Usuario Mencionado", y="Autor Mencionador", color="Menciones por mensaje"),
-        x=mention_matrix.columns.tolist(),
-        y=mention_matrix.index.tolist(),
-        title="👥 Frecuencia de Menciones por Mensaje del Autor (Heatmap)",
-        color_continuous_scale="Viridis"
+def grafica_dias_activos_por_usuario(df, usuarios_top=None):
+    """
+    Genera un gráfico de barras agrupadas con los días en que escribe cada usuario y su racha
+    más larga de días seguidos, ordenado por días activos.
+    """
+    df_sorted = df.sort_values("dias_activos", ascending=False)
+    if usuarios_top is not None:
+        df_sorted = df_sorted[df_sorted["nombre"].isin(usuarios_top)]
+    nombres = df_sorted["nombre"].to_numpy()
+    barras = [
+        nueva_traza(go.Bar, x=df_sorted[columna].to_numpy(), y=nombres, orientation='h', name=tipo, legendgroup=tipo,
+                    offsetgroup=tipo, alignmentgroup="True", marker=dict(color=PALETA[i]),
+                    hovertemplate=f"={tipo}<br>Días=%{{x}}<br>Usuario=%{{y}}<extra></extra>")
+        for i, (columna, tipo) in enumerate([("dias_activos", "Días activos"), ("racha_max_dias", "Racha más larga")])
+    ]
+    fig = nueva_figura(barras, "📅 Días activos y racha más larga por usuario", "Días", "Usuario",
+                       leyenda="", barmode="group")
+    return fig
+
+def grafica_heatmap_copresencia(df_copresencia, df_usuarios, usuarios_top=None):
+    """
+    Heatmap simétrico usuario × usuario con el índice de Jaccard de sus días activos
+    (días en que escriben los dos / días en que escribe alguno), a partir de las parejas de
+    analisis.py --out_copresencia. En modo grupo grande solo se muestran los usuarios de `usuarios_top`.
+    """
+    nombres = df_usuarios.sort_values("num_mensajes", ascending=False)["nombre"]
+    if usuarios_top is not None:
+        nombres = nombres[nombres.isin(usuarios_top)]
+    nombres = nombres.tolist()
+    posiciones = {nombre: i for i, nombre in enumerate(nombres)}
+
+    # Las parejas sin días en común no aparecen en el CSV y se quedan a cero
+    jaccard = np.zeros((len(nombres), len(nombres)))
+    juntos = np.zeros((len(nombres), len(nombres)), dtype=np.int64)
+    df = df_copresencia[df_copresencia["usuario_a"].isin(posiciones) & df_copresencia["usuario_b"].isin(posiciones)]
+    i = df["usuario_a"].map(posiciones).to_numpy(dtype=np.int64)
+    j = df["usuario_b"].map(posiciones).to_numpy(dtype=np.int64)
+    for filas, columnas in ((i, j), (j, i)):
+        jaccard[filas, columnas] = df["jaccard"].to_numpy(dtype=float)
+        juntos[filas, columnas] = df["dias_juntos"].to_numpy(dtype=np.int64)
+    np.fill_diagonal(jaccard, np.nan) # La coincidencia de un usuario consigo mismo no aporta nada
+
+    mapa = nueva_traza(
+        go.Heatmap,
+        z=jaccard, x=nombres, y=nombres, customdata=juntos, coloraxis="coloraxis",
+        hovertemplate="Usuario: %{y}<br>Con: %{x}<br>Días juntos: %{customdata}<br>Jaccard: %{z:.2f}<extra></extra>"
     )
-    
-    fig.update_xaxes(side="top")
-    fig.update_layout(
+    fig = nueva_figura(
+        [mapa], "📅 Días activos en común entre usuarios (Jaccard)", "Usuario", "Usuario",
+        xaxis=dict(scaleanchor="y", constrain="domain", side="top"),
+        yaxis=dict(autorange="reversed", constrain="domain"),
+        coloraxis=dict(colorscale=ESCALA_VIRIDIS, colorbar=dict(title=dict(text="Jaccard"))),
         autosize=True,
-        height=max(500, len(mention_matrix.index) * 50),
-        width=max(700, len(mention_matrix.columns) * 50),
+        height=max(500, len(nombres) * 50),
+        width=max(700, len(nombres) * 50),
     )
     return fig
 
@@ -526,6 +844,99 @@ def generar_html_palabras_mas_usadas(df_usuarios):
     html += "</div>"
     return html
 
+def generar_html_palabras_caracteristicas(df_usuarios):
+    """
+    Genera la sección de palabras más características de cada usuario (mayor TF-IDF),
+    es decir, las que ese usuario usa mucho y el resto del grupo poco.
+    """
+    html = "<h2>🔎 Palabras más características por usuario (TF-IDF, Top 10)</h2>"
+    if 'palabras_caracteristicas' not in df_usuarios.columns:
+        return html + "<p>No hay datos de palabras características.</p>"
+    html += "<div style='display: flex; flex-wrap: wrap; justify-content: center;'>"
+    for index, row in df_usuarios.iterrows():
+        nombre = row['nombre']
+        palabras = ast.literal_eval(row['palabras_caracteristicas'])
+
+        html += f"<div style='margin: 10px; padding: 15px; border: 1px solid #ddd; border-radius: 8px; width: 300px; box-shadow: 2px 2px 5px rgba(0,0,0,0.1);'>"
+        html += f"<h3>{nombre}</h3>"
+        if palabras:
+            html += "<ol>"
+            for palabra, count in palabras:
+                html += f"<li>{palabra} ({count})</li>"
+            html += "</ol>"
+        else:
+            html += "<p>No hay palabras características.</p>"
+        html += "</div>"
+    html += "</div>"
+    return html
+
+def generar_html_frases_mas_usadas(df_usuarios, df_frases=None):
+    """
+    Genera la sección de frases (bigramas y trigramas) más usadas en todo el chat
+    (analisis.py --out_frases) y por cada usuario. Los conteos son estimaciones de un
+    Count-Min sketch: nunca se quedan cortos y se pasan como mucho en la cota indicada.
+    """
+    html = "<h2>💬 Frases más usadas</h2>"
+    if df_frases is not None and not df_frases.empty:
+        if "error_max" in df_frases.columns and df_frases["error_max"].notna().any():
+            html += f"<p>Conteos aproximados: cada uno puede pasarse como mucho en {int(df_frases['error_max'].max())} (con un 98 % de probabilidad).</p>"
+        html += "<ol>"
+        for index, row in df_frases.iterrows():
+            html += f"<li>{row['frase']} ({row['conteo']})</li>"
+        html += "</ol>"
+    if 'frases_mas_usadas' not in df_usuarios.columns:
+        return html + "<p>No hay datos de frases por usuario.</p>"
+    html += "<div style='display: flex; flex-wrap: wrap; justify-content: center;'>"
+    for index, row in df_usuarios.iterrows():
+        nombre = row['nombre']
+        frases = ast.literal_eval(row['frases_mas_usadas'])
+
+        html += f"<div style='margin: 10px; padding: 15px; border: 1px solid #ddd; border-radius: 8px; width: 300px; box-shadow: 2px 2px 5px rgba(0,0,0,0.1);'>"
+        html += f"<h3>{nombre}</h3>"
+        if frases:
+            html += "<ol>"
+            for frase, count in frases:
+                html += f"<li>{frase} ({count})</li>"
+            html += "</ol>"
+        else:
+            html += "<p>No hay frases repetidas.</p>"
+        html += "</div>"
+    html += "</div>"
+    return html
+
+def generar_html_emojis_mas_usados(df_usuarios, df_emojis=None):
+    """
+    Genera la sección de emojis más usados en todo el chat (analisis.py --out_emojis) y por
+    cada usuario. Cada emoji es una secuencia completa (👍🏽, 👨‍👩‍👧, 🇪🇸), no un carácter suelto.
+    """
+    html = "<h2>😀 Emojis más usados</h2>"
+    if df_emojis is not None and not df_emojis.empty:
+        html += "<div style='display: flex; flex-wrap: wrap; justify-content: center;'>"
+        for index, row in df_emojis.iterrows():
+            html += "<div style='margin: 6px; padding: 8px 12px; border: 1px solid #ddd; border-radius: 8px; text-align: center;'>"
+            html += f"<div style='font-size: 2em;'>{row['emoji']}</div><div>{row['conteo']}</div>"
+            html += "</div>"
+        html += "</div>"
+    if 'emojis_mas_usados' not in df_usuarios.columns:
+        return html + "<p>No hay datos de emojis por usuario.</p>"
+    html += "<div style='display: flex; flex-wrap: wrap; justify-content: center;'>"
+    for index, row in df_usuarios.iterrows():
+        nombre = row['nombre']
+        emojis = ast.literal_eval(row['emojis_mas_usados'])
+
+        html += f"<div style='margin: 10px; padding: 15px; border: 1px solid #ddd; border-radius: 8px; width: 300px; box-shadow: 2px 2px 5px rgba(0,0,0,0.1);'>"
+        html += f"<h3>{nombre}</h3>"
+        if emojis:
+            html += "<ol>"
+            for emoji, count in emojis:
+                html += f"<li><span style='font-size: 1.4em;'>{emoji}</span> ({count})</li>"
+            html += "</ol>"
+        else:
+            html += "<p>No usa emojis.</p>"
+        html += "</div>"
+    html += "</div>"
+    return html
+
 def generar_html_menciones_por_persona(df_usuarios):
     html = "<h2>🗣️ Personas más mencionadas por cada usuario</h2>"
     html += "<div style='display: flex; flex-wrap: wrap; justify-content: center;'>"
@@ -564,28 +975,334 @@ def generar_html_persona_mas_mencionada_total(df_menciones_globales):
         html += "<p>No hay datos de menciones globales.</p>"
     return html
 
-def guardar_dashboard(figs, html_sections, output_path):
+# Script del navegador que dibuja cada figura solo cuando su contenedor entra en pantalla
+# (IntersectionObserver). Opcionalmente libera (Plotly.purge) las figuras muy alejadas.
+SCRIPT_RENDER_DIFERIDO = """
+(function () {
+    var PURGAR = %(purgar)s;
+    var contenedores = Array.prototype.slice.call(document.querySelectorAll(".figura-diferida"));
+
+    function dibujar(div) {
+        if (div.dataset.dibujada === "1") { return; }
+        // Si el panel de filtros ha recalculado la figura, se dibuja esa versión
+        var figura = (window.FIGURAS_FILTRADAS || {})[div.id] || JSON.parse(document.getElementById(div.dataset.figura).textContent);
+        div.dataset.dibujada = "1";
+        Plotly.newPlot(div, figura.data, figura.layout || {}, {responsive: true});
+    }
+
+    function purgar(div) {
+        if (div.dataset.dibujada !== "1") { return; }
+        Plotly.purge(div);
+        div.dataset.dibujada = "0";
+    }
+
+    if (!("IntersectionObserver" in window)) {
+        contenedores.forEach(dibujar);
+        return;
+    }
+
+    var observadorDibujo = new IntersectionObserver(function (entradas) {
+        entradas.forEach(function (entrada) {
+            if (entrada.isIntersecting) { dibujar(entrada.target); }
+        });
+    }, {rootMargin: "300px 0px"});
+    contenedores.forEach(function (div) { observadorDibujo.observe(div); });
+
+    if (PURGAR) {
+        var observadorPurga = new IntersectionObserver(function (entradas) {
+            entradas.forEach(function (entrada) {
+                if (!entrada.isIntersecting) { purgar(entrada.target); }
+            });
+        }, {rootMargin: "3000px 0px"});
+        contenedores.forEach(function (div) { observadorPurga.observe(div); });
+    }
+})();
+"""
+
+# Figuras que el panel de filtros recalcula a partir del cubo de actividad:
+# reparto (pie) y total (barras) por usuario, total mensual, y líneas por usuario por mes, día de la semana y hora.
+ROLES_FILTRABLES = ("pie", "barras_mensajes", "mes_total", "mes_usuario", "dia_semana", "hora")
+
+# Script del navegador del panel de filtros. Decodifica el cubo (arrays tipados en base64),
+# lo agrega en una pasada para el rango de fechas y los usuarios elegidos y redibuja las figuras
+# con rol conservando el diseño y el estilo de cada traza del original. Las figuras aún no
+# dibujadas usan la versión filtrada cuando entran en pantalla (window.FIGURAS_FILTRADAS).
+SCRIPT_FILTRO_CUBO = """
+(function () {
+    var cubo = JSON.parse(document.getElementById("cubo-actividad").textContent);
+    var DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"];
+    var DIA_MS = 86400000;
+
+    function decodificar(b64, Tipo) {
+        var binario = atob(b64);
+        var bytes = new Uint8Array(binario.length);
+        for (var i = 0; i < binario.length; i++) { bytes[i] = binario.charCodeAt(i); }
+        return new Tipo(bytes.buffer);
+    }
+    var dia = decodificar(cubo.dia, cubo.bytes_dia === 4 ? Uint32Array : Uint16Array);
+    var hora = decodificar(cubo.hora, Uint8Array);
+    var usuario = decodificar(cubo.usuario, Uint16Array);
+    var conteo = decodificar(cubo.conteo, Uint32Array);
+    var totales = decodificar(cubo.totales, Uint32Array);
+    var numUsuarios = cubo.usuarios.length;
+
+    // Mes (índice en `meses`, AAAA-MM-01) y día de la semana (0 = lunes) de cada día del cubo
+    var inicio = Date.parse(cubo.dia0 + "T00:00:00Z");
+    var meses = [];
+    var mesDeDia = new Uint32Array(cubo.num_dias);
+    var semanaDeDia = new Uint8Array(cubo.num_dias);
+    for (var d = 0; d < cubo.num_dias; d++) {
+        var fecha = new Date(inicio + d * DIA_MS);
+        var mes = fecha.toISOString().slice(0, 7) + "-01";
+        if (meses[meses.length - 1] !== mes) { meses.push(mes); }
+        mesDeDia[d] = meses.length - 1;
+        semanaDeDia[d] = (fecha.getUTCDay() + 6) % 7;
+    }
+    var etiquetas = [];
+    cubo.etiquetas.forEach(function (etiqueta) { if (etiquetas.indexOf(etiqueta) < 0) { etiquetas.push(etiqueta); } });
+    var etiquetaDeUsuario = cubo.etiquetas.map(function (etiqueta) { return etiquetas.indexOf(etiqueta); });
+
+    function agregar(desde, hasta, seleccion) {
+        var numMeses = meses.length, numEtiquetas = etiquetas.length;
+        var r = {
+            usuario: new Float64Array(numUsuarios),
+            mes: new Float64Array(numEtiquetas * numMeses),
+            semana: new Float64Array(numEtiquetas * 7),
+            hora: new Float64Array(numEtiquetas * 24)
+        };
+        // Con el rango completo los totales por usuario ya vienen calculados
+        var completo = desde === 0 && hasta === cubo.num_dias - 1;
+        if (completo) {
+            for (var u = 0; u < numUsuarios; u++) { if (seleccion[u]) { r.usuario[u] = totales[u]; } }
+        }
+        for (var i = 0; i < conteo.length; i++) {
+            var d = dia[i];
+            if (d < desde) { continue; }
+            if (d > hasta) { break; } // Las celdas están ordenadas por día
+            var u = usuario[i];
+            if (!seleccion[u]) { continue; }
+            var c = conteo[i], e = etiquetaDeUsuario[u];
+            if (!completo) { r.usuario[u] += c; }
+            r.mes[e * numMeses + mesDeDia[d]] += c;
+            r.semana[e * 7 + semanaDeDia[d]] += c;
+            r.hora[e * 24 + hora[i]] += c;
+        }
+        return r;
+    }
+
+    function copiar(objeto) { return JSON.parse(JSON.stringify(objeto)); }
+
+    // Traza de `figura` con ese nombre (conserva color y estilo) o, si no existe, copia de la primera sin color
+    function trazoPara(figura, nombre) {
+        var original = null;
+        figura.data.forEach(function (trazo) { if (trazo.name === nombre) { original = trazo; } });
+        var trazo = copiar(original || figura.data[0]);
+        if (!original) {
+            delete trazo.hovertemplate;
+            if (trazo.marker) { delete trazo.marker.color; }
+            if (trazo.line) { delete trazo.line.color; }
+        }
+        trazo.name = nombre;
+        trazo.legendgroup = nombre;
+        return trazo;
+    }
+
+    // Una línea por etiqueta con mensajes; como en los CSV mensuales, los meses sin mensajes se omiten
+    function lineasPorEtiqueta(figura, valores, x, omitirCeros) {
+        var trazos = [], ancho = x.length;
+        etiquetas.forEach(function (etiqueta, e) {
+            var xs = [], ys = [];
+            for (var j = 0; j < ancho; j++) {
+                var v = valores[e * ancho + j];
+                if (v > 0 || !omitirCeros) { xs.push(x[j]); ys.push(v); }
+            }
+            if (!ys.some(function (v) { return v > 0; })) { return; }
+            var trazo = trazoPara(figura, etiqueta);
+            trazo.x = xs;
+            trazo.y = ys;
+            trazos.push(trazo);
+        });
+        return trazos;
+    }
+
+    function recalcular(rol, figura, r) {
+        var nombres = [], valores = [];
+        for (var u = 0; u < numUsuarios; u++) {
+            if (r.usuario[u] > 0) { nombres.push(cubo.usuarios[u]); valores.push(r.usuario[u]); }
+        }
+        if (rol === "pie") {
+            var pie = copiar(figura.data[0]);
+            pie.labels = nombres;
+            pie.values = valores;
+            return [pie];
+        }
+        if (rol === "barras_mensajes") {
+            var orden = valores.map(function (v, i) { return i; }).sort(function (a, b) { return valores[b] - valores[a]; });
+            var barras = copiar(figura.data[0]);
+            barras.x = orden.map(function (i) { return valores[i]; });
+            barras.y = orden.map(function (i) { return nombres[i]; });
+            return [barras];
+        }
+        if (rol === "mes_total") {
+            var xs = [], ys = [];
+            meses.forEach(function (mes, m) {
+                var total = 0;
+                for (var e = 0; e < etiquetas.length; e++) { total += r.mes[e * meses.length + m]; }
+                if (total > 0) { xs.push(mes); ys.push(total); }
+            });
+            var linea = copiar(figura.data[0]);
+            linea.x = xs;
+            linea.y = ys;
+            return [linea];
+        }
+        if (rol === "mes_usuario") { return lineasPorEtiqueta(figura, r.mes, meses, true); }
+        if (rol === "dia_semana") { return lineasPorEtiqueta(figura, r.semana, DIAS_SEMANA, false); }
+        if (rol === "hora") {
+            var horas = [];
+            for (var h = 0; h < 24; h++) { horas.push(h); }
+            return lineasPorEtiqueta(figura, r.hora, horas, false);
+        }
+        return figura.data;
+    }
+
+    function figuraOriginal(div) { return JSON.parse(document.getElementById(div.dataset.figura).textContent); }
+
+    function indiceDia(valor, porDefecto) {
+        if (!valor) { return porDefecto; }
+        var d = Math.round((Date.parse(valor + "T00:00:00Z") - inicio) / DIA_MS);
+        return Math.min(Math.max(d, 0), cubo.num_dias - 1);
+    }
+
+    function aplicar() {
+        var desde = indiceDia(document.getElementById("filtro-desde").value, 0);
+        var hasta = indiceDia(document.getElementById("filtro-hasta").value, cubo.num_dias - 1);
+        var seleccion = new Uint8Array(numUsuarios);
+        document.querySelectorAll(".filtro-usuario").forEach(function (casilla) {
+            if (casilla.checked) { seleccion[Number(casilla.value)] = 1; }
+        });
+        var r = agregar(desde, hasta, seleccion);
+        window.FIGURAS_FILTRADAS = {};
+        document.querySelectorAll(".figura-diferida[data-rol]").forEach(function (div) {
+            var figura = figuraOriginal(div);
+            var layout = figura.layout || {};
+            if (layout.title && layout.title.text) { layout.title.text += " · filtrado"; }
+            var filtrada = {data: recalcular(div.dataset.rol, figura, r), layout: layout};
+            window.FIGURAS_FILTRADAS[div.id] = filtrada;
+            if (div.dataset.dibujada === "1") { Plotly.react(div, filtrada.data, filtrada.layout); }
+        });
+    }
+
+    function restablecer() {
+        window.FIGURAS_FILTRADAS = {};
+        document.getElementById("filtro-desde").value = document.getElementById("filtro-desde").min;
+        document.getElementById("filtro-hasta").value = document.getElementById("filtro-hasta").max;
+        document.querySelectorAll(".filtro-usuario").forEach(function (casilla) { casilla.checked = true; });
+        document.querySelectorAll(".figura-diferida[data-rol]").forEach(function (div) {
+            if (div.dataset.dibujada === "1") {
+                var figura = figuraOriginal(div);
+                Plotly.react(div, figura.data, figura.layout || {});
+            }
+        });
+    }
+
+    document.getElementById("filtro-aplicar").addEventListener("click", aplicar);
+    document.getElementById("filtro-restablecer").addEventListener("click", restablecer);
+})();
+"""
+
+# Dónde va plotly.js (~4,6 MB): dentro de cada HTML (autónomo) o en un archivo junto a los dashboards,
+# escrito una sola vez por directorio y enlazado desde cada uno (lo que usa el servidor)
+MODOS_PLOTLY_JS = ["incluido", "directorio"]
+
+def escribir_plotly_js(directorio):
+    """
+    Escribe plotly.js en `directorio` si todavía no está y devuelve su nombre. El nombre lleva la
+    versión de Plotly, para no enlazar una versión antigua, y el archivo se escribe con otro
+    nombre y se renombra, para que varios procesos puedan hacerlo a la vez sin dejarlo a medias.
+    """
+    import plotly
+    from plotly.offline import get_plotlyjs
+
+    nombre = f"plotly-{plotly.__version__}.min.js"
+    ruta = os.path.join(directorio, nombre)
+    if not os.path.exists(ruta):
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write(get_plotlyjs())
+        os.replace(temporal, ruta)
+    return nombre
+
+def figura_diferida_html(fig, i, rol=None):
+    """
+    Genera el contenedor vacío de una figura y su JSON como bloque de datos inerte,
+    que el navegador solo interpreta y dibuja cuando el contenedor es visible.
+    `rol` marca las figuras que el panel de filtros sabe recalcular (ver ROLES_FILTRABLES).
+    """
+    if isinstance(fig, dict): # Figura sin validar (ver nueva_figura)
+        # Los arrays NumPy van como listas JSON y no como typed arrays en base64 (Figure.to_json):
+        # plotly.js dibuja igual ambos y codificarlos costaba más que generar la figura
+        figura_json = pio.to_json(fig, validate=False)
+        altura = fig["layout"].get("height")
+    else:
+        figura_json = fig.to_json()
+        altura = fig.layout.height
+    # "</" se escapa para que un texto del gráfico no pueda cerrar la etiqueta <script>
+    figura_json = figura_json.replace("</", "<\\/")
+    altura = altura or 450 # Altura por defecto de Plotly
+    atributo_rol = f' data-rol="{rol}"' if rol else ""
+    return (
+        f'<div id="figura-{i}" class="plotly-graph-div figura-diferida" data-figura="datos-figura-{i}"{atributo_rol} '
+        f'style="min-height: {altura}px; width: 100%;"></div>'
+        f'<script type="application/json" id="datos-figura-{i}">{figura_json}</script>'
+    )
+
+def guardar_dashboard(figs, html_sections, output_path, purgar_fuera_de_pantalla=False, aviso="", cubo=None, roles=None,
+                      plotly_js="incluido"):
     """
     Guarda las figuras de Plotly y las secciones HTML en un archivo HTML de dashboard.
+    Las figuras se dibujan de forma diferida al hacer scroll, así que el tiempo hasta
+    la primera gráfica no depende del número de figuras del dashboard.
 
     Args:
         figs (list): Lista de objetos Figure de Plotly.
         html_sections (list): Lista de cadenas HTML personalizadas.
         output_path (str): Ruta donde se guardará el archivo HTML.
+        purgar_fuera_de_pantalla (bool): Libera las figuras muy alejadas de la zona visible
+            para reducir la memoria del navegador (se vuelven a dibujar al volver a ellas).
+        aviso (str): HTML opcional que se muestra bajo el título (p. ej. el aviso de vista previa).
+        cubo (dict): Cubo de actividad de preparar_cubo_actividad; si se indica, el dashboard incluye
+            el panel para filtrar por fechas y usuarios en el navegador.
+        roles (dict): Índice de figura -> rol de ROLES_FILTRABLES, para las figuras que recalcula el panel.
+        plotly_js (str): Modo de MODOS_PLOTLY_JS: plotly.js dentro del HTML o en un archivo junto a él.
     """
-    from plotly.offline import plot
-
+    # La librería Plotly JS se incluye una sola vez; cada figura solo aporta su JSON.
+    if plotly_js == "directorio":
+        nombre_plotly_js = escribir_plotly_js(os.path.dirname(os.path.abspath(output_path)))
+        script_plotly = f'<script type="text/javascript" src="{escape(nombre_plotly_js)}"></script>'
+    else:
+        from plotly.offline import get_plotlyjs
+        script_plotly = f'<script type="text/javascript">{get_plotlyjs()}</script>'
+    # Serializar las figuras a JSON es lo más lento del guardado
+    progreso = nuevo_progreso("dashboard", len(figs), "figuras")
     html_parts = []
-    # Genera el HTML para cada figura de Plotly
+    roles = roles or {}
     for i, fig in enumerate(figs):
-        # include_plotlyjs se establece en True solo para la primera figura
-        # para evitar duplicar la librería Plotly JS, lo que puede causar problemas de rendimiento.
-        inner_html = plot(fig, include_plotlyjs=(i == 0), output_type="div")
-        html_parts.append(inner_html)
+        html_parts.append(figura_diferida_html(fig, i, roles.get(i)))
+        informar_progreso(progreso, i + 1)
+    terminar_progreso(progreso)
+    script_render = SCRIPT_RENDER_DIFERIDO % {"purgar": "true" if purgar_fuera_de_pantalla else "false"}
 
     # Une las secciones HTML personalizadas.
     custom_html_content = "".join(html_sections)
 
+    # Panel de filtros: el cubo va como bloque JSON inerte, igual que las figuras
+    panel_filtros = script_filtros = ""
+    if cubo is not None:
+        cubo_json = json.dumps(cubo, ensure_ascii=False).replace("</", "<\\/")
+        panel_filtros = generar_html_panel_filtros(cubo)
+        script_filtros = (f'<script type="application/json" id="cubo-actividad">{cubo_json}</script>'
+                          f'<script type="text/javascript">{SCRIPT_FILTRO_CUBO}</script>')
+
     full_html = f"""
     <html>
     <head>
@@ -657,17 +1374,54 @@ def guardar_dashboard(figs, html_sections, output_path):
             .text-section p {{
                 font-size: 1.1em;
             }}
+            .panel-filtros {{
+                background-color: #ffffff;
+                border: 1px solid #e0e0e0;
+                border-radius: 12px;
+                box-shadow: 0 4px 15px rgba(0,0,0,0.05);
+                padding: 15px 25px;
+                margin: 0 auto 20px auto;
+                max-width: 1200px;
+                text-align: center;
+            }}
+            .panel-filtros h2 {{ margin-top: 0; margin-bottom: 15px; }}
+            .filtro-fechas label {{ margin: 0 10px; }}
+            .filtro-usuarios {{
+                display: flex;
+                flex-wrap: wrap;
+                justify-content: center;
+                gap: 5px 15px;
+                max-height: 150px;
+                overflow-y: auto;
+                margin: 15px 0;
+            }}
+            .panel-filtros button {{ margin: 0 5px; padding: 6px 16px; border-radius: 6px; border: 1px solid #ccc; cursor: pointer; }}
+            .nota-filtros {{ font-size: 0.9em; color: #777; }}
+            .aviso-muestra {{
+                background-color: #fff4e5;
+                border: 1px solid #f0ad4e;
+                border-radius: 12px;
+                padding: 15px 25px;
+                margin: 0 auto 20px auto;
+                max-width: 1200px;
+                text-align: center;
+            }}
         </style>
         <link href="https://fonts.googleapis.com/css2?family=Inter:wght@400;600;700&display=swap" rel="stylesheet">
+        {script_plotly}
     </head>
     <body>
         <h1>📱 Dashboard de estadísticas de WhatsApp</h1>
+        {aviso}
+        {panel_filtros}
         <div class="graph-container">
             {''.join([f'<div class="graph-item">{part}</div>' for part in html_parts])}
         </div>
         <div class="text-section">
             {custom_html_content}
         </div>
+        <script type="text/javascript">{script_render}</script>
+        {script_filtros}
     </body>
     </html>
     """
@@ -675,6 +1429,100 @@ def guardar_dashboard(figs, html_sections, output_path):
     with open(output_path, "w", encoding="utf-8") as f:
         f.write(full_html)
 
+def generar_dashboard(usuarios_df, mensual_df, horas_df, menciones_globales_df, dia_semana_df, menciones_por_autor_df,
+                      salida, diario=None, sesiones=None, ignorar_menciones=False, grupo_grande=False,
+                      top_usuarios=TOP_USUARIOS_GRUPO_GRANDE, puntos_timeline=PUNTOS_MAX_TIMELINE,
+                      purgar_fuera_de_pantalla=False, dia_hora=None, emojis=None, frases=None, copresencia=None,
+                      plotly_js="incluido"):
+    """
+    Genera todas las gráficas y secciones a partir de los DataFrames preparados y guarda el dashboard.
+
+    Args:
+        diario (tuple): (DataFrame, frecuencia) de preparar_actividad_diaria, o None para omitir la línea temporal detallada.
+        sesiones (pd.DataFrame): Histogramas de conversaciones (analisis.py --out_sesiones), o None para omitirlos.
+        ignorar_menciones (bool): Omite las gráficas y secciones de menciones (chats individuales).
+        dia_hora (pd.DataFrame): Mensajes por día, hora y usuario (analisis.py --out_dia_hora); si se indica,
+            el dashboard permite filtrar por fechas y usuarios en el navegador.
+        emojis (pd.DataFrame): Emojis más usados en todo el chat (analisis.py --out_emojis), o None.
+        frases (pd.DataFrame): Frases más usadas en todo el chat (analisis.py --out_frases), o None.
+        copresencia (pd.DataFrame): Días activos en común por pareja de usuarios (analisis.py --out_copresencia), o None.
+        plotly_js (str): Dónde va plotly.js (ver MODOS_PLOTLY_JS y guardar_dashboard).
+    """
+    # Modo grupo grande: trazas WebGL y solo los usuarios más activos con línea propia
+    usuarios_top = None
+    webgl = False
+    if grupo_grande or len(usuarios_df) > UMBRAL_GRUPO_GRANDE:
+        usuarios_top = seleccionar_usuarios_top(usuarios_df, top_usuarios)
+        webgl = True
+        print(f"👥 Modo grupo grande: {len(usuarios_df)} usuarios, se muestran los {len(usuarios_top)} más activos y el resto como '{ETIQUETA_OTROS}'.")
+    opciones_grupo = dict(usuarios_top=usuarios_top, webgl=webgl)
+
+    muestra = "porcentaje_ic_inf" in usuarios_df.columns # Vista previa de analisis.py --muestra
+
+    # Las figuras con rol se pueden recalcular en el navegador desde el panel de filtros
+    figs = []
+    roles = {}
+    def añadir(fig, rol=None):
+        if rol:
+            roles[len(figs)] = rol
+        figs.append(fig)
+
+    añadir(grafica_pie_mensajes(usuarios_df), "pie")
+    añadir(grafica_barras(usuarios_df, "num_mensajes", "💬 Total de mensajes por usuario", "Mensajes", "Usuario"), "barras_mensajes")
+    if muestra:
+        añadir(grafica_cuota_mensajes_muestra(usuarios_df))
+    añadir(grafica_longitud_promedio(usuarios_df))
+    añadir(grafica_emojis_por_mensaje(usuarios_df))
+    añadir(grafica_enlaces_por_mensaje(usuarios_df))
+    añadir(grafica_multimedia_por_mensaje(usuarios_df))
+    añadir(grafica_preguntas_por_mensaje(usuarios_df))
+
+    añadir(grafica_linea_mensajes_por_mes_agregado(mensual_df), "mes_total")
+    if diario is not None:
+        diario_df, frecuencia = diario
+        añadir(grafica_timeline_actividad(diario_df, frecuencia, puntos_timeline, **opciones_grupo))
+    añadir(grafica_linea_mensajes_por_mes(mensual_df, **opciones_grupo), "mes_usuario")
+    añadir(grafica_linea_mensajes_por_mes_normalizado(mensual_df, usuarios_df, **opciones_grupo))
+    añadir(grafica_linea_mensajes_por_mes_del_anyo_normalizado(mensual_df, usuarios_df, **opciones_grupo))
+    añadir(grafica_mensajes_por_dia_semana(dia_semana_df, **opciones_grupo), "dia_semana")
+    añadir(grafica_mensajes_por_dia_semana_normalizado(dia_semana_df, usuarios_df, **opciones_grupo))
+    añadir(grafica_linea_mensajes_por_hora(horas_df, **opciones_grupo), "hora")
+    añadir(grafica_linea_mensajes_por_hora_normalizado(horas_df, usuarios_df, **opciones_grupo))
+    añadir(grafica_top_hablante_mes(mensual_df))
+    if "sesiones_iniciadas" in usuarios_df.columns:
+        añadir(grafica_sesiones_por_usuario(usuarios_df, usuarios_top))
+    if sesiones is not None:
+        añadir(grafica_histograma_sesiones(sesiones, "duracion", "⏱️ Duración de las conversaciones", "Duración"))
+        añadir(grafica_histograma_sesiones(sesiones, "participantes", "👥 Participantes por conversación", "Participantes"))
+    if "dias_activos" in usuarios_df.columns:
+        añadir(grafica_dias_activos_por_usuario(usuarios_df, usuarios_top))
+    if copresencia is not None and len(usuarios_df) > 1:
+        añadir(grafica_heatmap_copresencia(copresencia, usuarios_df, usuarios_top))
+
+    # Añadir condicionalmente las gráficas de menciones
+    if not ignorar_menciones:
+        # La matriz de menciones se construye una sola vez para ambos heatmaps
+        matriz_menciones = construir_matriz_menciones(menciones_por_autor_df, usuarios_df, usuarios_top)
+        añadir(grafica_heatmap_menciones(matriz_menciones))
+        añadir(grafica_heatmap_menciones_rel(matriz_menciones)) # Heatmap, no aplica ordenación de la misma manera
+
+    # Lista de secciones HTML personalizadas
+    html_sections = []
+    html_sections.append(generar_html_palabras_mas_usadas(usuarios_df))
+    html_sections.append(generar_html_frases_mas_usadas(usuarios_df, frases))
+    html_sections.append(generar_html_palabras_caracteristicas(usuarios_df))
+    html_sections.append(generar_html_emojis_mas_usados(usuarios_df, emojis))
+    # Añadir condicionalmente las secciones HTML de menciones
+    if not ignorar_menciones:
+        html_sections.append(generar_html_menciones_por_persona(usuarios_df))
+        html_sections.append(generar_html_persona_mas_mencionada_total(menciones_globales_df))
+
+    # Guardar el dashboard final
+    cubo = preparar_cubo_actividad(dia_hora, usuarios_df, usuarios_top) if dia_hora is not None else None
+    guardar_dashboard(figs, html_sections, salida, purgar_fuera_de_pantalla,
+                      aviso=generar_html_aviso_muestra(usuarios_df) if muestra else "",
+                      cubo=cubo, roles=roles, plotly_js=plotly_js)
+
 def main():
     """
     Función principal para cargar datos, generar gráficas y guardar el dashboard.
@@ -686,9 +1534,22 @@ def main():
     parser.add_argument("--menciones_globales", default="menciones_globales.csv", help="Archivo CSV con estadísticas de menciones globales.")
     parser.add_argument("--dia_semana", default="mensajes_por_dia_semana.csv", help="Archivo CSV con estadísticas por día de la semana y usuario.")
     parser.add_argument("--menciones_por_autor", default="menciones_por_autor.csv", help="Archivo CSV de menciones detalladas por autor para heatmap.")
+    parser.add_argument("--diario", default=None, help="Archivo CSV opcional con mensajes por día (o por hora) y usuario para la línea temporal detallada.")
+    parser.add_argument("--sesiones", default=None, help="Archivo CSV opcional con los histogramas de conversaciones (analisis.py --out_sesiones).")
+    parser.add_argument("--copresencia", default=None, help="Archivo CSV opcional con los días activos en común por pareja de usuarios (analisis.py --out_copresencia).")
+    parser.add_argument("--dia_hora", default=None, help="Archivo CSV opcional de mensajes por día, hora y usuario (analisis.py --out_dia_hora) para filtrar el dashboard en el navegador.")
+    parser.add_argument("--frases", default=None, help="Archivo CSV opcional con las frases más usadas en todo el chat (analisis.py --out_frases).")
+    parser.add_argument("--emojis", default=None, help="Archivo CSV opcional con los emojis más usados en todo el chat (analisis.py --out_emojis).")
+    parser.add_argument("--puntos_timeline", type=int, default=PUNTOS_MAX_TIMELINE, help="Puntos máximos por serie en la línea temporal detallada (submuestreo LTTB).")
     parser.add_argument("--salida", default="dashboard_whatsapp.html", help="Nombre del archivo HTML de salida para el dashboard.")
     parser.add_argument("-i", "--ignore-mentions", action="store_true", help="Ignora las estadísticas y gráficas de menciones.")
+    parser.add_argument("--purgar_fuera_de_pantalla", action="store_true", help="Libera en el navegador las gráficas muy alejadas de la zona visible para ahorrar memoria.")
+    parser.add_argument("--grupo_grande", action="store_true", help=f"Fuerza el modo grupo grande (WebGL y cola de usuarios agrupada en 'otros'). Se activa solo con más de {UMBRAL_GRUPO_GRANDE} usuarios.")
+    parser.add_argument("--top_usuarios", type=int, default=TOP_USUARIOS_GRUPO_GRANDE, help="Usuarios con línea propia en modo grupo grande; el resto se agrupa en 'otros'.")
+    parser.add_argument("--plotly_js", choices=MODOS_PLOTLY_JS, default="incluido", help="plotly.js dentro del HTML (autónomo) o en un archivo junto a él, compartido por los dashboards del mismo directorio.")
+    añadir_argumento_progreso(parser)
     args = parser.parse_args()
+    configurar_progreso(args.progreso)
 
     if args.ignore_mentions:
         usuarios_df, mensual_df, horas_df, _, dia_semana_df, _ = cargar_datos(
@@ -700,43 +1561,20 @@ def main():
         usuarios_df, mensual_df, horas_df, menciones_globales_df, dia_semana_df, menciones_por_autor_df = cargar_datos(
             args.usuarios, args.mensual, args.horas, args.menciones_globales, args.dia_semana, args.menciones_por_autor
         )
-
-
-    figs = [
-        grafica_pie_mensajes(usuarios_df),
-        grafica_barras(usuarios_df, "num_mensajes", "💬 Total de mensajes por usuario", "Mensajes", "Usuario"),
-        grafica_longitud_promedio(usuarios_df),
-        grafica_emojis_por_mensaje(usuarios_df),
-        grafica_enlaces_por_mensaje(usuarios_df),
-        grafica_multimedia_por_mensaje(usuarios_df),
-        grafica_preguntas_por_mensaje(usuarios_df),
-
-        grafica_linea_mensajes_por_mes_agregado(mensual_df),
-        grafica_linea_mensajes_por_mes(mensual_df),
-        grafica_linea_mensajes_por_mes_normalizado(mensual_df, usuarios_df),
-        grafica_linea_mensajes_por_mes_del_anyo_normalizado(mensual_df, usuarios_df),
-        grafica_mensajes_por_dia_semana(dia_semana_df),
-        grafica_mensajes_por_dia_semana_normalizado(dia_semana_df, usuarios_df),
-        grafica_linea_mensajes_por_hora(horas_df),
-        grafica_linea_mensajes_por_hora_normalizado(horas_df, usuarios_df),
-        grafica_top_hablante_mes(mensual_df),
-    ]
-
-    # Añadir condicionalmente las gráficas de menciones
-    if not args.ignore_mentions:
-        figs.append(grafica_heatmap_menciones(menciones_por_autor_df))
-        figs.append(grafica_heatmap_menciones_rel(menciones_por_autor_df, usuarios_df)) # Heatmap, no aplica ordenación de la misma manera
-
-    # Lista de secciones HTML personalizadas
-    html_sections = []
-    html_sections.append(generar_html_palabras_mas_usadas(usuarios_df))
-    # Añadir condicionalmente las secciones HTML de menciones
-    if not args.ignore_mentions:
-        html_sections.append(generar_html_menciones_por_persona(usuarios_df))
-        html_sections.append(generar_html_persona_mas_mencionada_total(menciones_globales_df))
-
-    # Guardar el dashboard final
-    guardar_dashboard(figs, html_sections, args.salida)
+    diario = cargar_actividad_diaria(args.diario) if args.diario else None
+    sesiones = pd.read_csv(args.sesiones) if args.sesiones else None
+    dia_hora = pd.read_csv(args.dia_hora) if args.dia_hora else None
+    emojis = pd.read_csv(args.emojis) if args.emojis else None
+    frases = pd.read_csv(args.frases) if args.frases else None
+    copresencia = pd.read_csv(args.copresencia) if args.copresencia else None
+
+    generar_dashboard(
+        usuarios_df, mensual_df, horas_df, menciones_globales_df, dia_semana_df, menciones_por_autor_df,
+        args.salida, diario=diario, sesiones=sesiones, ignorar_menciones=args.ignore_mentions,
+        grupo_grande=args.grupo_grande, top_usuarios=args.top_usuarios,
+        puntos_timeline=args.puntos_timeline, purgar_fuera_de_pantalla=args.purgar_fuera_de_pantalla,
+        dia_hora=dia_hora, emojis=emojis, frases=frases, copresencia=copresencia, plotly_js=args.plotly_js
+    )
     print(f"✅ Dashboard generado en: {args.salida}")
 
 if __name__ == "__main__":
@@ -0,0 +1,405 @@
+import os
+import csv
+import time
+import zlib
+import shlex
+import sqlite3
+import hashlib
+import argparse
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+import numpy as np
+
+from analisis import tokenizar_texto
+from progreso import añadir_argumento_progreso, configurar_progreso, nuevo_progreso, informar_progreso, terminar_progreso
+
+# Índice invertido en disco (SQLite) sobre el CSV preprocesado, para buscar mensajes sin
+# volver a leer el chat. Cada mensaje se identifica por su posición en el CSV (0, 1, ...).
+# Para cada término se guarda la lista ordenada de mensajes que lo contienen (posting list),
+# codificada como diferencias entre ids consecutivos y comprimida con zlib. Además de las
+# palabras (las mismas que tokeniza el análisis, pero sin quitar stopwords) se indexan:
+#   - los pares de palabras consecutivas ("buenos días"), para buscar frases sin posiciones,
+#   - "autor:<nombre>" y "mes:AAAA-MM", para filtrar por autor y por mes con la misma maquinaria.
+# El índice crece por segmentos: cada actualización indexa solo las filas añadidas al CSV
+# y escribe sus posting lists como filas nuevas, sin reescribir las anteriores.
+
+VERSION_INDICE = 1
+# Mensajes por segmento: acota la memoria de la construcción (términos de un segmento en RAM)
+MENSAJES_POR_SEGMENTO = 100_000
+# A partir de este número de segmentos se fusionan en uno para que cada término sea una sola fila
+MAX_SEGMENTOS = 32
+# Mensajes por lote enviado a cada proceso al tokenizar en paralelo
+MENSAJES_POR_LOTE_TOKENIZACION = 2_000
+# Bytes del principio y del final de la parte ya indexada que se comparan para detectar un CSV reescrito
+BYTES_HUELLA = 64 * 1024
+PREFIJO_AUTOR = "autor:"
+PREFIJO_MES = "mes:"
+
+ESQUEMA_INDICE = """
+CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS postings (
+    termino TEXT, segmento INTEGER, num INTEGER, datos BLOB,
+    PRIMARY KEY (termino, segmento)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS posiciones (primer_id INTEGER PRIMARY KEY, datos BLOB);
+"""
+
+def ruta_indice_por_defecto(ruta_csv):
+    return os.path.splitext(ruta_csv)[0] + ".indice.sqlite"
+
+# --- Codificación de las posting lists ---
+
+def codificar_postings(ids):
+    """Codifica ids de mensaje crecientes como diferencias uint32 comprimidas con zlib."""
+    diferencias = np.diff(np.asarray(ids, dtype=np.int64), prepend=0).astype("<u4")
+    return zlib.compress(diferencias.tobytes())
+
+def decodificar_postings(datos):
+    return np.cumsum(np.frombuffer(zlib.decompress(datos), dtype="<u4"), dtype=np.int64)
+
+def terminos_mensaje(fecha, autor, palabras):
+    """Términos de un mensaje: sus palabras, los pares de palabras consecutivas, el autor y el mes."""
+    terminos = set(palabras)
+    terminos.update(f"{a} {b}" for a, b in zip(palabras, palabras[1:]))
+    terminos.add(PREFIJO_AUTOR + autor.lower())
+    terminos.add(PREFIJO_MES + fecha[:7])
+    return terminos
+
+# --- Lectura del CSV con la posición de cada fila ---
+
+def filas_csv_con_posiciones(ruta_csv, inicio=0):
+    """
+    Recorre el CSV desde el byte `inicio` generando (posición, fin, fila). csv.reader pide
+    las líneas de una en una y solo las que necesita cada fila (los mensajes pueden ocupar
+    varias), así que la posición de una fila es donde terminó la anterior.
+    """
+    with open(ruta_csv, "rb") as f:
+        f.seek(inicio)
+        leido = [inicio]
+
+        def lineas():
+            for linea in f:
+                leido[0] += len(linea)
+                yield linea.decode("utf-8")
+
+        posicion = inicio
+        for fila in csv.reader(lineas()):
+            yield posicion, leido[0], fila
+            posicion = leido[0]
+
+def leer_fila(f, posicion):
+    """Lee la fila del CSV que empieza en `posicion` de un archivo abierto en binario."""
+    f.seek(posicion)
+    lineas = (linea.decode("utf-8") for linea in f)
+    return next(csv.reader(lineas))
+
+def huella_csv(ruta_csv, hasta):
+    """Resumen del principio y el final de los primeros `hasta` bytes del CSV."""
+    resumen = hashlib.sha1()
+    with open(ruta_csv, "rb") as f:
+        resumen.update(f.read(min(BYTES_HUELLA, hasta)))
+        f.seek(max(0, hasta - BYTES_HUELLA))
+        resumen.update(f.read(hasta - f.tell()))
+    return resumen.hexdigest()
+
+# --- Construcción y actualización ---
+
+def abrir_indice(ruta_indice):
+    conexion = sqlite3.connect(ruta_indice)
+    conexion.executescript(ESQUEMA_INDICE)
+    return conexion
+
+def leer_meta(conexion):
+    meta = dict(conexion.execute("SELECT clave, valor FROM meta"))
+    return {
+        "version": int(meta.get("version", VERSION_INDICE)),
+        "num_mensajes": int(meta.get("num_mensajes", 0)),
+        "bytes_indexados": int(meta.get("bytes_indexados", 0)),
+        "huella": meta.get("huella", ""),
+        "siguiente_segmento": int(meta.get("siguiente_segmento", 1)),
+    }
+
+def guardar_meta(conexion, meta):
+    conexion.executemany("INSERT OR REPLACE INTO meta (clave, valor) VALUES (?, ?)", [(clave, str(valor)) for clave, valor in meta.items()])
+
+def vaciar_indice(conexion):
+    conexion.execute("DELETE FROM postings")
+    conexion.execute("DELETE FROM posiciones")
+    conexion.execute("DELETE FROM meta")
+
+def tokenizar_lote(textos):
+    return [tokenizar_texto(texto) for texto in textos]
+
+def tokenizar_textos(textos, pool=None):
+    """Tokeniza los textos de un segmento, en los procesos del pool si lo hay."""
+    if pool is None:
+        return tokenizar_lote(textos)
+    lotes = [textos[i:i + MENSAJES_POR_LOTE_TOKENIZACION] for i in range(0, len(textos), MENSAJES_POR_LOTE_TOKENIZACION)]
+    return [palabras for lote in pool.map(tokenizar_lote, lotes) for palabras in lote]
+
+def escribir_segmento(conexion, meta, filas, ruta_csv, pool=None):
+    """
+    Indexa un segmento de filas (posición, fin, fecha, autor, texto) y lo guarda con la meta en una
+    transacción: si la indexación se interrumpe, el índice queda válido hasta el último segmento.
+    """
+    primer_id = meta["num_mensajes"]
+    postings = defaultdict(lambda: array("I"))
+    palabras_por_mensaje = tokenizar_textos([texto for _, _, _, _, texto in filas], pool)
+    for id_mensaje, ((_, _, fecha, autor, _), palabras) in enumerate(zip(filas, palabras_por_mensaje), primer_id):
+        for termino in terminos_mensaje(fecha, autor, palabras):
+            postings[termino].append(id_mensaje)
+
+    segmento = meta["siguiente_segmento"]
+    posiciones = np.array([posicion for posicion, _, _, _, _ in filas], dtype="<u8")
+    meta["num_mensajes"] += len(filas)
+    meta["bytes_indexados"] = filas[-1][1]
+    meta["siguiente_segmento"] = segmento + 1
+    meta["huella"] = huella_csv(ruta_csv, meta["bytes_indexados"])
+    with conexion:
+        conexion.executemany(
+            "INSERT INTO postings (termino, segmento, num, datos) VALUES (?, ?, ?, ?)",
+            ((termino, segmento, len(ids), codificar_postings(ids)) for termino, ids in postings.items())
+        )
+        conexion.execute("INSERT INTO posiciones (primer_id, datos) VALUES (?, ?)", (primer_id, zlib.compress(posiciones.tobytes())))
+        guardar_meta(conexion, meta)
+
+def compactar_indice(conexion):
+    """Fusiona todos los segmentos en uno (segmento 0): cada término pasa a ser una sola fila."""
+    with conexion:
+        conexion.execute("DROP TABLE IF EXISTS postings_compactados")
+        conexion.execute("CREATE TABLE postings_compactados (termino TEXT, segmento INTEGER, num INTEGER, datos BLOB, PRIMARY KEY (termino, segmento)) WITHOUT ROWID")
+        filas = conexion.execute("SELECT termino, datos FROM postings ORDER BY termino, segmento")
+        for termino, grupo in groupby(filas, key=lambda fila: fila[0]):
+            ids = np.concatenate([decodificar_postings(datos) for _, datos in grupo])
+            conexion.execute("INSERT INTO postings_compactados VALUES (?, 0, ?, ?)", (termino, len(ids), codificar_postings(ids)))
+        conexion.execute("DROP TABLE postings")
+        conexion.execute("ALTER TABLE postings_compactados RENAME TO postings")
+    conexion.execute("VACUUM")
+
+def indexar_csv(ruta_csv, ruta_indice=None, workers=1):
+    """
+    Crea o actualiza el índice del CSV preprocesado. Si el CSV solo ha crecido (p. ej. se ha
+    vuelto a preprocesar una exportación más reciente del mismo chat) se indexan únicamente las
+    filas nuevas; si la parte ya indexada ha cambiado, el índice se reconstruye desde cero.
+
+    Returns:
+        int: Número de mensajes añadidos al índice.
+    """
+    ruta_indice = ruta_indice or ruta_indice_por_defecto(ruta_csv)
+    conexion = abrir_indice(ruta_indice)
+    meta = leer_meta(conexion)
+    tamaño_csv = os.path.getsize(ruta_csv)
+
+    if meta["bytes_indexados"] and (meta["version"] != VERSION_INDICE or meta["bytes_indexados"] > tamaño_csv
+                                    or huella_csv(ruta_csv, meta["bytes_indexados"]) != meta["huella"]):
+        print("⚠️ El CSV ya indexado ha cambiado: se reconstruye el índice.")
+        with conexion:
+            vaciar_indice(conexion)
+        meta = leer_meta(conexion)
+
+    inicio = meta["bytes_indexados"]
+    meta["version"] = VERSION_INDICE
+    progreso = nuevo_progreso("indexación", tamaño_csv - inicio, "bytes")
+    num_nuevos = 0
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        filas = []
+        for posicion, fin, fila in filas_csv_con_posiciones(ruta_csv, inicio):
+            if posicion == 0 or len(fila) != 3: # Cabecera o fila malformada
+                continue
+            fecha, autor, texto = fila
+            filas.append((posicion, fin, fecha, autor, texto))
+            if len(filas) == MENSAJES_POR_SEGMENTO:
+                escribir_segmento(conexion, meta, filas, ruta_csv, pool)
+                num_nuevos += len(filas)
+                informar_progreso(progreso, fin - inicio)
+                filas = []
+        if filas:
+            escribir_segmento(conexion, meta, filas, ruta_csv, pool)
+            num_nuevos += len(filas)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    terminar_progreso(progreso, tamaño_csv - inicio)
+
+    num_segmentos = conexion.execute("SELECT COUNT(DISTINCT segmento) FROM postings").fetchone()[0]
+    if num_segmentos > MAX_SEGMENTOS:
+        print(f"🗜️ Compactando {num_segmentos} segmentos del índice...")
+        compactar_indice(conexion)
+    conexion.close()
+    return num_nuevos
+
+# --- Consultas ---
+
+def ids_termino(conexion, termino):
+    """Mensajes que contienen un término (ordenados), uniendo las filas de todos los segmentos."""
+    filas = conexion.execute("SELECT datos FROM postings WHERE termino = ? ORDER BY segmento", (termino,)).fetchall()
+    if not filas:
+        return np.empty(0, dtype=np.int64)
+    return np.concatenate([decodificar_postings(datos) for datos, in filas])
+
+def ids_rango_terminos(conexion, desde, hasta):
+    """Unión de las posting lists de los términos entre `desde` y `hasta` (inclusive), p. ej. un rango de meses."""
+    filas = conexion.execute("SELECT datos FROM postings WHERE termino >= ? AND termino <= ?", (desde, hasta)).fetchall()
+    if not filas:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate([decodificar_postings(datos) for datos, in filas]))
+
+def cargar_posiciones(conexion, ids):
+    """Posición en el CSV de cada id, descomprimiendo solo los segmentos necesarios."""
+    primeros = np.array([primer_id for primer_id, in conexion.execute("SELECT primer_id FROM posiciones ORDER BY primer_id")], dtype=np.int64)
+    posiciones = {}
+    for indice_bloque, ids_bloque in groupby(ids, key=lambda i: int(np.searchsorted(primeros, i, side="right")) - 1):
+        primer_id = int(primeros[indice_bloque])
+        datos, = conexion.execute("SELECT datos FROM posiciones WHERE primer_id = ?", (primer_id,)).fetchone()
+        tabla = np.frombuffer(zlib.decompress(datos), dtype="<u8")
+        for id_mensaje in ids_bloque:
+            posiciones[id_mensaje] = int(tabla[id_mensaje - primer_id])
+    return posiciones
+
+def leer_mensajes(conexion, ruta_csv, ids):
+    """Lee del CSV los mensajes (fecha, autor, texto) de una lista ordenada de ids."""
+    posiciones = cargar_posiciones(conexion, [int(i) for i in ids])
+    with open(ruta_csv, "rb") as f:
+        return [tuple(leer_fila(f, posiciones[int(i)])) for i in ids]
+
+def contiene_secuencia(palabras, frase):
+    n = len(frase)
+    return any(palabras[i:i + n] == frase for i in range(len(palabras) - n + 1))
+
+def ids_frase(conexion, ruta_csv, frase):
+    """
+    Mensajes que contienen las palabras de `frase` seguidas. Una palabra es su término y dos
+    son su par indexado; con más, la intersección de los pares se comprueba sobre el texto.
+    """
+    if len(frase) == 1:
+        return ids_termino(conexion, frase[0])
+    pares = [f"{a} {b}" for a, b in zip(frase, frase[1:])]
+    candidatos = intersecar([ids_termino(conexion, par) for par in pares])
+    if len(frase) == 2 or len(candidatos) == 0:
+        return candidatos
+    mensajes = leer_mensajes(conexion, ruta_csv, candidatos)
+    return np.array([i for i, (_, _, texto) in zip(candidatos, mensajes) if contiene_secuencia(tokenizar_texto(texto), frase)], dtype=np.int64)
+
+def intersecar(listas):
+    """Intersección de listas de ids ordenadas, empezando por las más cortas."""
+    listas = sorted(listas, key=len)
+    resultado = listas[0]
+    for ids in listas[1:]:
+        if len(resultado) == 0:
+            break
+        resultado = np.intersect1d(resultado, ids, assume_unique=True)
+    return resultado
+
+def evaluar_elemento(conexion, ruta_csv, elemento):
+    """Ids de un elemento de la consulta: autor:X, mes:AAAA-MM, una palabra o una frase."""
+    if elemento.lower().startswith((PREFIJO_AUTOR, PREFIJO_MES)):
+        return ids_termino(conexion, elemento.lower())
+    palabras = tokenizar_texto(elemento)
+    if not palabras:
+        print(f"⚠️ '{elemento}' no contiene palabras indexables (solo se indexan letras) y se ignora.")
+        return None
+    return ids_frase(conexion, ruta_csv, palabras)
+
+def buscar(conexion, ruta_csv, consulta, num_mensajes):
+    """
+    Evalúa una consulta booleana. Los elementos separados por espacios deben cumplirse todos,
+    OR separa alternativas, un "-" delante excluye el elemento, las comillas forman frases y
+    autor:Nombre y mes:AAAA-MM filtran por autor y por mes.
+
+    Returns:
+        np.ndarray: Ids de los mensajes que cumplen la consulta, en orden cronológico.
+    """
+    alternativas = [[]]
+    for elemento in shlex.split(consulta):
+        if elemento == "OR":
+            alternativas.append([])
+        else:
+            alternativas[-1].append(elemento)
+
+    resultado = np.empty(0, dtype=np.int64)
+    for elementos in alternativas:
+        incluidos, excluidos = [], []
+        for elemento in elementos:
+            negado = elemento.startswith("-") and len(elemento) > 1
+            ids = evaluar_elemento(conexion, ruta_csv, elemento[1:] if negado else elemento)
+            if ids is not None:
+                (excluidos if negado else incluidos).append(ids)
+        if not incluidos and not excluidos:
+            continue
+        ids = intersecar(incluidos) if incluidos else np.arange(num_mensajes, dtype=np.int64)
+        for ids_excluidos in excluidos:
+            ids = np.setdiff1d(ids, ids_excluidos, assume_unique=True)
+        resultado = np.union1d(resultado, ids)
+    return resultado
+
+def filtrar(conexion, ids, autores=None, desde=None, hasta=None):
+    """Restringe los resultados a unos autores (cualquiera de ellos) y a un rango de meses AAAA-MM."""
+    if autores:
+        ids = np.intersect1d(ids, np.unique(np.concatenate([ids_termino(conexion, PREFIJO_AUTOR + autor.lower()) for autor in autores])), assume_unique=True)
+    if desde or hasta:
+        meses = ids_rango_terminos(conexion, PREFIJO_MES + (desde or "0000-00"), PREFIJO_MES + (hasta or "9999-99"))
+        ids = np.intersect1d(ids, meses, assume_unique=True)
+    return ids
+
+def indexar(args):
+    configurar_progreso(args.progreso)
+    inicio = time.perf_counter()
+    num_nuevos = indexar_csv(args.csv, args.indice, args.workers)
+    print(f"📇 {num_nuevos} mensajes nuevos indexados en {time.perf_counter() - inicio:.1f} s: {args.indice or ruta_indice_por_defecto(args.csv)}")
+
+def buscar_cli(args):
+    ruta_indice = args.indice or ruta_indice_por_defecto(args.csv)
+    if not os.path.exists(ruta_indice):
+        print(f"❌ No existe el índice {ruta_indice}. Créalo con: python3 indice_mensajes.py indexar {args.csv}")
+        return
+    conexion = sqlite3.connect(ruta_indice)
+    meta = leer_meta(conexion)
+    if meta["bytes_indexados"] < os.path.getsize(args.csv):
+        print("⚠️ El CSV tiene mensajes sin indexar; actualiza el índice con 'indexar' para incluirlos.")
+
+    inicio = time.perf_counter()
+    ids = buscar(conexion, args.csv, args.consulta, meta["num_mensajes"])
+    ids = filtrar(conexion, ids, args.autor, args.desde, args.hasta)
+    if args.recientes:
+        ids = ids[::-1]
+    mostrados = [] if args.contar else leer_mensajes(conexion, args.csv, ids[:args.limite])
+    milisegundos = (time.perf_counter() - inicio) * 1000
+    conexion.close()
+
+    print(f"🔎 {len(ids)} mensajes encontrados en {milisegundos:.1f} ms")
+    for fecha, autor, texto in mostrados:
+        print(f"[{fecha}] {autor}: {texto}")
+    if len(ids) > len(mostrados) and not args.contar:
+        print(f"... y {len(ids) - len(mostrados)} más (usa --limite para ver más)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice invertido y buscador de mensajes sobre el CSV preprocesado.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    p_indexar = subparsers.add_parser("indexar", help="Crea el índice o añade los mensajes nuevos del CSV.")
+    p_indexar.add_argument("csv", help="CSV preprocesado (prepocessing.py)")
+    p_indexar.add_argument("--indice", default=None, help="Ruta del índice (por defecto, junto al CSV con extensión .indice.sqlite).")
+    p_indexar.add_argument("--workers", type=int, default=1, help="Procesos para tokenizar en paralelo.")
+    añadir_argumento_progreso(p_indexar)
+    p_indexar.set_defaults(funcion=indexar)
+
+    p_buscar = subparsers.add_parser("buscar", help="Busca mensajes con una consulta booleana.")
+    p_buscar.add_argument("csv", help="CSV preprocesado ya indexado")
+    p_buscar.add_argument("consulta", help='Palabras (todas deben aparecer), "frases entre comillas", OR, -excluida, autor:Nombre, mes:AAAA-MM.')
+    p_buscar.add_argument("--indice", default=None, help="Ruta del índice (por defecto, junto al CSV con extensión .indice.sqlite).")
+    p_buscar.add_argument("--autor", action="append", default=None, help="Solo mensajes de este autor (se puede repetir).")
+    p_buscar.add_argument("--desde", default=None, help="Primer mes incluido (AAAA-MM).")
+    p_buscar.add_argument("--hasta", default=None, help="Último mes incluido (AAAA-MM).")
+    p_buscar.add_argument("--limite", type=int, default=20, help="Mensajes a mostrar.")
+    p_buscar.add_argument("--recientes", action="store_true", help="Muestra primero los mensajes más recientes.")
+    p_buscar.add_argument("--contar", action="store_true", help="Solo cuenta los mensajes, sin mostrarlos.")
+    p_buscar.set_defaults(funcion=buscar_cli)
+
+    args = parser.parse_args()
+    args.funcion(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,25 @@
 import re
 import csv
+import io
+import gzip
+import zipfile
+import heapq
+import math
+import calendar
+import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from dateutil import parser as date_parser
 import argparse
 from datetime import datetime
+from collections import Counter
+from functools import lru_cache
 import os
+import sys
+from progreso import (
+    PASO_PROGRESO, añadir_argumento_progreso, configurar_progreso,
+    nuevo_progreso, informar_progreso, terminar_progreso,
+)
 
 # Este patrón es clave. Si tus chats tienen un formato ligeramente diferente,
 # no se detectará ningún mensaje. Ejemplo: "DD/MM/AAAA, HH:MM - Nombre: Mensaje"
@@ -20,6 +36,11 @@ SISTEMA_PATRONES = [
     re.compile(r"^‎?.*cambió la foto del grupo"),
 ]
 
+# Firmas (magic bytes) de los formatos comprimidos admitidos como entrada
+FIRMA_ZIP = b"PK\x03\x04"
+FIRMA_GZIP = b"\x1f\x8b"
+FIRMA_ZSTD = b"\x28\xb5\x2f\xfd"
+
 META_AI_PATRON = re.compile(r"^Meta AI$")
 CONTACTO_NO_AÑADIDO_PATRON = re.compile(r"^\+\d[\d\s]+")
 
@@ -48,13 +69,25 @@ def es_mensaje_de_meta_ai(autor):
 def es_contacto_no_añadido(autor):
     return bool(CONTACTO_NO_AÑADIDO_PATRON.match(autor.strip()))
 
-def normalizar_fecha(date_str, time_str):
+@lru_cache(maxsize=4096)
+def interpretar_dia(date_str):
+    """Fecha "DD/MM/AA(AA)" de una cabecera según dateutil, o None si es ilegible. Se repite en todos los mensajes del día."""
     try:
-        dt = date_parser.parse(f"{date_str} {time_str}", dayfirst=True)
-        return dt.isoformat()
+        return date_parser.parse(date_str, dayfirst=True)
     except Exception:
         return None
 
+def normalizar_fecha(date_str, time_str):
+    # Interpretar la fecha es lo costoso: se hace una vez por día y la hora "HH:MM" se suma directamente
+    dia = interpretar_dia(date_str)
+    if dia is None:
+        return None
+    try:
+        horas, minutos = time_str.split(":")
+        return dia.replace(hour=int(horas), minute=int(minutos)).isoformat()
+    except ValueError:
+        return None
+
 def limpiar_csv_de_nuls(input_path):
     """
     Elimina caracteres NUL (\x00) del archivo CSV sobrescribiendo el original.
@@ -67,52 +100,501 @@ def limpiar_csv_de_nuls(input_path):
     os.replace(temp_path, input_path)
     print(f"🧹 Limpieza de caracteres NUL completada: {input_path}")
 
-def preprocesar_chat(input_path, output_path, nickname_mapping):
-    mensajes = []
-    line_num = 0
-    with open(input_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line_num += 1
-            line = line.strip().replace('‎', '').replace('\x00', '')
+def buscar_chat_en_zip(zf):
+    """
+    Localiza el .txt del chat dentro de un .zip exportado por WhatsApp.
+    Prioriza los nombres típicos de la exportación y, si no, el .txt más grande.
+    """
+    candidatos = [info for info in zf.infolist() if info.filename.lower().endswith(".txt") and not info.is_dir()]
+    if not candidatos:
+        raise ValueError(f"No se encontró ningún archivo .txt dentro de {zf.filename}")
+    for info in candidatos:
+        nombre = os.path.basename(info.filename).lower()
+        if nombre.startswith(("chat de whatsapp", "whatsapp chat", "_chat")):
+            return info
+    return max(candidatos, key=lambda info: info.file_size)
+
+# Máximo tamaño descomprimido por byte de deflate (~1032:1): por debajo de este tamaño comprimido
+# el texto no puede pasar de 4 GB y el tamaño que guarda el gzip (módulo 2**32) es exacto
+MAX_GZIP_SIN_DESBORDE = 2**32 // 1032
+
+def importar_zstandard():
+    """Importa zstandard, que solo hace falta para los chats .zst, con un mensaje claro si no está instalado."""
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Para leer archivos .zst instala el paquete 'zstandard' (python3 -m pip install zstandard).") from None
+    return zstandard
+
+def abrir_chat(input_path):
+    """
+    Abre el chat exportado como flujo de texto, sea .txt plano, .zip, .gz o .zst.
+    El formato se detecta por los primeros bytes y se descomprime en streaming,
+    sin extraer nada a disco.
+    """
+    with open(input_path, "rb") as f:
+        firma = f.read(4)
+
+    if firma.startswith(FIRMA_ZIP):
+        # El ZipExtFile mantiene abierto el archivo subyacente aunque se cierre el ZipFile
+        with zipfile.ZipFile(input_path) as zf:
+            binario = zf.open(buscar_chat_en_zip(zf))
+    elif firma.startswith(FIRMA_GZIP):
+        binario = gzip.open(input_path, "rb")
+    elif firma.startswith(FIRMA_ZSTD):
+        zstandard = importar_zstandard()
+        binario = zstandard.ZstdDecompressor().stream_reader(open(input_path, "rb"), closefd=True)
+    else:
+        return open(input_path, "r", encoding="utf-8")
+
+    return io.TextIOWrapper(binario, encoding="utf-8")
+
+def tamaño_descomprimido(input_path):
+    """
+    Tamaño en bytes del texto del chat una vez descomprimido, para calcular el progreso de la
+    lectura. Devuelve None si el formato no lo guarda (zstd sin tamaño en la cabecera), o si no
+    es fiable: el gzip guarda el tamaño módulo 2**32, y solo un gzip pequeño (MAX_GZIP_SIN_DESBORDE)
+    garantiza que el texto no pasa de 4 GB.
+    """
+    tamaño_archivo = os.path.getsize(input_path)
+    with open(input_path, "rb") as f:
+        firma = f.read(4)
+        if firma.startswith(FIRMA_ZIP):
+            with zipfile.ZipFile(input_path) as zf:
+                return buscar_chat_en_zip(zf).file_size
+        if firma.startswith(FIRMA_GZIP):
+            # Los últimos 4 bytes del gzip guardan el tamaño original módulo 2**32
+            f.seek(-4, os.SEEK_END)
+            tamaño = int.from_bytes(f.read(4), "little")
+            return tamaño if tamaño_archivo <= MAX_GZIP_SIN_DESBORDE else None
+        if firma.startswith(FIRMA_ZSTD):
+            zstandard = importar_zstandard()
+            f.seek(0)
+            tamaño = zstandard.get_frame_parameters(f.read(18)).content_size
+            return None if tamaño in (zstandard.CONTENTSIZE_UNKNOWN, zstandard.CONTENTSIZE_ERROR) else tamaño
+    return tamaño_archivo
+
+def lineas_con_progreso(f, progreso):
+    """Recorre las líneas de un chat abierto con abrir_chat informando de los bytes descomprimidos leídos."""
+    binario = f.buffer
+    for i, linea in enumerate(f, 1):
+        if not i % PASO_PROGRESO:
+            informar_progreso(progreso, binario.tell())
+        yield linea
 
-            match = INPUT_PATTERN.match(line)
-            if match:
-                fecha, hora, autor, texto = match.groups()
-                autor = autor.strip()
+def analizar_cabecera(line, normalizar=True):
+    """
+    Interpreta una línea ya limpia del chat. Devuelve None si no es una cabecera (la línea
+    continúa el mensaje anterior), False si es una cabecera que se descarta (mensajes de
+    sistema, de Meta AI o de contactos no añadidos, o fecha ilegible) y, si no, (fecha_iso, autor, texto).
+    Con normalizar=False la fecha se devuelve sin interpretar, como (fecha, hora), y no se valida:
+    interpretarla con dateutil es lo más costoso del preprocesamiento.
+    """
+    match = INPUT_PATTERN.match(line)
+    if not match:
+        return None
+    fecha, hora, autor, texto = match.groups()
+    autor = autor.strip()
+
+    if es_contacto_no_añadido(autor) or es_mensaje_de_meta_ai(autor) or es_mensaje_de_sistema(texto):
+        return False
+    if not normalizar:
+        return (fecha, hora), autor, texto
+
+    fecha_normalizada = normalizar_fecha(fecha, hora)
+    if not fecha_normalizada:
+        return False
+    return fecha_normalizada, autor, texto
+
+def iterar_mensajes_lineas(lineas, nickname_mapping, normalizar_fechas=True):
+    """
+    Genera los mensajes limpios a partir de las líneas del chat como listas [fecha_iso, autor, mensaje].
+    Un mensaje se emite cuando aparece la cabecera del siguiente, ya que las líneas sin
+    cabecera son continuaciones del mensaje anterior.
+    """
+    mensaje_actual = None
+    for line in lineas:
+        line = line.strip().replace('‎', '').replace('\x00', '')
+
+        cabecera = analizar_cabecera(line, normalizar_fechas)
+        if cabecera:
+            fecha_normalizada, autor, texto = cabecera
+            if autor in nickname_mapping:
+                autor = nickname_mapping[autor]
+            if mensaje_actual is not None:
+                yield mensaje_actual
+            mensaje_limpio = texto.strip().replace('\x00', '')
+            mensaje_actual = [fecha_normalizada, autor, mensaje_limpio]
+        elif cabecera is None and mensaje_actual is not None:
+            mensaje_actual[2] += "\n" + line.replace('\x00', '')
+
+    if mensaje_actual is not None:
+        yield mensaje_actual
+
+def iterar_mensajes_chat(input_path, nickname_mapping, normalizar_fechas=True, progreso=None):
+    """
+    Genera los mensajes limpios del chat como listas [fecha_iso, autor, mensaje], en streaming.
+    Con `progreso` (ver progreso.nuevo_progreso, unidad "bytes") se informa de lo leído.
+    """
+    with abrir_chat(input_path) as f:
+        lineas = f if progreso is None else lineas_con_progreso(f, progreso)
+        yield from iterar_mensajes_lineas(lineas, nickname_mapping, normalizar_fechas)
+
+# --- Muestreo para la vista previa aproximada ---
+
+def recortar_reservas(reservas, conteos, total, tamaño, estrato_actual):
+    """
+    Reduce la reserva de cada estrato ya cerrado a la mayor cuota que todavía puede recibir:
+    el total solo crece, así que la cuota final nunca supera ceil(tamaño * conteo / total).
+    """
+    for estrato, reserva in reservas.items():
+        limite = math.ceil(tamaño * conteos[estrato] / total)
+        if estrato != estrato_actual and len(reserva) > limite:
+            reservas[estrato] = heapq.nlargest(limite, reserva)
+            heapq.heapify(reservas[estrato])
+
+def muestrear_reservorio(elementos, tamaño, clave_estrato=None, semilla=None):
+    """
+    Muestreo aleatorio simple de `tamaño` elementos en una sola pasada (reservorio con claves
+    aleatorias: se conservan los de clave más baja). Con `clave_estrato` (p. ej. el mes) la
+    muestra se estratifica con asignación proporcional, de modo que cada elemento sigue
+    representando a total/tamaño elementos. Los estratos deben llegar consecutivos (como los
+    meses de un chat); así la memoria se mantiene por debajo de unas 2 * tamaño entradas.
+
+    Returns:
+        tuple: (muestra en el orden original, Counter con el número de elementos leídos de cada estrato)
+    """
+    rng = random.Random(semilla)
+    reservas = {}
+    conteos = Counter()
+    total = 0
+    estrato_actual = None
+    for indice, elemento in enumerate(elementos):
+        estrato = clave_estrato(elemento) if clave_estrato else None
+        total += 1
+        if estrato != estrato_actual:
+            recortar_reservas(reservas, conteos, total, tamaño, estrato)
+            estrato_actual = estrato
+        conteos[estrato] += 1
 
-                if es_contacto_no_añadido(autor) or es_mensaje_de_meta_ai(autor) or es_mensaje_de_sistema(texto):
-                    continue
+        # Montículo de las claves más bajas, guardadas en negativo para tener la mayor en la cima
+        reserva = reservas.setdefault(estrato, [])
+        clave = rng.random()
+        if len(reserva) < tamaño:
+            heapq.heappush(reserva, (-clave, indice, elemento))
+        elif clave < -reserva[0][0]:
+            heapq.heapreplace(reserva, (-clave, indice, elemento))
 
-                if autor in nickname_mapping:
-                    autor = nickname_mapping[autor]
+    # Asignación proporcional por restos mayores, limitada a lo que conserva cada reserva
+    tamaño_final = min(tamaño, total)
+    exactas = {estrato: tamaño_final * conteo / total for estrato, conteo in conteos.items()}
+    cuotas = {estrato: int(exacta) for estrato, exacta in exactas.items()}
+    restantes = tamaño_final - sum(cuotas.values())
+    for estrato in sorted(exactas, key=lambda e: exactas[e] - cuotas[e], reverse=True)[:restantes]:
+        cuotas[estrato] += 1
 
-                fecha_normalizada = normalizar_fecha(fecha, hora)
-                if fecha_normalizada:
-                    mensaje_limpio = texto.strip().replace('\x00', '')
-                    mensajes.append([fecha_normalizada, autor, mensaje_limpio])
-            elif mensajes:
-                mensajes[-1][2] += "\n" + line.replace('\x00', '')
+    seleccion = []
+    for estrato, reserva in reservas.items():
+        seleccion.extend(heapq.nlargest(min(cuotas[estrato], len(reserva)), reserva))
+    seleccion.sort(key=lambda entrada: entrada[1])
+    return [elemento for _, _, elemento in seleccion], conteos
 
+# Reglas de dateutil (p. ej. el siglo de los años de dos cifras) para interpretar fechas sin llamarlo
+INFO_FECHAS = date_parser.parserinfo()
+
+def mes_cabecera(fecha, hora, meses):
+    """
+    Mes (año, mes) de una cabecera con la fecha sin interpretar ("DD/MM/AAAA" o "DD/MM/AA", "HH:MM"),
+    o None si normalizar_fecha no la aceptaría. Cada fecha se interpreta una sola vez (caché `meses`).
+    """
+    horas, minutos = hora.split(":")
+    if int(horas) > 23 or int(minutos) > 59:
+        return None
+    if fecha not in meses:
+        dia, mes, texto_año = fecha.split("/")
+        dia, mes, año = int(dia), int(mes), int(texto_año)
+        if len(texto_año) <= 2:
+            año = INFO_FECHAS.convertyear(año) # El mismo siglo que elegiría dateutil
+        if 1 <= mes <= 12 and 1 <= año and 1 <= dia <= calendar.monthrange(año, mes)[1]:
+            meses[fecha] = (año, mes) # Fecha DD/MM válida: dateutil la leería igual
+        else:
+            # Día y mes que dateutil intercambia o rechaza
+            try:
+                dt = date_parser.parse(fecha, dayfirst=True)
+                meses[fecha] = (dt.year, dt.month)
+            except Exception:
+                meses[fecha] = None
+    return meses[fecha]
+
+def muestrear_chat(input_path, nickname_mapping, tamaño, por_mes=False, semilla=None):
+    """
+    Muestrea el chat exportado en una sola lectura secuencial. Solo se reconocen las cabeceras;
+    las fechas se interpretan completas únicamente para los mensajes de la muestra, y del resto
+    solo cada día distinto una vez, para descartar (sin contarlos) los de fecha ilegible igual
+    que el preprocesamiento completo.
+
+    Returns:
+        tuple: (muestra como listas [fecha_iso, autor, mensaje], Counter de mensajes por estrato
+            ((año, mes) con por_mes, o None), conjunto de autores)
+    """
+    usuarios = set()
+    meses = {}
+
+    def filtrar_y_registrar_autores(mensajes):
+        # Los mensajes de fecha ilegible se descartan antes de contarlos en los estratos
+        for mensaje in mensajes:
+            if mes_cabecera(*mensaje[0], meses) is not None:
+                usuarios.add(mensaje[1])
+                yield mensaje
+
+    progreso = nuevo_progreso("muestreo", tamaño_descomprimido(input_path), "bytes")
+    mensajes = filtrar_y_registrar_autores(iterar_mensajes_chat(input_path, nickname_mapping, normalizar_fechas=False, progreso=progreso))
+    estrato_mes = (lambda mensaje: meses[mensaje[0][0]]) if por_mes else None
+    muestra, conteos = muestrear_reservorio(mensajes, tamaño, estrato_mes, semilla)
+    terminar_progreso(progreso, progreso["total"] or progreso["hecho"])
+
+    return [[normalizar_fecha(fecha, hora), autor, texto] for (fecha, hora), autor, texto in muestra], conteos, usuarios
+
+# --- Preprocesamiento en paralelo de un único .txt grande ---
+
+# Bloques por proceso: más bloques que procesos reparte mejor la carga si unos bloques son más lentos
+BLOQUES_POR_PROCESO = 4
+TAMAÑO_LECTURA_BLOQUE = 16 * 1024 * 1024
+
+def es_texto_plano(input_path):
+    """Indica si el archivo es texto sin comprimir (solo estos se pueden trocear por posición de byte)."""
+    with open(input_path, "rb") as f:
+        firma = f.read(4)
+    return not firma.startswith((FIRMA_ZIP, FIRMA_GZIP, FIRMA_ZSTD))
+
+def calcular_bloques(input_path, num_bloques):
+    """
+    Divide el archivo en rangos de bytes [inicio, fin). Cada corte se desplaza hasta la
+    siguiente línea que empieza un mensaje, de modo que las continuaciones multilínea
+    nunca quedan separadas de su cabecera.
+    """
+    tamaño = os.path.getsize(input_path)
+    cortes = [0]
+    with open(input_path, "rb") as f:
+        for i in range(1, num_bloques):
+            objetivo = tamaño * i // num_bloques
+            if objetivo <= cortes[-1]:
+                continue
+            f.seek(objetivo - 1)
+            f.readline() # Resto de la línea en la que cae el corte
+            while True:
+                posicion = f.tell()
+                linea = f.readline()
+                if not linea:
+                    break
+                # En modo texto un '\r' suelto también termina la línea: solo cuenta el primer trozo
+                linea = linea.decode("utf-8", "replace").split("\r")[0]
+                if analizar_cabecera(linea.strip().replace('‎', '').replace('\x00', '')):
+                    if posicion > cortes[-1]:
+                        cortes.append(posicion)
+                    break
+    cortes.append(tamaño)
+    return list(zip(cortes[:-1], cortes[1:]))
+
+def leer_lineas_bloque(input_path, inicio, fin):
+    """
+    Lee las líneas del rango de bytes [inicio, fin) igual que las leería open() en modo texto
+    (UTF-8 y saltos de línea universales), por trozos para no cargar el bloque entero.
+    """
+    with open(input_path, "rb") as f:
+        f.seek(inicio)
+        pendiente = fin - inicio
+        resto = b""
+        while pendiente > 0:
+            datos = f.read(min(TAMAÑO_LECTURA_BLOQUE, pendiente))
+            if not datos:
+                break
+            pendiente -= len(datos)
+            datos = resto + datos
+            # Se corta tras el último '\n' para no partir líneas ni caracteres multibyte
+            corte = datos.rfind(b"\n") + 1 if pendiente > 0 else len(datos)
+            resto = datos[corte:]
+            yield from io.StringIO(datos[:corte].decode("utf-8"), newline=None)
+
+def preprocesar_bloque(tarea):
+    """Procesa un bloque en un proceso del pool y escribe sus filas en un CSV parcial (sin cabecera)."""
+    input_path, inicio, fin, ruta_parcial, nickname_mapping = tarea
+    num_mensajes = 0
+    with open(ruta_parcial, "w", encoding="utf-8", newline='') as f_out:
+        writer = csv.writer(f_out, quoting=csv.QUOTE_MINIMAL, escapechar='\\')
+        for mensaje in iterar_mensajes_lineas(leer_lineas_bloque(input_path, inicio, fin), nickname_mapping):
+            writer.writerow(mensaje)
+            num_mensajes += 1
+    return num_mensajes
+
+def preprocesar_en_paralelo(input_path, f_out, nickname_mapping, workers):
+    """
+    Trocea el .txt en bloques alineados a cabeceras de mensaje, los procesa en un pool de
+    procesos y concatena los CSV parciales en el orden original. El resultado es idéntico
+    al del procesamiento en serie.
+    """
+    bloques = calcular_bloques(input_path, workers * BLOQUES_POR_PROCESO)
+    rutas_parciales = [f"{f_out.name}.parte{i}" for i in range(len(bloques))]
+    tareas = [(input_path, inicio, fin, ruta, nickname_mapping) for (inicio, fin), ruta in zip(bloques, rutas_parciales)]
+    progreso = nuevo_progreso(f"preprocesamiento ({workers} procesos)", os.path.getsize(input_path), "bytes")
+    num_mensajes = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Los bloques se informan al terminar, en el orden del archivo
+            for (inicio, fin), mensajes_bloque in zip(bloques, pool.map(preprocesar_bloque, tareas)):
+                num_mensajes += mensajes_bloque
+                informar_progreso(progreso, progreso["hecho"] + fin - inicio)
+        terminar_progreso(progreso)
+        f_out.flush()
+        for ruta in rutas_parciales:
+            with open(ruta, "r", encoding="utf-8", newline='') as f_parcial:
+                shutil.copyfileobj(f_parcial, f_out)
+    finally:
+        for ruta in rutas_parciales:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+    print(f"⚡ {len(bloques)} bloques procesados con {workers} procesos")
+    return num_mensajes
+
+def numerar_mensajes_por_minuto(mensajes):
+    """
+    Añade a cada mensaje su ordinal entre los mensajes idénticos (mismo autor y texto)
+    del mismo minuto, para distinguir repeticiones legítimas como dos "ok" seguidos.
+    """
+    minuto_actual = None
+    vistos = {}
+    for fecha, autor, texto in mensajes:
+        if fecha != minuto_actual:
+            minuto_actual = fecha
+            vistos = {}
+        ordinal = vistos.get((autor, texto), 0)
+        vistos[(autor, texto)] = ordinal + 1
+        yield fecha, autor, texto, ordinal
+
+def marcar_ultimo_mensaje(mensajes, exportacion):
+    """Añade a cada mensaje numerado el índice de su exportación y si es el último de ella."""
+    anterior = None
+    for mensaje in mensajes:
+        if anterior is not None:
+            yield (*anterior, exportacion, False)
+        anterior = mensaje
+    if anterior is not None:
+        yield (*anterior, exportacion, True)
+
+def fusionar_exportaciones(rutas, nickname_mapping):
+    """
+    Une varias exportaciones solapadas de un mismo chat en un único flujo ordenado y sin duplicados.
+
+    Cada exportación ya está en orden cronológico, así que se mezclan por fecha con heapq.merge
+    (memoria O(exportaciones)). Un mensaje se identifica por (fecha, autor, texto, ordinal dentro
+    del minuto); como todos los mensajes de un minuto salen seguidos de la mezcla, basta con
+    guardar los del minuto en curso y emitirlos al cambiar de minuto.
+
+    El último mensaje de una exportación puede estar cortado (sin sus líneas de continuación).
+    Se descarta si otra exportación tiene, en el mismo minuto y del mismo autor, un mensaje que
+    empieza por su texto seguido de más líneas, salvo que alguna otra exportación también lo
+    tenga idéntico (entonces es un mensaje completo). Dentro de un minuto se respeta el orden
+    de las exportaciones aunque una de ellas empiece o acabe a mitad de minuto.
+    """
+    flujos = [marcar_ultimo_mensaje(numerar_mensajes_por_minuto(iterar_mensajes_chat(ruta, nickname_mapping)), i)
+              for i, ruta in enumerate(rutas)]
+    minuto_actual = None
+    mensajes_minuto = {} # {(autor, texto, ordinal): [exportación, cortado]}
+    claves_por_exportacion = {} # {exportación: [claves del minuto en su orden]}
+    num_duplicados = 0
+
+    def ordenar_minuto():
+        # Una exportación que empieza a mitad de minuto solo tiene el final de ese minuto: se parte
+        # del orden de la que más mensajes tiene y se intercalan los que falten tras su predecesor
+        orden = []
+        for claves in sorted(claves_por_exportacion.values(), key=len, reverse=True):
+            posicion = 0
+            for clave in claves:
+                if clave in orden:
+                    posicion = orden.index(clave) + 1
+                else:
+                    orden.insert(posicion, clave)
+                    posicion += 1
+        return orden
+
+    def emitir_minuto():
+        nonlocal num_duplicados
+        for clave in ordenar_minuto():
+            autor, texto, _ = clave
+            exportacion, cortado = mensajes_minuto[clave]
+            if cortado and any(otro_autor == autor and otra != exportacion and otro_texto.startswith(texto + "\n")
+                               for (otro_autor, otro_texto, _), (otra, _) in mensajes_minuto.items()):
+                num_duplicados += 1
+                continue
+            yield [minuto_actual, autor, texto]
+
+    for fecha, autor, texto, ordinal, exportacion, ultimo in heapq.merge(*flujos, key=lambda mensaje: mensaje[0]):
+        if fecha != minuto_actual:
+            yield from emitir_minuto()
+            minuto_actual = fecha
+            mensajes_minuto = {}
+            claves_por_exportacion = {}
+        clave = (autor, texto, ordinal)
+        claves_por_exportacion.setdefault(exportacion, []).append(clave)
+        if clave in mensajes_minuto:
+            num_duplicados += 1
+            if mensajes_minuto[clave][0] != exportacion and not ultimo:
+                mensajes_minuto[clave][1] = False # Otra exportación lo tiene igual y no al final: está completo
+            continue
+        mensajes_minuto[clave] = [exportacion, ultimo]
+    yield from emitir_minuto()
+
+    print(f"🔁 {len(rutas)} exportaciones fusionadas: {num_duplicados} mensajes duplicados descartados")
+
+def preprocesar_chat(input_path, output_path, nickname_mapping, workers=1):
+    rutas = list(input_path) if isinstance(input_path, (list, tuple)) else [input_path]
+    num_mensajes = 0
     with open(output_path, "w", encoding="utf-8", newline='') as f_out:
         writer = csv.writer(f_out, quoting=csv.QUOTE_MINIMAL, escapechar='\\')
         writer.writerow(["fecha", "nombre", "mensaje"])
-        writer.writerows(mensajes)
+        if workers > 1 and len(rutas) == 1 and es_texto_plano(rutas[0]):
+            num_mensajes = preprocesar_en_paralelo(rutas[0], f_out, nickname_mapping, workers)
+        else:
+            if workers > 1:
+                print("⚠️ Solo un único .txt sin comprimir se puede procesar en paralelo. Se procesará en serie.")
+            # Varias rutas se tratan como exportaciones solapadas de un mismo chat; su progreso
+            # se mide en mensajes escritos, y el de un único chat en bytes leídos.
+            fusion = len(rutas) > 1
+            if fusion:
+                progreso = nuevo_progreso("fusión de exportaciones")
+                mensajes = fusionar_exportaciones(rutas, nickname_mapping)
+            else:
+                progreso = nuevo_progreso("preprocesamiento", tamaño_descomprimido(rutas[0]), "bytes")
+                mensajes = iterar_mensajes_chat(rutas[0], nickname_mapping, progreso=progreso)
+            for mensaje in mensajes:
+                writer.writerow(mensaje)
+                num_mensajes += 1
+                if fusion and not num_mensajes % PASO_PROGRESO:
+                    informar_progreso(progreso, num_mensajes)
+            terminar_progreso(progreso, num_mensajes if fusion else progreso["total"] or progreso["hecho"])
 
-    print(f"☑️ {len(mensajes)} mensajes procesados. Guardado en: {output_path}")
+    print(f"☑️ {num_mensajes} mensajes procesados. Guardado en: {output_path}")
 
     # Limpieza final de caracteres NUL en el archivo generado
     limpiar_csv_de_nuls(output_path)
 
 def main():
     parser = argparse.ArgumentParser(description="Preprocesador de chats de WhatsApp (salida en CSV).")
-    parser.add_argument("input_file", help="Ruta al archivo .txt original exportado de WhatsApp")
+    parser.add_argument("input_files", nargs="+", help="Ruta al archivo exportado de WhatsApp (.txt, .zip, .txt.gz o .txt.zst). Si se indican varias, se tratan como exportaciones solapadas del mismo chat y se fusionan sin duplicados")
     parser.add_argument("output_file", help="Ruta al archivo de salida .csv")
     parser.add_argument("--nicks", default="nickname_mapping.csv", help="Archivo CSV con apodos y nombres reales")
+    parser.add_argument("--workers", type=int, default=1, help="Procesos para preprocesar en paralelo un único .txt grande (por defecto 1, en serie)")
+    añadir_argumento_progreso(parser)
     args = parser.parse_args()
+    configurar_progreso(args.progreso)
 
     nickname_mapping = cargar_nickname_mapping(args.nicks)
 
-    preprocesar_chat(args.input_file, args.output_file, nickname_mapping)
+    try:
+        preprocesar_chat(args.input_files, args.output_file, nickname_mapping, args.workers)
+    except ImportError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,114 @@
+import sys
+import json
+import time
+
+# Informes de progreso de las etapas largas (preprocesamiento, análisis y dashboard).
+# Se escriben en stderr para no mezclarse con la salida normal de los scripts:
+#   - "texto": una línea legible como mucho cada INTERVALO_PROGRESO_SEGUNDOS.
+#   - "json": una línea JSON por informe, para planificadores de trabajos.
+#   - "no": sin informes.
+MODOS_PROGRESO = ("texto", "json", "no")
+INTERVALO_PROGRESO_SEGUNDOS = 2.0
+# Los bucles calientes solo llaman a informar_progreso una vez cada PASO_PROGRESO elementos,
+# y informar_progreso solo consulta el reloj: el coste por mensaje es una comparación.
+PASO_PROGRESO = 1024
+
+CONFIGURACION_PROGRESO = {"modo": "texto", "intervalo": INTERVALO_PROGRESO_SEGUNDOS}
+
+def configurar_progreso(modo="texto", intervalo=INTERVALO_PROGRESO_SEGUNDOS):
+    """Fija el modo de los informes de progreso de todo el proceso ("texto", "json" o "no")."""
+    if modo not in MODOS_PROGRESO:
+        raise ValueError(f"Modo de progreso desconocido: {modo} (usa {', '.join(MODOS_PROGRESO)})")
+    CONFIGURACION_PROGRESO["modo"] = modo
+    CONFIGURACION_PROGRESO["intervalo"] = intervalo
+
+def añadir_argumento_progreso(parser):
+    """Añade --progreso al parser de un script."""
+    parser.add_argument("--progreso", choices=MODOS_PROGRESO, default="texto",
+                        help="Informes de progreso en stderr: texto legible, líneas JSON o ninguno.")
+
+def nuevo_progreso(etapa, total=None, unidad="mensajes"):
+    """
+    Crea el estado del progreso de una etapa.
+
+    Args:
+        etapa (str): Nombre de la etapa que aparece en los informes.
+        total (int): Cantidad total esperada, o None si no se conoce (no habrá porcentaje ni ETA).
+        unidad (str): "bytes" se muestra en MB; cualquier otra se muestra tal cual.
+    """
+    inicio = time.monotonic()
+    return {
+        "etapa": etapa,
+        "total": total,
+        "unidad": unidad,
+        "inicio": inicio,
+        "ultimo_informe": inicio,
+        "hecho": 0,
+        "informes": 0,
+    }
+
+def formatear_cantidad(valor, unidad):
+    if unidad == "bytes":
+        return f"{valor / 1e6:.1f} MB"
+    return f"{valor:,.0f} {unidad}".replace(",", ".")
+
+def formatear_segundos(segundos):
+    minutos, segundos = divmod(int(round(segundos)), 60)
+    horas, minutos = divmod(minutos, 60)
+    if horas:
+        return f"{horas} h {minutos:02d} min"
+    if minutos:
+        return f"{minutos} min {segundos:02d} s"
+    return f"{segundos} s"
+
+def emitir_progreso(progreso, ahora, fin=False):
+    """Escribe un informe con la cantidad hecha, el ritmo y, si hay total, el porcentaje y la ETA."""
+    transcurrido = ahora - progreso["inicio"]
+    hecho, total, unidad = progreso["hecho"], progreso["total"], progreso["unidad"]
+    ritmo = hecho / transcurrido if transcurrido > 0 else 0.0
+    eta = (total - hecho) / ritmo if total and ritmo > 0 and not fin else None
+    progreso["informes"] += 1
+
+    if CONFIGURACION_PROGRESO["modo"] == "json":
+        linea = json.dumps({
+            "etapa": progreso["etapa"],
+            "hecho": hecho,
+            "total": total,
+            "unidad": unidad,
+            "por_segundo": round(ritmo, 1),
+            "transcurrido_segundos": round(transcurrido, 2),
+            "eta_segundos": None if eta is None else round(eta, 1),
+            "fin": fin,
+        }, ensure_ascii=False)
+    else:
+        partes = [formatear_cantidad(hecho, unidad)]
+        if total:
+            partes[0] += f" / {formatear_cantidad(total, unidad)} ({100 * hecho / total:.0f}%)"
+        partes.append(f"{formatear_cantidad(ritmo, unidad)}/s")
+        if fin:
+            partes.append(f"completado en {formatear_segundos(transcurrido)}")
+        elif eta is not None:
+            partes.append(f"ETA {formatear_segundos(eta)}")
+        linea = f"⏳ {progreso['etapa']}: " + " · ".join(partes)
+    print(linea, file=sys.stderr, flush=True)
+
+def informar_progreso(progreso, hecho):
+    """Actualiza la cantidad hecha e informa si ha pasado el intervalo desde el último informe."""
+    progreso["hecho"] = hecho
+    if CONFIGURACION_PROGRESO["modo"] == "no":
+        return
+    ahora = time.monotonic()
+    if ahora - progreso["ultimo_informe"] >= CONFIGURACION_PROGRESO["intervalo"]:
+        progreso["ultimo_informe"] = ahora
+        emitir_progreso(progreso, ahora)
+
+def terminar_progreso(progreso, hecho=None):
+    """
+    Cierra la etapa. En modo JSON siempre se emite el informe final; en modo texto solo si
+    la etapa ya había informado (las etapas cortas no ensucian la salida).
+    """
+    if hecho is not None:
+        progreso["hecho"] = hecho
+    modo = CONFIGURACION_PROGRESO["modo"]
+    if modo == "json" or (modo == "texto" and progreso["informes"]):
+        emitir_progreso(progreso, time.monotonic(), fin=True)
@@ -1,7 +1,20 @@
 #!/bin/bash
 
 # Script para ejecutar el pipeline de analisis de chats de WhatsApp para múltiples archivos.
-# Uso: ./run_pipeline.sh [-i] <ruta_al_archivo_chat1.txt> [<ruta_al_archivo_chat2.txt> ...]
+# Uso: ./run_pipeline.sh [-i] [-s <servidor>] <ruta_al_archivo_chat1.txt> [<ruta_al_archivo_chat2.txt> ...]
+# Cada chat puede ser un .txt plano, el .zip exportado por WhatsApp, un .txt.gz o un .txt.zst.
+# Con -s los chats se envían a un servidor_analisis.py ya arrancado (puerto, host:puerto o
+# ruta de socket Unix), que tiene las librerías cargadas y no escribe CSV intermedios.
+# Con -m todos los archivos se tratan como exportaciones solapadas de un mismo chat: se fusionan
+# sin mensajes duplicados y se genera un único dashboard con el nombre del primero.
+# Con -n <mensajes> se genera una vista previa aproximada (<chat>_preview.html) analizando solo una
+# muestra aleatoria de ese tamaño, estratificada por mes, tras una única lectura del chat.
+# Con -p <texto|json|no> se elige cómo informan del progreso (en stderr) los pasos largos:
+# texto legible (por defecto), una línea JSON por informe para planificadores, o nada.
+# Con -b se conserva el CSV preprocesado y se crea (o actualiza con los mensajes nuevos) su índice
+# de búsqueda, para consultarlo con: python3 indice_mensajes.py buscar <csv> "consulta".
+# Con -a <año|trimestre> se genera además un dashboard por periodo (<chat>_<periodo>_dashboard.html),
+# calculados todos en la misma pasada del análisis que el dashboard completo.
 
 # Directorio para almacenar los resultados (archivos HTML finales)
 OUTPUT_DIR="whatsapp_results2"
@@ -9,19 +22,68 @@ mkdir -p "$OUTPUT_DIR"
 
 # Variable para controlar si se pasa el argumento -i a graficas.py
 INTERACTIVE_MODE=""
+# Dirección del servidor de análisis (vacía = ejecutar los scripts directamente)
+SERVIDOR=""
+# Fusionar todos los archivos como exportaciones de un mismo chat
+FUSIONAR=""
+# Tamaño de la muestra para la vista previa aproximada (vacío = análisis completo)
+MUESTRA=""
+# Modo de los informes de progreso de los scripts de Python
+PROGRESO="texto"
+# Conservar el CSV preprocesado e indexarlo para búsquedas
+BUSCABLE=""
+# Periodo de los dashboards adicionales (vacío = solo el dashboard completo)
+POR_PERIODO=""
 
 # Procesar argumentos
-# Si el primer argumento es -i, lo guardamos y desplazamos los argumentos restantes
-if [ "$1" == "-i" ]; then
-    INTERACTIVE_MODE="-i"
-    shift # Elimina -i de la lista de argumentos, dejando solo los archivos de chat
-fi
+# Las opciones (-i, -s <servidor>, -m, -n <mensajes>, -p <modo>, -b, -a <periodo>) van antes de los archivos de chat
+while [ "$#" -gt 0 ]; do
+    case "$1" in
+        -i) INTERACTIVE_MODE="-i"; shift ;;
+        -s) SERVIDOR="$2"; shift 2 ;;
+        -m) FUSIONAR="1"; shift ;;
+        -n) MUESTRA="$2"; shift 2 ;;
+        -p) PROGRESO="$2"; shift 2 ;;
+        -b) BUSCABLE="1"; shift ;;
+        -a) POR_PERIODO="$2"; shift 2 ;;
+        *) break ;;
+    esac
+done
 
 # Verifica que se hayan proporcionado archivos de entrada
 if [ "$#" -eq 0 ]; then
-    echo "Uso: $0 [-i] <ruta_al_archivo_chat1.txt> [<ruta_al_archivo_chat2.txt> ...]"
+    echo "Uso: $0 [-i] [-s <servidor>] [-m] [-n <mensajes>] [-p texto|json|no] [-b] [-a año|trimestre] <ruta_al_archivo_chat1.(txt|zip|txt.gz|txt.zst)> [<ruta_al_archivo_chat2> ...]"
+    exit 1
+fi
+
+if [ -n "$FUSIONAR" ] && [ -n "$SERVIDOR" ]; then
+    echo "Error: -m no se puede combinar con -s (el servidor analiza un único archivo por trabajo)."
+    exit 1
+fi
+if [ -n "$MUESTRA" ] && { [ -n "$FUSIONAR" ] || [ -n "$SERVIDOR" ]; }; then
+    echo "Error: -n no se puede combinar con -m ni con -s."
     exit 1
 fi
+if [ -n "$BUSCABLE" ] && { [ -n "$MUESTRA" ] || [ -n "$SERVIDOR" ]; }; then
+    echo "Error: -b necesita el CSV preprocesado completo y no se puede combinar con -n ni con -s."
+    exit 1
+fi
+if [ -n "$POR_PERIODO" ] && { [ -n "$MUESTRA" ] || [ -n "$SERVIDOR" ]; }; then
+    echo "Error: -a necesita el chat completo y no se puede combinar con -n ni con -s."
+    exit 1
+fi
+
+# En modo fusión hay un único chat (el primer archivo) cuyas exportaciones son todos los argumentos
+if [ -n "$FUSIONAR" ]; then
+    for exportacion in "$@"; do
+        if [ ! -f "$exportacion" ]; then
+            echo "Error: El archivo '$exportacion' no existe."
+            exit 1
+        fi
+    done
+    EXPORTACIONES=("$@")
+    set -- "$1"
+fi
 
 # Itera sobre cada archivo de chat proporcionado como argumento
 for chat_file in "$@"; do
@@ -30,10 +92,18 @@ for chat_file in "$@"; do
         continue
     fi
 
+    entradas=("$chat_file")
+    if [ -n "$FUSIONAR" ]; then
+        entradas=("${EXPORTACIONES[@]}")
+    fi
+
     echo "⚙️ Procesando chat: $chat_file"
 
-    # Extrae el nombre base del archivo (sin extensión)
+    # Extrae el nombre base del archivo (sin extensión ni extensión de compresión)
     base_name=$(basename -- "$chat_file")
+    case "$base_name" in
+        *.gz|*.zst) base_name="${base_name%.*}" ;;
+    esac
     base_name="${base_name%.*}"
 
     # Define los nombres de los archivos intermedios y de salida
@@ -45,27 +115,84 @@ for chat_file in "$@"; do
     # --- NUEVOS ARCHIVOS INTERMEDIOS ---
     mensajes_por_dia_semana_csv="$OUTPUT_DIR/${base_name}_mensajes_por_dia_semana.csv"
     menciones_por_autor_csv="$OUTPUT_DIR/${base_name}_menciones_por_autor.csv"
+    mensajes_diario_csv="$OUTPUT_DIR/${base_name}_mensajes_por_dia.csv"
+    sesiones_csv="$OUTPUT_DIR/${base_name}_sesiones.csv"
+    dia_hora_csv="$OUTPUT_DIR/${base_name}_mensajes_por_dia_y_hora.csv"
+    emojis_csv="$OUTPUT_DIR/${base_name}_emojis.csv"
+    frases_csv="$OUTPUT_DIR/${base_name}_frases.csv"
+    copresencia_csv="$OUTPUT_DIR/${base_name}_copresencia.csv"
     # -----------------------------------
+    # Agregados fusionables (se conservan para poder combinar chats con fusionar_chats.py)
+    agregados_json="$OUTPUT_DIR/${base_name}_agregados.json"
     dashboard_html="$OUTPUT_DIR/${base_name}_dashboard.html"
 
-    # 1. Preprocesamiento
-    echo "  ➡️ Paso 1: Preprocesando '$chat_file' a '$preprocessed_csv'..."
-    python3 prepocessing.py "$chat_file" "$preprocessed_csv"
-    if [ $? -ne 0 ]; then
-        echo "❌ Error en el preprocesamiento de '$chat_file'. Saltando al siguiente archivo."
+    # Con servidor: un único envío, sin arrancar Python para cada paso ni CSV intermedios
+    if [ -n "$SERVIDOR" ]; then
+        echo "  ➡️ Enviando '$chat_file' al servidor de análisis ($SERVIDOR)..."
+        python3 servidor_analisis.py enviar "$chat_file" --servidor "$SERVIDOR" \
+            --salida "$dashboard_html" \
+            --stats "$OUTPUT_DIR/${base_name}_stats.json" \
+            --agregados "$agregados_json" \
+            $INTERACTIVE_MODE
+        if [ $? -ne 0 ]; then
+            echo "❌ Error en el servidor al procesar '$chat_file'. Saltando al siguiente archivo."
+            continue
+        fi
+        echo "----------------------------------------------------"
         continue
     fi
-    echo "  ✅ Preprocesamiento completado."
+
+    # Entrada y salidas opcionales del análisis (la vista previa no tiene conversaciones ni agregados)
+    entrada_analisis=("$preprocessed_csv")
+    salidas_completas=(--out_sesiones "$sesiones_csv" --out_copresencia "$copresencia_csv" --out_agregados "$agregados_json")
+    entradas_graficas=(--sesiones "$sesiones_csv" --copresencia "$copresencia_csv")
+    opciones_periodo=()
+    if [ -n "$POR_PERIODO" ]; then
+        opciones_periodo=(--por_periodo "$POR_PERIODO")
+    fi
+
+    if [ -n "$MUESTRA" ]; then
+        # Vista previa: sin paso 1, analisis.py muestrea el chat exportado en una sola lectura
+        echo "  🎲 Vista previa aproximada con una muestra de $MUESTRA mensajes (se omite el preprocesamiento completo)."
+        entrada_analisis=("$chat_file" --desde_chat --muestra "$MUESTRA" --muestra_por_mes)
+        salidas_completas=()
+        entradas_graficas=()
+        dashboard_html="$OUTPUT_DIR/${base_name}_preview.html"
+    else
+        # 1. Preprocesamiento
+        echo "  ➡️ Paso 1: Preprocesando '${entradas[*]}' a '$preprocessed_csv'..."
+        python3 prepocessing.py "${entradas[@]}" "$preprocessed_csv" --progreso "$PROGRESO"
+        if [ $? -ne 0 ]; then
+            echo "❌ Error en el preprocesamiento de '$chat_file'. Saltando al siguiente archivo."
+            continue
+        fi
+        echo "  ✅ Preprocesamiento completado."
+
+        if [ -n "$BUSCABLE" ]; then
+            echo "  ➡️ Indexando '$preprocessed_csv' para búsquedas..."
+            python3 indice_mensajes.py indexar "$preprocessed_csv" --progreso "$PROGRESO"
+            if [ $? -ne 0 ]; then
+                echo "⚠️ No se pudo crear el índice de búsqueda; se continúa con el análisis."
+            fi
+        fi
+    fi
 
     # 2. Analisis
-    echo "  ➡️ Paso 2: Analizando datos de '$preprocessed_csv'..."
-    python3 analisis.py "$preprocessed_csv" \
+    echo "  ➡️ Paso 2: Analizando datos de '${entrada_analisis[0]}'..."
+    python3 analisis.py "${entrada_analisis[@]}" \
         --out_usuarios "$stats_usuarios_csv" \
         --out_mensual "$mensajes_mensual_csv" \
         --out_horas "$mensajes_por_hora_csv" \
         --out_menciones_globales "$menciones_globales_csv" \
         --out_dia_semana "$mensajes_por_dia_semana_csv" \
-        --out_menciones_por_autor "$menciones_por_autor_csv"
+        --out_menciones_por_autor "$menciones_por_autor_csv" \
+        --out_diario "$mensajes_diario_csv" \
+        --out_dia_hora "$dia_hora_csv" \
+        --out_emojis "$emojis_csv" \
+        --out_frases "$frases_csv" \
+        "${salidas_completas[@]}" \
+        "${opciones_periodo[@]}" \
+        --progreso "$PROGRESO"
     if [ $? -ne 0 ]; then
         echo "❌ Error en el analisis de '$preprocessed_csv'. Saltando al siguiente archivo."
         continue
@@ -74,14 +201,22 @@ for chat_file in "$@"; do
 
     # 3. Generación de graficas
     echo "  ➡️ Paso 3: Generando dashboard en '$dashboard_html'..."
-    python3 graficas.py \
-        --usuarios "$stats_usuarios_csv" \
-        --mensual "$mensajes_mensual_csv" \
-        --horas "$mensajes_por_hora_csv" \
-        --menciones_globales "$menciones_globales_csv" \
-        --dia_semana "$mensajes_por_dia_semana_csv" \
-        --menciones_por_autor "$menciones_por_autor_csv" \
+    argumentos_graficas=(
+        --usuarios "$stats_usuarios_csv"
+        --mensual "$mensajes_mensual_csv"
+        --horas "$mensajes_por_hora_csv"
+        --menciones_globales "$menciones_globales_csv"
+        --dia_semana "$mensajes_por_dia_semana_csv"
+        --menciones_por_autor "$menciones_por_autor_csv"
+        --diario "$mensajes_diario_csv"
+        --dia_hora "$dia_hora_csv"
+        --emojis "$emojis_csv"
+        --frases "$frases_csv"
+        "${entradas_graficas[@]}"
+    )
+    python3 graficas.py "${argumentos_graficas[@]}" \
         --salida "$dashboard_html" \
+        --progreso "$PROGRESO" \
         $INTERACTIVE_MODE # Aquí se añade el argumento -i si se proporcionó al script
     if [ $? -ne 0 ]; then
         echo "❌ Error al generar el dashboard para '$base_name'. Saltando al siguiente archivo."
@@ -89,9 +224,48 @@ for chat_file in "$@"; do
     fi
     echo "  ✅ Dashboard generado."
 
+    # 3b. Un dashboard por periodo, con las salidas que analisis.py ha guardado con el periodo en el nombre
+    periodos=()
+    if [ -n "$POR_PERIODO" ]; then
+        for stats_periodo_csv in "${stats_usuarios_csv%.csv}"_*.csv; do
+            [ -f "$stats_periodo_csv" ] || continue
+            periodo="${stats_periodo_csv#"${stats_usuarios_csv%.csv}_"}"
+            periodos+=("${periodo%.csv}")
+        done
+    fi
+    for periodo in "${periodos[@]}"; do
+        argumentos_periodo=()
+        for argumento in "${argumentos_graficas[@]}"; do
+            case "$argumento" in
+                *.csv) argumentos_periodo+=("${argumento%.csv}_${periodo}.csv") ;;
+                *) argumentos_periodo+=("$argumento") ;;
+            esac
+        done
+        echo "  ➡️ Generando dashboard del periodo $periodo..."
+        python3 graficas.py "${argumentos_periodo[@]}" \
+            --salida "$OUTPUT_DIR/${base_name}_${periodo}_dashboard.html" \
+            --progreso "$PROGRESO" \
+            $INTERACTIVE_MODE
+        if [ $? -ne 0 ]; then
+            echo "⚠️ No se pudo generar el dashboard del periodo $periodo."
+        fi
+    done
+    if [ "${#periodos[@]}" -gt 0 ]; then
+        echo "  ✅ ${#periodos[@]} dashboards por periodo generados."
+    fi
+
     # 4. Limpieza: Eliminar archivos CSV intermedios
     echo "  🧹 Eliminando archivos intermedios..."
-    rm -f "$preprocessed_csv" "$stats_usuarios_csv" "$mensajes_mensual_csv" "$mensajes_por_hora_csv" "$menciones_globales_csv" "$mensajes_por_dia_semana_csv" "$menciones_por_autor_csv"
+    if [ -z "$BUSCABLE" ]; then
+        rm -f "$preprocessed_csv"
+    fi
+    intermedios=("$stats_usuarios_csv" "$mensajes_mensual_csv" "$mensajes_por_hora_csv" "$menciones_globales_csv" "$mensajes_por_dia_semana_csv" "$menciones_por_autor_csv" "$mensajes_diario_csv" "$sesiones_csv" "$dia_hora_csv" "$emojis_csv" "$frases_csv" "$copresencia_csv")
+    rm -f "${intermedios[@]}"
+    for periodo in "${periodos[@]}"; do
+        for intermedio in "${intermedios[@]}"; do
+            rm -f "${intermedio%.csv}_${periodo}.csv"
+        done
+    done
     echo "  ✅ Archivos intermedios eliminados."
     echo "----------------------------------------------------"
 done
@@ -0,0 +1,296 @@
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import http.client
+import socketserver
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from progreso import añadir_argumento_progreso
+
+# Este módulo se importa también como cliente (run_pipeline.sh), así que pandas, NLTK y Plotly
+# solo se cargan en el servidor (cargar_modulos), nunca al enviar un trabajo.
+
+HOST_POR_DEFECTO = "127.0.0.1"
+PUERTO_POR_DEFECTO = 8765
+MAX_COLA_POR_DEFECTO = 64 # Trabajos en espera admitidos además de los que se están ejecutando
+UMBRAL_SESION_POR_DEFECTO = 60 # Igual que analisis.UMBRAL_SESION_MINUTOS (el cliente no importa analisis)
+MODOS_PLOTLY_JS = ["incluido", "directorio"] # Igual que graficas.MODOS_PLOTLY_JS
+
+def cargar_modulos(modo_progreso="texto"):
+    """
+    Importa y calienta las librerías pesadas (pandas, NLTK + stopwords, Plotly) una sola vez.
+    Se ejecuta en el proceso principal antes de crear los workers y como inicializador de cada uno,
+    que escriben el progreso de sus trabajos en el stderr del servidor.
+
+    Las figuras del servidor no pasan por los validadores de Plotly (ver graficas.configurar_figuras):
+    son siempre las mismas gráficas, ya validadas por graficas.py, y validarlas es lo más lento
+    de un trabajo pequeño.
+    """
+    import pandas as pd
+    import analisis
+    import graficas
+    from progreso import configurar_progreso
+    configurar_progreso(modo_progreso)
+    graficas.configurar_figuras(validar=False)
+    # Se serializa una figura mínima para cargar ya el codificador JSON de Plotly
+    graficas.figura_diferida_html(graficas.grafica_pie_mensajes(pd.DataFrame({"nombre": ["a"], "num_mensajes": [1]})), 0)
+
+def procesar_trabajo(trabajo):
+    """
+    Ejecuta un trabajo completo (chat → dashboard y estadísticas) en memoria, sin CSV intermedios.
+
+    Args:
+        trabajo (dict): "chat" (ruta), y opcionalmente "salida", "stats", "agregados", "nicks",
+            "ignorar_menciones", "grupo_grande", "top_usuarios", "resolucion_diario", "umbral_sesion"
+            y "plotly_js" (por defecto "directorio": plotly.js se escribe una vez junto a los dashboards).
+
+    Returns:
+        dict: Estadísticas del chat (también se guardan en trabajo["stats"] si se indica).
+    """
+    import pandas as pd
+    import analisis
+    import graficas
+    from prepocessing import cargar_nickname_mapping
+
+    inicio = time.perf_counter()
+    chat = trabajo["chat"]
+    salida = trabajo.get("salida") or os.path.splitext(chat)[0] + "_dashboard.html"
+    ignorar_menciones = trabajo.get("ignorar_menciones", False)
+    nickname_mapping = cargar_nickname_mapping(trabajo.get("nicks") or "nickname_mapping.csv")
+
+    # Una sola lectura del chat: los mensajes (chats pequeños, el caso del servidor) se guardan en
+    # memoria para conocer todos los autores antes del análisis, y que las menciones sean exactas
+    mensajes = list(analisis.mensajes_desde_chat(chat, nickname_mapping))
+    resultados = analisis.analizar_flujo(
+        mensajes, {autor for _, autor, _ in mensajes},
+        diario_por_hora=(trabajo.get("resolucion_diario") == "hora"),
+        umbral_sesion_minutos=trabajo.get("umbral_sesion", analisis.UMBRAL_SESION_MINUTOS),
+        total_mensajes=len(mensajes)
+    )
+    stats_usuarios, analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario = resultados
+
+    menciones_globales = [{"usuario_mencionado": u, "conteo": c} for u, c in analisis_global["todas_las_menciones_globales"]]
+    datos = graficas.preparar_datos(
+        pd.DataFrame(stats_usuarios),
+        pd.DataFrame(stats_mes, columns=["año", "mes", "usuario", "num_mensajes"]),
+        pd.DataFrame(stats_horas, columns=["hora", "usuario", "num_mensajes"]),
+        pd.DataFrame() if ignorar_menciones else pd.DataFrame(menciones_globales),
+        pd.DataFrame(stats_dia_semana, columns=["dia_semana_num", "dia_semana", "usuario", "num_mensajes"]),
+        pd.DataFrame() if ignorar_menciones else analisis_global["df_menciones_por_autor"],
+    )
+    diario = graficas.preparar_actividad_diaria(pd.DataFrame(stats_diario)) if stats_diario else None
+    sesiones = pd.DataFrame(analisis.filas_sesiones(analisis_global["sesiones"]))
+    graficas.generar_dashboard(
+        *datos, salida, diario=diario, sesiones=sesiones, ignorar_menciones=ignorar_menciones,
+        grupo_grande=trabajo.get("grupo_grande", False),
+        top_usuarios=trabajo.get("top_usuarios", graficas.TOP_USUARIOS_GRUPO_GRANDE),
+        dia_hora=pd.DataFrame(analisis.filas_dia_y_hora(analisis_global["mensajes_por_dia_y_hora"])),
+        emojis=pd.DataFrame(analisis_global["emojis_globales"], columns=["emoji", "conteo"]),
+        frases=pd.DataFrame([{"frase": f, "conteo": c, "error_max": analisis_global["error_frases"]} for f, c in analisis_global["frases_globales"]],
+                            columns=["frase", "conteo", "error_max"]),
+        copresencia=pd.DataFrame(analisis_global["copresencia"], columns=["usuario_a", "usuario_b", "dias_juntos", "jaccard"]),
+        plotly_js=trabajo.get("plotly_js", "directorio")
+    )
+
+    if trabajo.get("agregados"):
+        agregados = analisis.construir_agregados(analisis_global, stats_mes, stats_horas, stats_dia_semana, stats_diario)
+        analisis.guardar_agregados(agregados, trabajo["agregados"])
+
+    stats = {
+        "chat": chat,
+        "dashboard": salida,
+        "num_mensajes": analisis_global["num_mensajes"],
+        "num_sesiones": analisis_global["sesiones"]["num_sesiones"],
+        "usuarios": stats_usuarios,
+        "menciones_globales": menciones_globales,
+        "segundos": round(time.perf_counter() - inicio, 4),
+    }
+    if trabajo.get("stats"):
+        with open(trabajo["stats"], "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False)
+    return stats
+
+
+# --- Servidor ---
+
+class ManejadorTrabajos(BaseHTTPRequestHandler):
+    """
+    POST /analizar con un trabajo en JSON → responde con las estadísticas en JSON.
+    GET /estado → workers y trabajos en curso.
+    """
+
+    def responder(self, codigo, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        if self.path != "/estado":
+            return self.responder(404, {"error": f"Ruta desconocida: {self.path}"})
+        self.responder(200, {"workers": self.server.workers, "en_curso": self.server.en_curso})
+
+    def do_POST(self):
+        if self.path != "/analizar":
+            return self.responder(404, {"error": f"Ruta desconocida: {self.path}"})
+        try:
+            trabajo = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            trabajo["chat"]
+        except (ValueError, KeyError, TypeError):
+            return self.responder(400, {"error": "Se esperaba un JSON con al menos la clave 'chat'"})
+
+        # Cola acotada: si ya hay demasiados trabajos pendientes se rechaza en vez de encolar sin límite
+        if not self.server.plazas.acquire(blocking=False):
+            return self.responder(503, {"error": "Cola de trabajos llena, inténtalo más tarde"})
+        self.server.en_curso += 1
+        try:
+            resultado = self.server.pool.submit(procesar_trabajo, trabajo).result()
+        except Exception as e:
+            return self.responder(500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            self.server.en_curso -= 1
+            self.server.plazas.release()
+        self.responder(200, resultado)
+
+    def address_string(self):
+        # En sockets Unix no hay dirección de cliente
+        return self.client_address[0] if self.client_address else "unix"
+
+class ServidorUnix(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def crear_servidor(socket_path, host, puerto):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        return ServidorUnix(socket_path, ManejadorTrabajos)
+    return ThreadingHTTPServer((host, puerto), ManejadorTrabajos)
+
+def servir(args):
+    print("⏳ Cargando librerías (pandas, NLTK, Plotly)...")
+    cargar_modulos(args.progreso)
+
+    # Con "fork" los workers heredan las librerías ya cargadas; en otros sistemas las carga el inicializador
+    metodos = multiprocessing.get_all_start_methods()
+    contexto = multiprocessing.get_context("fork" if "fork" in metodos else None)
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=contexto, initializer=cargar_modulos, initargs=(args.progreso,))
+    pool.submit(int).result() # Arranca los workers antes de atender peticiones
+
+    servidor = crear_servidor(args.socket, args.host, args.puerto)
+    servidor.pool = pool
+    servidor.workers = args.workers
+    servidor.en_curso = 0
+    servidor.plazas = threading.BoundedSemaphore(args.workers + args.max_cola)
+
+    # SIGTERM se trata como Ctrl+C para cerrar también los workers
+    def detener(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, detener)
+
+    direccion = args.socket or f"http://{args.host}:{args.puerto}"
+    print(f"🚀 Servidor de análisis escuchando en {direccion} con {args.workers} workers")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        pool.shutdown(cancel_futures=True)
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+# --- Cliente ---
+
+class ConexionUnix(http.client.HTTPConnection):
+    """Conexión HTTP sobre un socket Unix local."""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+def conectar(servidor):
+    """`servidor` es la ruta de un socket Unix (contiene "/"), "host:puerto" o solo el puerto."""
+    if "/" in servidor:
+        return ConexionUnix(servidor)
+    host, _, puerto = servidor.rpartition(":")
+    return http.client.HTTPConnection(host or HOST_POR_DEFECTO, int(puerto))
+
+def enviar_trabajo(trabajo, servidor=str(PUERTO_POR_DEFECTO)):
+    """Envía un trabajo al servidor y devuelve (código HTTP, respuesta JSON)."""
+    conexion = conectar(servidor)
+    try:
+        conexion.request("POST", "/analizar", body=json.dumps(trabajo).encode("utf-8"),
+                         headers={"Content-Type": "application/json"})
+        respuesta = conexion.getresponse()
+        return respuesta.status, json.loads(respuesta.read())
+    finally:
+        conexion.close()
+
+def enviar(args):
+    # El servidor puede tener otro directorio de trabajo: se envían rutas absolutas
+    ruta = lambda p: os.path.abspath(p) if p else None
+    trabajo = {
+        "chat": ruta(args.chat),
+        "salida": ruta(args.salida),
+        "stats": ruta(args.stats),
+        "agregados": ruta(args.agregados),
+        "nicks": ruta(args.nicks),
+        "ignorar_menciones": args.ignore_mentions,
+        "grupo_grande": args.grupo_grande,
+        "resolucion_diario": args.resolucion_diario,
+        "umbral_sesion": args.umbral_sesion,
+        "plotly_js": args.plotly_js,
+    }
+    codigo, respuesta = enviar_trabajo(trabajo, args.servidor)
+    if codigo != 200:
+        print(f"❌ Error del servidor ({codigo}): {respuesta.get('error')}", file=sys.stderr)
+        return 1
+    print(f"✅ {respuesta['num_mensajes']} mensajes analizados en {respuesta['segundos']} s. Dashboard: {respuesta['dashboard']}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local que mantiene cargadas las librerías del análisis de chats de WhatsApp.")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    p_servir = subparsers.add_parser("servir", help="Arranca el servidor de análisis.")
+    p_servir.add_argument("--host", default=HOST_POR_DEFECTO, help="Host de escucha (solo local por defecto).")
+    p_servir.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO, help="Puerto HTTP de escucha.")
+    p_servir.add_argument("--socket", default=None, help="Ruta de un socket Unix en lugar de HTTP en localhost.")
+    p_servir.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Número de procesos worker.")
+    p_servir.add_argument("--max_cola", type=int, default=MAX_COLA_POR_DEFECTO, help="Trabajos en espera admitidos antes de rechazar nuevos.")
+    añadir_argumento_progreso(p_servir)
+
+    p_enviar = subparsers.add_parser("enviar", help="Envía un chat al servidor y espera el resultado.")
+    p_enviar.add_argument("chat", help="Ruta al chat exportado (.txt, .zip, .txt.gz o .txt.zst)")
+    p_enviar.add_argument("--servidor", default=str(PUERTO_POR_DEFECTO), help="Socket Unix (ruta), host:puerto o puerto del servidor.")
+    p_enviar.add_argument("--salida", default=None, help="Ruta del dashboard HTML.")
+    p_enviar.add_argument("--stats", default=None, help="Ruta opcional donde guardar las estadísticas en JSON.")
+    p_enviar.add_argument("--agregados", default=None, help="Ruta opcional para los agregados fusionables (ver fusionar_chats.py).")
+    p_enviar.add_argument("--nicks", default="nickname_mapping.csv", help="Archivo CSV con apodos y nombres reales")
+    p_enviar.add_argument("-i", "--ignore-mentions", action="store_true", help="Ignora las estadísticas y gráficas de menciones.")
+    p_enviar.add_argument("--grupo_grande", action="store_true", help="Fuerza el modo grupo grande en las gráficas.")
+    p_enviar.add_argument("--resolucion_diario", choices=["dia", "hora"], default="dia", help="Resolución de la línea temporal detallada.")
+    p_enviar.add_argument("--umbral_sesion", type=int, default=UMBRAL_SESION_POR_DEFECTO, help="Minutos sin mensajes que separan dos conversaciones.")
+    p_enviar.add_argument("--plotly_js", choices=MODOS_PLOTLY_JS, default="directorio", help="plotly.js en un archivo junto al dashboard, escrito una sola vez por directorio (por defecto), o dentro del HTML.")
+
+    args = parser.parse_args()
+    if args.comando == "servir":
+        servir(args)
+    else:
+        sys.exit(enviar(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import csv
+import random
+import sys
+from datetime import datetime, timedelta
+
+import analisis
+from analisis import analizar_flujo
+from prepocessing import preprocesar_chat
+
+CHAT = """3/1/24, 10:00 - Ana: hola Luis, ¿vamos a la playa?
+3/1/24, 10:02 - Luis: vale playa playa 😂
+3/1/24, 10:05 - Carla: mira https://example.com
+3/1/24, 23:30 - Ana: <Multimedia omitido>
+4/1/24, 09:00 - Luis: buenos días Ana y Carla
+segunda línea
+5/2/24, 18:15 - Carla: ¿quién viene?
+"""
+
+
+def leer_csv(ruta):
+    with open(ruta, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_salidas_csv(tmp_path, monkeypatch):
+    """El análisis en streaming de un chat pequeño da los conteos contados a mano en cada CSV."""
+    (tmp_path / "chat.txt").write_text(CHAT, encoding="utf-8")
+    preprocesar_chat(str(tmp_path / "chat.txt"), str(tmp_path / "chat.csv"), {})
+    salidas = {nombre: str(tmp_path / f"{nombre}.csv") for nombre in
+               ("usuarios", "mensual", "horas", "menciones_globales", "dia_semana", "menciones_por_autor", "diario", "sesiones")}
+    argumentos = [f"--out_{nombre}={ruta}" for nombre, ruta in salidas.items()]
+    monkeypatch.setattr(sys, "argv", ["analisis.py", str(tmp_path / "chat.csv"), *argumentos, "--progreso=no"])
+    analisis.main()
+
+    usuarios = {fila["nombre"]: fila for fila in leer_csv(salidas["usuarios"])}
+    campos = ("num_mensajes", "num_palabras", "num_multimedia", "num_enlaces", "num_preguntas", "num_emojis",
+              "sesiones_iniciadas", "sesiones_cerradas", "dias_activos", "racha_max_dias")
+    assert {nombre: tuple(int(fila[campo]) for campo in campos) for nombre, fila in usuarios.items()} == {
+        "Ana": (2, 8, 1, 0, 1, 0, 2, 1, 1, 1),
+        "Luis": (2, 11, 0, 0, 0, 1, 1, 1, 2, 2),
+        "Carla": (2, 4, 0, 1, 1, 0, 1, 2, 2, 1),
+    }
+    assert usuarios["Luis"]["palabras_mas_usadas"].startswith("[('playa', 2)")
+
+    assert [(fila["año"], fila["mes"], fila["usuario"], fila["num_mensajes"]) for fila in leer_csv(salidas["mensual"])] == [
+        ("2024", "1", "Ana", "2"), ("2024", "1", "Carla", "1"), ("2024", "1", "Luis", "2"), ("2024", "2", "Carla", "1")]
+    horas = {(fila["hora"], fila["usuario"]): fila["num_mensajes"] for fila in leer_csv(salidas["horas"]) if fila["num_mensajes"] != "0"}
+    assert horas == {("9", "Luis"): "1", ("10", "Ana"): "1", ("10", "Carla"): "1", ("10", "Luis"): "1",
+                     ("18", "Carla"): "1", ("23", "Ana"): "1"}
+    dias_semana = {(fila["dia_semana"], fila["usuario"]): fila["num_mensajes"] for fila in leer_csv(salidas["dia_semana"]) if fila["num_mensajes"] != "0"}
+    assert dias_semana == {("Miércoles", "Ana"): "2", ("Miércoles", "Carla"): "1", ("Miércoles", "Luis"): "1",
+                           ("Jueves", "Luis"): "1", ("Lunes", "Carla"): "1"}
+    assert [tuple(fila.values()) for fila in leer_csv(salidas["diario"])] == [
+        ("2024-01-03", "Ana", "2"), ("2024-01-03", "Carla", "1"), ("2024-01-03", "Luis", "1"),
+        ("2024-01-04", "Luis", "1"), ("2024-02-05", "Carla", "1")]
+
+    menciones = {(fila["autor_mencionador"], fila["usuario_mencionado"]): fila["conteo"] for fila in leer_csv(salidas["menciones_por_autor"])}
+    assert menciones == {("Ana", "Luis"): "1", ("Luis", "Ana"): "1", ("Luis", "Carla"): "1"}
+    assert sorted(tuple(fila.values()) for fila in leer_csv(salidas["menciones_globales"])) == [("Ana", "1"), ("Carla", "1"), ("Luis", "1")]
+
+    sesiones = {(fila["metrica"], fila["valor"]): fila["num_sesiones"] for fila in leer_csv(salidas["sesiones"]) if fila["num_sesiones"] != "0"}
+    assert sesiones == {("duracion", "<1 min"): "3", ("duracion", "5-15 min"): "1",
+                        ("participantes", "1"): "3", ("participantes", "3"): "1",
+                        ("mensajes", "1"): "3", ("mensajes", "3"): "1"}
+
+
+def mensajes_aleatorios(num_mensajes, semilla=0):
+    rng = random.Random(semilla)
+    silabas = ["ba", "ca", "de", "fi", "go", "lu", "ma", "ne", "pi", "ro", "su", "ta", "vo", "za", "xe", "yu"]
+    vocabulario = [silabas[i % 16] + silabas[i // 16 % 16] + silabas[i // 256] + "s" for i in range(800)]
+    fecha = datetime(2024, 1, 1)
+    for _ in range(num_mensajes):
+        fecha += timedelta(minutes=rng.randint(1, 300))
+        palabras = rng.choices(vocabulario, weights=[1 / (i + 1) for i in range(len(vocabulario))], k=rng.randint(1, 12))
+        yield fecha, rng.choice(["Ana", "Luis", "Carla", "Pepe"]), " ".join(palabras)
+
+
+def test_matriz_volcada_igual_que_en_memoria(monkeypatch):
+    """Con --max_memoria los conteos se vuelcan a disco y los tops de palabras no cambian."""
+    volcadas = []
+    finalizar_matriz_volcada = analisis.finalizar_matriz_volcada
+    monkeypatch.setattr(analisis, "finalizar_matriz_volcada",
+                        lambda matriz, *args: volcadas.append(len(matriz["volcados"])) or finalizar_matriz_volcada(matriz, *args))
+    usuarios = {"Ana", "Luis", "Carla", "Pepe"}
+
+    en_memoria, *_ = analizar_flujo(mensajes_aleatorios(3000), usuarios)
+    assert volcadas == []
+    volcado, *_ = analizar_flujo(mensajes_aleatorios(3000), usuarios, max_memoria=64 * 400)
+    assert volcadas and volcadas[0] > 1
+
+    for campo in ("num_palabras", "palabras_mas_usadas", "palabras_caracteristicas"):
+        assert {fila["nombre"]: fila[campo] for fila in volcado} == {fila["nombre"]: fila[campo] for fila in en_memoria}
+
+
+def test_preprocesado_en_paralelo_igual_que_en_serie(tmp_path):
+    """Trocear el .txt entre varios procesos da exactamente el mismo CSV que leerlo en serie."""
+    rng = random.Random(1)
+    lineas = []
+    fecha = datetime(2023, 12, 30, 22, 0)
+    for i in range(600):
+        fecha += timedelta(minutes=rng.randint(0, 90))
+        lineas.append(f"{fecha.day}/{fecha.month}/{fecha.year % 100}, {fecha:%H:%M} - {rng.choice(['Ana', 'Luis', 'Carla'])}: mensaje {i} ñandú 😂\n")
+        if rng.random() < 0.2:
+            lineas.append("línea de continuación, con coma y \"comillas\"\n")
+    (tmp_path / "chat.txt").write_text("".join(lineas), encoding="utf-8")
+
+    preprocesar_chat(str(tmp_path / "chat.txt"), str(tmp_path / "serie.csv"), {})
+    preprocesar_chat(str(tmp_path / "chat.txt"), str(tmp_path / "paralelo.csv"), {}, workers=3)
+    serie = (tmp_path / "serie.csv").read_bytes()
+    assert serie.count(b"\n") > 600
+    assert (tmp_path / "paralelo.csv").read_bytes() == serie
@@ -0,0 +1,20 @@
+from datetime import date, timedelta
+
+from analisis import nuevos_dias_activos, marcar_dia_activo, resultados_dias_activos
+
+
+def test_rachas_de_distinta_longitud():
+    """La racha de cada usuario no depende de que otro usuario tenga una racha más larga."""
+    dias = nuevos_dias_activos()
+    inicio = date(2024, 1, 1)
+    activos = {
+        "Ana": [0],
+        "Luis": [0, 1, 2, 3, 4, 10, 11],
+        "Carla": [0, 40, 41, 42, 100],
+    }
+    for nombre, desplazamientos in activos.items():
+        for desplazamiento in desplazamientos:
+            marcar_dia_activo(dias, nombre, inicio + timedelta(desplazamiento))
+
+    por_usuario, _ = resultados_dias_activos(dias, activos)
+    assert por_usuario == {"Ana": (1, 1), "Luis": (7, 5), "Carla": (5, 3)}
@@ -0,0 +1,20 @@
+from analisis import nuevo_sketch_frases, añadir_frases, volcar_lote_frases, resultados_frases
+
+
+def test_lote_posterior_con_menos_usuarios():
+    """Un lote solo con el primer autor no debe fallar por las candidatas de autores de lotes anteriores."""
+    frases = nuevo_sketch_frases(2**16)
+    vocabulario = {}
+    for i in range(300):
+        añadir_frases(frases, vocabulario, i % 6, ["fin", "de", "curso", f"palabra{i % 40}", "playa"])
+    volcar_lote_frases(frases)
+    assert max(frases["candidatas"]) == 6
+
+    for i in range(300):
+        añadir_frases(frases, vocabulario, 0, ["fin", "de", "curso", f"otra{i % 40}"])
+    volcar_lote_frases(frases)
+
+    terminos = sorted(vocabulario, key=vocabulario.get)
+    por_usuario, globales, _ = resultados_frases(frases, terminos, [f"u{i}" for i in range(6)])
+    assert dict(por_usuario["u0"])["fin de curso"] >= 350
+    assert dict(globales)["fin de curso"] >= 600
@@ -0,0 +1,41 @@
+from prepocessing import fusionar_exportaciones, iterar_mensajes_chat
+
+CHAT = [
+    "3/1/24, 10:00 - Ana: hola\n",
+    "3/1/24, 10:00 - Luis: ok\n",
+    "3/1/24, 10:00 - Luis: ok\n",
+    "3/1/24, 10:01 - Ana: lista de la compra\n",
+    "pan\n",
+    "leche\n",
+    "3/1/24, 10:01 - Luis: vale\n",
+    "3/1/24, 10:02 - Ana: hasta luego\n",
+]
+
+
+def fusionar(tmp_path, *trozos):
+    rutas = []
+    for i, lineas in enumerate(trozos):
+        ruta = tmp_path / f"chat{i}.txt"
+        ruta.write_text("".join(lineas), encoding="utf-8")
+        rutas.append(str(ruta))
+    return [list(mensaje) for mensaje in fusionar_exportaciones(rutas, {})]
+
+
+def test_exportaciones_solapadas(tmp_path):
+    """Dos exportaciones solapadas reconstruyen el chat, también si una empieza a mitad de minuto."""
+    (tmp_path / "completo.txt").write_text("".join(CHAT), encoding="utf-8")
+    completo = [list(mensaje) for mensaje in iterar_mensajes_chat(str(tmp_path / "completo.txt"), {})]
+    assert len(completo) == 6
+
+    assert fusionar(tmp_path, CHAT[:7], CHAT[2:]) == completo
+    assert fusionar(tmp_path, CHAT[2:], CHAT[:7]) == completo
+
+
+def test_mensaje_cortado_en_el_limite(tmp_path):
+    """El último mensaje de una exportación, cortado antes de sus líneas de continuación, es un duplicado."""
+    (tmp_path / "completo.txt").write_text("".join(CHAT), encoding="utf-8")
+    completo = [list(mensaje) for mensaje in iterar_mensajes_chat(str(tmp_path / "completo.txt"), {})]
+
+    assert fusionar(tmp_path, CHAT[:4], CHAT[3:]) == completo
+    assert fusionar(tmp_path, CHAT[:5], CHAT[1:]) == completo
+    assert fusionar(tmp_path, CHAT[3:], CHAT[:4]) == completo
@@ -0,0 +1,47 @@
+from collections import Counter
+
+import pytest
+
+from analisis import intervalo_confianza_cuota
+from prepocessing import muestrear_reservorio
+
+
+def test_estratos_proporcionales():
+    """Cada mes recibe su cuota proporcional (por restos mayores) y la muestra conserva el orden original."""
+    elementos = [(mes, i) for mes, tamaño in ((1, 500), (2, 300), (3, 200)) for i in range(tamaño)]
+    muestra, conteos = muestrear_reservorio(elementos, 100, clave_estrato=lambda elemento: elemento[0], semilla=7)
+    assert conteos == Counter({1: 500, 2: 300, 3: 200})
+    assert Counter(mes for mes, _ in muestra) == Counter({1: 50, 2: 30, 3: 20})
+    assert muestra == sorted(muestra)
+    assert muestrear_reservorio(elementos, 100, clave_estrato=lambda elemento: elemento[0], semilla=7)[0] == muestra
+
+    elementos = [(mes, i) for mes, tamaño in ((1, 333), (2, 333), (3, 334)) for i in range(tamaño)]
+    muestra, _ = muestrear_reservorio(elementos, 10, clave_estrato=lambda elemento: elemento[0], semilla=7)
+    assert Counter(mes for mes, _ in muestra) == Counter({1: 3, 2: 3, 3: 4})
+
+
+def test_muestra_mayor_que_el_chat():
+    muestra, conteos = muestrear_reservorio(range(40), 100, semilla=1)
+    assert muestra == list(range(40))
+    assert conteos == Counter({None: 40})
+
+
+def test_intervalo_wilson_con_correccion_de_poblacion_finita():
+    # Sin corrección apreciable (población enorme) es el intervalo de Wilson de 30/100
+    assert intervalo_confianza_cuota(30, 100, 10**9) == pytest.approx((0.2189, 0.3959), abs=1e-4)
+    # Con media población muestreada el intervalo se estrecha, y se anula con la población entera
+    inferior, superior = intervalo_confianza_cuota(30, 100, 200)
+    assert (inferior, superior) == pytest.approx((0.2406, 0.3670), abs=1e-4)
+    assert intervalo_confianza_cuota(30, 100, 100) == (0.3, 0.3)
+    assert intervalo_confianza_cuota(0, 0, 100) == (0.0, 0.0)
+
+
+def test_cobertura_del_intervalo():
+    """Con muestras sin reemplazo de una población finita, el intervalo al 95 % contiene la cuota real ~95 % de las veces."""
+    poblacion = ["Ana"] * 300 + ["Luis"] * 700
+    aciertos = 0
+    for semilla in range(400):
+        muestra, _ = muestrear_reservorio(poblacion, 200, semilla=semilla)
+        inferior, superior = intervalo_confianza_cuota(muestra.count("Ana"), len(muestra), len(poblacion))
+        aciertos += inferior <= 0.3 <= superior
+    assert 0.92 <= aciertos / 400 <= 0.98